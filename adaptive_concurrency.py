@@ -0,0 +1,108 @@
+"""
+同時アップロード数の自動調整モジュール（AIMD）
+Evernoteの応答時間とエラーから、同時に実行するアップロード数を調整する
+
+- 加算増加: 枠を使い切っている間に応答が目標時間内に返れば、1往復ごとに上限を1増やす
+- 乗算減少: タイムアウト・レート制限（RATE_LIMIT_REACHED）・目標時間超過で上限を半分にする
+
+適切な同時数は時間帯やアカウントの種別で変わるため、固定値の代わりにこの上限を使う。
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDLimiter:
+    """応答時間とエラーに応じて同時実行数の上限を加算増加・乗算減少する"""
+
+    def __init__(
+        self,
+        initial: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        latency_target: float = 5.0,
+        decrease_ratio: float = 0.5
+    ):
+        """
+        Args:
+            initial: 最初の上限
+            min_limit: 上限の最小値
+            max_limit: 上限の最大値
+            latency_target: これ以内に応答すれば正常とみなす秒数
+            decrease_ratio: 減少時に上限に掛ける比率
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.decrease_ratio = decrease_ratio
+        self._window = float(min(max(initial, self.min_limit), self.max_limit))
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """現在の上限"""
+        return int(self._window)
+
+    def set_bounds(self, min_limit: int, max_limit: int) -> int:
+        """
+        上限の範囲を変更（設定の再読み込み用）
+
+        Returns:
+            範囲に収めた現在の上限
+        """
+        with self._lock:
+            self.min_limit = max(1, min_limit)
+            self.max_limit = max(self.min_limit, max_limit)
+            self._window = min(max(self._window, self.min_limit), float(self.max_limit))
+            return int(self._window)
+
+    def on_success(self, latency: float, saturated: bool) -> int:
+        """
+        アップロードが成功した
+
+        Args:
+            latency: 所要時間（秒）
+            saturated: 枠を使い切っていた場合True（空きがあるなら上限を増やしても意味がない）
+
+        Returns:
+            新しい上限
+        """
+        if latency > self.latency_target:
+            return self.on_congestion(f"応答 {latency:.1f}秒")
+        with self._lock:
+            before = int(self._window)
+            if saturated:
+                # 1往復（上限と同数の成功）で1増える
+                self._window = min(float(self.max_limit), self._window + 1.0 / self._window)
+            after = int(self._window)
+        if after != before:
+            logger.info(f"📈 同時アップロード数: {before} → {after}")
+        return after
+
+    def on_congestion(self, reason: str) -> int:
+        """
+        タイムアウト・レート制限・応答の遅延が起きた
+
+        同時に実行中だった複数のアップロードが続けて失敗しても、同じ混雑で
+        何度も減らさないよう、減少は目標時間あたり1回までにする。
+
+        Args:
+            reason: ログに出す理由
+
+        Returns:
+            新しい上限
+        """
+        now = time.monotonic()
+        with self._lock:
+            before = int(self._window)
+            if now - self._last_decrease < self.latency_target:
+                return before
+            self._last_decrease = now
+            self._window = max(float(self.min_limit), self._window * self.decrease_ratio)
+            after = int(self._window)
+        if after != before:
+            logger.warning(f"📉 同時アップロード数: {before} → {after}（{reason}）")
+        return after
@@ -0,0 +1,253 @@
+"""
+非同期サーバーモジュール
+Flask開発サーバー（接続ごとにスレッド）の代わりに、asyncio（ASGI）で
+/api/health、/api/save、/api/status、/api/backfill、/api/search、/api/dead-letters を提供する
+
+接続の待ち受けはイベントループ1本で行い、Evernote APIを含む保存処理だけを
+固定数のスレッドプールで実行する。処理待ちが上限を超えた場合は
+503（Retry-After付き）を返して拡張機能側に再試行を促す。
+"""
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError:
+    UVICORN_AVAILABLE = False
+    uvicorn = None
+
+logger = logging.getLogger(__name__)
+
+# 受け付けるリクエスト本文の上限（バイト）
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+_CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, Content-Encoding'),
+    (b'access-control-expose-headers', b'X-Trace-Id, X-Queue-Depth, Retry-After'),
+]
+
+
+class AsyncSaveServer:
+    """保存処理をスレッドプールに委譲するASGIアプリケーション"""
+
+    def __init__(
+        self,
+        save_handler: Callable[[bytes, Optional[str]], Tuple[Dict, int]],
+        health_handler: Callable[[], Dict],
+        status_handler: Optional[Callable[[bytes, Optional[str]], Tuple[Dict, int]]] = None,
+        backfill_handler: Optional[Callable[[bytes, Optional[str]], Tuple[Dict, int]]] = None,
+        search_handler: Optional[Callable[[str, Optional[str]], Tuple[Dict, int]]] = None,
+        dead_letter_handler: Optional[Callable[[Optional[str]], Tuple[Dict, int]]] = None,
+        max_workers: int = 4,
+        max_backlog: int = 64,
+        on_startup: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            save_handler: 保存処理（リクエスト本文, Content-Encoding → レスポンス本文, ステータス）
+            health_handler: ヘルスチェック応答
+            status_handler: 会話状態の照会（リクエスト本文, Content-Encoding → レスポンス本文, ステータス）
+            backfill_handler: バックフィルの会話1件の取り込み（同上）
+            search_handler: 全文検索（検索語, 最大件数 → レスポンス本文, ステータス）
+            dead_letter_handler: 再試行を打ち切った保存の一覧（最大件数 → レスポンス本文, ステータス）
+            max_workers: Evernote I/O用スレッド数
+            max_backlog: 実行中＋待機中の保存処理の上限（超えると503）
+            on_startup: 起動完了時に呼ぶ処理（起動時間の記録など）
+        """
+        self.save_handler = save_handler
+        self.health_handler = health_handler
+        self.status_handler = status_handler
+        self.backfill_handler = backfill_handler
+        self.search_handler = search_handler
+        self.dead_letter_handler = dead_letter_handler
+        self.max_workers = max_workers
+        self.max_backlog = max_backlog
+        self.on_startup = on_startup
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='evernote-io'
+        )
+        # イベントループ上でのみ増減するためロック不要
+        self.backlog = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        method = scope['method']
+        path = scope['path']
+
+        if method == 'OPTIONS':
+            await self._send(send, 204, None)
+        elif path == '/api/health' and method == 'GET':
+            await self._send(send, 200, self.health_handler())
+        elif path == '/api/save' and method == 'POST':
+            await self._handle_save(scope, receive, send, self.save_handler)
+        elif path == '/api/backfill' and method == 'POST' and self.backfill_handler:
+            await self._handle_save(scope, receive, send, self.backfill_handler)
+        elif path == '/api/status' and method == 'POST' and self.status_handler:
+            await self._handle_status(scope, receive, send)
+        elif path == '/api/search' and method == 'GET' and self.search_handler:
+            await self._handle_search(scope, send)
+        elif path == '/api/dead-letters' and method == 'GET' and self.dead_letter_handler:
+            await self._handle_dead_letters(scope, send)
+        else:
+            await self._send(send, 404, {'success': False, 'error': 'Not Found'})
+
+    async def _handle_save(self, scope, receive, send, handler) -> None:
+        """Evernoteに書き込むリクエストを処理（上限超過時は即座に503）"""
+        if self.backlog >= self.max_backlog:
+            logger.warning(f"⏳ 保存処理の待ちが上限に達しました: {self.backlog}件")
+            await self._send(send, 503, {
+                'success': False,
+                'error': 'サーバーが混雑しています。しばらくしてから再試行してください'
+            }, extra_headers=[(b'retry-after', b'5')])
+            return
+
+        self.backlog += 1
+        try:
+            body = await self._read_body(receive)
+            if body is None:
+                await self._send(send, 413, {
+                    'success': False,
+                    'error': 'リクエストが大きすぎます'
+                })
+                return
+
+            loop = asyncio.get_running_loop()
+            result, status = await loop.run_in_executor(
+                self.executor, handler, body, self._content_encoding(scope)
+            )
+            headers = []
+            if result.get('trace_id'):
+                headers.append((b'x-trace-id', result['trace_id'].encode('ascii')))
+            if result.get('retry_after') is not None:
+                headers.append((b'retry-after', str(result['retry_after']).encode('ascii')))
+            await self._send(send, status, result, extra_headers=headers)
+        finally:
+            self.backlog -= 1
+
+    async def _handle_status(self, scope, receive, send) -> None:
+        """会話状態の照会を処理（軽量なため待ち上限の対象外）"""
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send(send, 413, {'success': False, 'error': 'リクエストが大きすぎます'})
+            return
+        loop = asyncio.get_running_loop()
+        result, status = await loop.run_in_executor(
+            self.executor, self.status_handler, body, self._content_encoding(scope)
+        )
+        await self._send(send, status, result)
+
+    async def _handle_search(self, scope, send) -> None:
+        """全文検索を処理（軽量なため待ち上限の対象外）"""
+        query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+        loop = asyncio.get_running_loop()
+        result, status = await loop.run_in_executor(
+            self.executor,
+            self.search_handler,
+            query.get('q', [''])[0],
+            query.get('limit', [None])[0]
+        )
+        await self._send(send, status, result)
+
+    async def _handle_dead_letters(self, scope, send) -> None:
+        """デッドレターの一覧を返す（軽量なため待ち上限の対象外）"""
+        query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+        loop = asyncio.get_running_loop()
+        result, status = await loop.run_in_executor(
+            self.executor, self.dead_letter_handler, query.get('limit', [None])[0]
+        )
+        await self._send(send, status, result)
+
+    @staticmethod
+    def _content_encoding(scope) -> Optional[str]:
+        """リクエストのContent-Encodingヘッダーを取得"""
+        for name, value in scope.get('headers', []):
+            if name == b'content-encoding':
+                return value.decode('latin-1')
+        return None
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        """リクエスト本文を読み込む（上限超過時はNone）"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    async def _send(
+        self,
+        send,
+        status: int,
+        payload: Optional[Dict],
+        extra_headers: Optional[List[Tuple[bytes, bytes]]] = None
+    ) -> None:
+        """JSONレスポンスを送信"""
+        body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = list(_CORS_HEADERS)
+        headers.append((b'x-queue-depth', str(self.backlog).encode('ascii')))
+        if payload is not None:
+            headers.append((b'content-type', b'application/json; charset=utf-8'))
+        headers.extend(extra_headers or [])
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send) -> None:
+        """起動・終了イベントを処理（終了時にスレッドプールを停止）"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup:
+                    self.on_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def serve(
+    app: AsyncSaveServer,
+    host: str = '0.0.0.0',
+    port: int = 8765
+) -> None:
+    """
+    uvicornで非同期サーバーを起動（終了までブロック）
+
+    Args:
+        app: ASGIアプリケーション
+        host: 待ち受けアドレス
+        port: 待ち受けポート
+    """
+    if not UVICORN_AVAILABLE:
+        raise ImportError(
+            "uvicorn がインストールされていません。\n"
+            "pip install uvicorn を実行してください。"
+        )
+    logger.info(
+        f"⚡ 非同期モードで起動: Evernote I/Oスレッド {app.max_workers}本、"
+        f"待ち上限 {app.max_backlog}件"
+    )
+    server = uvicorn.Server(uvicorn.Config(
+        app, host=host, port=port, log_level='warning', lifespan='on'
+    ))
+    server.run()
@@ -0,0 +1,281 @@
+"""
+添付ファイルモジュール
+エクスポートに含まれる画像・ファイルをEvernoteのリソースとして扱うための
+コンテンツアドレス型キャッシュと、会話メッセージへの紐付けを行う
+
+キャッシュはMD5（Evernoteの en-media / Resource.data.bodyHash と同じ）を
+キーにファイルを1つだけ保持する。元ファイルのパス・サイズ・更新日時から
+ハッシュへの対応も記録するため、同じエクスポートを再取り込みしても
+ハッシュ計算はやり直さない。
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from conversation_model import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+# この大きさ以上のファイルはmmapでハッシュ計算する（バイト）
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+# 通常読み込み時のチャンクサイズ（バイト）
+_READ_CHUNK = 1024 * 1024
+
+# エクスポート内のファイル名（file-XXXX-元の名前.png / file_XXXX-uuid.png）からファイルIDを取り出す
+_FILE_ID_RE = re.compile(r'^(file[-_][A-Za-z0-9]+)')
+
+# asset_pointer（file-service://file-XXXX / sediment://file_XXXX）からファイルIDを取り出す
+_ASSET_POINTER_RE = re.compile(r'^[a-z-]+://(file[-_][A-Za-z0-9]+)')
+
+
+def file_id_from_asset_pointer(asset_pointer: str) -> Optional[str]:
+    """
+    画像パートの asset_pointer からファイルIDを取得
+
+    Args:
+        asset_pointer: 例 'file-service://file-AbC123'
+
+    Returns:
+        ファイルID（形式が異なる場合はNone）
+    """
+    match = _ASSET_POINTER_RE.match(asset_pointer or '')
+    return match.group(1) if match else None
+
+
+def hash_file(path: str, mmap_threshold: int = MMAP_THRESHOLD) -> str:
+    """
+    ファイルのMD5を計算（大きなファイルはmmapでページキャッシュから直接読む）
+
+    Args:
+        path: ファイルパス
+        mmap_threshold: mmapを使うファイルサイズの下限
+
+    Returns:
+        MD5の16進文字列
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                md5.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(_READ_CHUNK), b''):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+
+class ResourceCache:
+    """MD5をキーにした添付ファイルのキャッシュ"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_workers: int = 4,
+        mmap_threshold: int = MMAP_THRESHOLD
+    ):
+        """
+        Args:
+            cache_dir: キャッシュディレクトリ
+            max_workers: ハッシュ計算に使うスレッド数
+            mmap_threshold: mmapでハッシュ計算するファイルサイズの下限
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.mmap_threshold = mmap_threshold
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # 元ファイル（パス|サイズ|更新日時）→ MD5
+        self._index: Dict[str, str] = self._load_index()
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> Dict[str, str]:
+        """ハッシュ済みファイルの対応表を読み込む"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self) -> None:
+        """ハッシュ済みファイルの対応表を書き出す（一時ファイル経由で置き換え）"""
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.error(f"リソースキャッシュの索引保存エラー: {e}")
+
+    def blob_path(self, md5: str) -> str:
+        """MD5に対応するキャッシュ上のパス"""
+        return os.path.join(self.cache_dir, md5[:2], md5)
+
+    def read(self, md5: str) -> bytes:
+        """キャッシュからファイル内容を読み込む"""
+        with open(self.blob_path(md5), 'rb') as f:
+            return f.read()
+
+    def add_files(self, paths: Iterable[str]) -> Dict[str, Dict]:
+        """
+        ファイルをキャッシュに登録（未ハッシュのものだけスレッドプールで計算）
+
+        Args:
+            paths: 元ファイルのパス
+
+        Returns:
+            元ファイルのパス → {'md5', 'size', 'path'}（読み込めなかったファイルは含まない）
+        """
+        results: Dict[str, Dict] = {}
+        to_hash: Dict[str, str] = {}
+
+        for path in set(paths):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"添付ファイルを読み込めません: {path}: {e}")
+                continue
+            key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+            with self._lock:
+                md5 = self._index.get(key)
+            if md5 and os.path.exists(self.blob_path(md5)):
+                results[path] = {'md5': md5, 'size': stat.st_size, 'path': self.blob_path(md5)}
+            else:
+                to_hash[path] = key
+
+        if not to_hash:
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='resource-hash') as executor:
+            hashed = executor.map(self._store, to_hash)
+            for path, entry in zip(to_hash, hashed):
+                if entry is None:
+                    continue
+                results[path] = entry
+                with self._lock:
+                    self._index[to_hash[path]] = entry['md5']
+
+        with self._lock:
+            self._save_index()
+        return results
+
+    def _store(self, path: str) -> Optional[Dict]:
+        """ハッシュを計算し、同じ内容がキャッシュになければ複製する"""
+        try:
+            md5 = hash_file(path, self.mmap_threshold)
+            blob = self.blob_path(md5)
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                tmp_blob = f"{blob}.{threading.get_ident()}.tmp"
+                shutil.copyfile(path, tmp_blob)
+                os.replace(tmp_blob, blob)
+            return {'md5': md5, 'size': os.path.getsize(blob), 'path': blob}
+        except OSError as e:
+            logger.warning(f"添付ファイルのキャッシュに失敗しました: {path}: {e}")
+            return None
+
+
+class AttachmentResolver:
+    """エクスポート展開先のファイルを会話メッセージの添付に紐付ける"""
+
+    def __init__(self, cache: ResourceCache):
+        """
+        Args:
+            cache: 添付ファイルのキャッシュ
+        """
+        self.cache = cache
+
+    @staticmethod
+    def index_export_files(extract_dir: str) -> Dict[str, str]:
+        """
+        展開先のファイルをファイルIDで索引付け
+
+        Args:
+            extract_dir: エクスポートZIPの展開先
+
+        Returns:
+            ファイルID → ファイルパス
+        """
+        files: Dict[str, str] = {}
+        for root, _dirs, names in os.walk(extract_dir):
+            for name in names:
+                match = _FILE_ID_RE.match(name)
+                if match:
+                    files.setdefault(match.group(1), os.path.join(root, name))
+        return files
+
+    def resolve(self, conversation: Conversation, export_files: Dict[str, str]) -> int:
+        """
+        会話の添付をキャッシュに登録し、各添付に md5 / mime / size / path を設定
+        （エクスポートに含まれていない添付は取り除く）
+
+        Args:
+            conversation: 解析済みの会話（メッセージの attachments を書き換える）
+            export_files: index_export_files の戻り値
+
+        Returns:
+            紐付けた添付の数
+        """
+        messages = conversation.messages
+        paths: List[str] = [
+            export_files[attachment['file_id']]
+            for message in messages
+            for attachment in message.attachments
+            if attachment['file_id'] in export_files
+        ]
+        if not paths:
+            for message in messages:
+                message.attachments = ()
+            return 0
+
+        cached = self.cache.add_files(paths)
+        resolved = 0
+        for message in messages:
+            attachments = []
+            for attachment in message.attachments:
+                path = export_files.get(attachment['file_id'])
+                entry = cached.get(path) if path else None
+                if entry is None:
+                    continue
+                # 名前がなければエクスポート上のファイル名からファイルIDを除いて使う
+                filename = attachment.get('name') or os.path.basename(path)[
+                    len(attachment['file_id']):].lstrip('-_') or os.path.basename(path)
+                mime = (attachment.get('mime')
+                        or mimetypes.guess_type(filename)[0]
+                        or 'application/octet-stream')
+                attachments.append(dict(attachment, name=filename, mime=mime, **entry))
+            message.attachments = tuple(attachments)
+            resolved += len(attachments)
+        return resolved
+
+
+def collect_attachments(messages: List[Message]) -> List[Dict]:
+    """
+    メッセージから紐付け済みの添付を重複なく取り出す（MD5単位、出現順）
+
+    Args:
+        messages: メッセージのリスト
+
+    Returns:
+        添付のリスト
+    """
+    seen = set()
+    attachments = []
+    for message in messages:
+        for attachment in message.attachments:
+            md5 = attachment.get('md5')
+            if md5 and md5 not in seen:
+                seen.add(md5)
+                attachments.append(attachment)
+    return attachments
@@ -0,0 +1,171 @@
+"""
+バックフィル用フィクスチャサーバー
+記録済みの conversations.json を ChatGPT の backend-api と同じ形で配信し、
+拡張機能のバックフィル（content_script.js の runBackfill）をローカルで検証する
+
+使い方:
+    python backfill_fixture.py [conversations.json] [--port 8766] [--rate-limit-every N]
+
+拡張機能の Service Worker のコンソールで
+    chrome.storage.local.set({ backfillBaseUrl: 'http://localhost:8766' })
+を実行すると、バックフィルはこのサーバーから会話一覧と会話を取得する
+（ChatGPTのタブからポップアップの「過去の会話を取り込む」で開始）。
+公式エクスポートの conversations.json をそのまま指定すれば、
+実データ相当の件数（1万件規模）でのページング・再開・ペース調整も確認できる。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# リポジトリ同梱の記録済みフィクスチャ
+DEFAULT_FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'backfill', 'conversations.json'
+)
+
+
+class FixtureBackend:
+    """記録済みの会話を backend-api の一覧・詳細の形式で返す"""
+
+    def __init__(self, conversations: List[Dict], rate_limit_every: int = 0):
+        """
+        Args:
+            conversations: conversations.json の内容
+            rate_limit_every: N回ごとに429を返す（0で無効、ペース調整の検証用）
+        """
+        # backend-api と同じく更新日時の新しい順
+        self.conversations = sorted(
+            conversations, key=lambda c: c.get('update_time') or 0, reverse=True
+        )
+        self.by_id = {
+            c.get('conversation_id') or c.get('id'): c for c in self.conversations
+        }
+        self.rate_limit_every = rate_limit_every
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def should_rate_limit(self) -> bool:
+        """今回のリクエストを429にするかどうか"""
+        if self.rate_limit_every <= 0:
+            return False
+        with self._lock:
+            self._requests += 1
+            return self._requests % self.rate_limit_every == 0
+
+    def list_page(self, offset: int, limit: int) -> Dict:
+        """会話一覧の1ページ"""
+        page = self.conversations[offset:offset + limit]
+        return {
+            'items': [
+                {
+                    'id': c.get('conversation_id') or c.get('id'),
+                    'title': c.get('title'),
+                    'create_time': c.get('create_time'),
+                    'update_time': c.get('update_time'),
+                }
+                for c in page
+            ],
+            'total': len(self.conversations),
+            'limit': limit,
+            'offset': offset,
+        }
+
+    def conversation(self, conversation_id: str):
+        """会話の詳細（conversation_id を付与、見つからなければNone）"""
+        conv = self.by_id.get(conversation_id)
+        if conv is None:
+            return None
+        return dict(conv, conversation_id=conversation_id)
+
+
+def make_handler(backend: FixtureBackend):
+    """FixtureBackend を配信するリクエストハンドラクラスを作成"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_OPTIONS(self):
+            self._send(204, None)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if backend.should_rate_limit():
+                self._send(429, {'detail': 'rate limited (fixture)'}, retry_after=2)
+            elif url.path == '/api/auth/session':
+                self._send(200, {'accessToken': 'fixture-token'})
+            elif url.path == '/backend-api/conversations':
+                query = parse_qs(url.query)
+                offset = int(query.get('offset', ['0'])[0])
+                limit = int(query.get('limit', ['28'])[0])
+                self._send(200, backend.list_page(offset, limit))
+            elif url.path.startswith('/backend-api/conversation/'):
+                conv = backend.conversation(url.path.rsplit('/', 1)[-1])
+                if conv is None:
+                    self._send(404, {'detail': 'not found'})
+                else:
+                    self._send(200, conv)
+            else:
+                self._send(404, {'detail': 'not found'})
+
+        def _send(self, status: int, payload, retry_after: int = None):
+            body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            # content script（ChatGPTページのオリジン）からの取得を許可
+            self.send_header('Access-Control-Allow-Origin', self.headers.get('Origin') or '*')
+            self.send_header('Access-Control-Allow-Credentials', 'true')
+            self.send_header('Access-Control-Allow-Headers', 'Authorization, Content-Type')
+            self.send_header('Access-Control-Allow-Private-Network', 'true')
+            self.send_header('Access-Control-Expose-Headers', 'Retry-After')
+            if retry_after is not None:
+                self.send_header('Retry-After', str(retry_after))
+            if payload is not None:
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.info(format % args)
+
+    return Handler
+
+
+def main(argv=None) -> int:
+    """コマンドラインエントリポイント"""
+    arg_parser = argparse.ArgumentParser(
+        description='記録済みの会話を backend-api 形式で配信するバックフィル検証用サーバー'
+    )
+    arg_parser.add_argument('fixture', nargs='?', default=DEFAULT_FIXTURE,
+                            help='conversations.json（省略時は同梱のフィクスチャ）')
+    arg_parser.add_argument('--port', type=int, default=8766, help='待ち受けポート')
+    arg_parser.add_argument('--rate-limit-every', type=int, default=0,
+                            help='N回ごとに429を返す（ペース調整の検証用）')
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)
+
+    backend = FixtureBackend(conversations, rate_limit_every=args.rate_limit_every)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(backend))
+    print(f"📼 フィクスチャ配信中: {len(conversations)}件 http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,503 @@
+"""
+ChatGPTエクスポート一括インポートツール
+エクスポートZIPを解析してEvernoteにまとめて保存する
+
+使い方:
+    python bulk_import.py [ZIPファイル] [--queue-size N] [--no-attachments] [--profile]
+
+解析 → 添付 → レンダリング → アップロード の各ステージを上限付きキューで
+つないだパイプラインで処理する。添付ステージはエクスポート内の画像・ファイルを
+リソースキャッシュに登録し、ノートのリソースとして添付する。取り込み済みの会話はデータベースに
+チェックポイントとして記録されるため、異常終了やレート制限で
+中断しても、再実行すれば続きから再開できる。
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, List, Optional
+
+import profiling
+from attachments import AttachmentResolver, ResourceCache, collect_attachments
+from chatgpt_export import ChatGPTExportParser
+from config import Config
+from conversation_model import Conversation
+from duplicate_manager import DuplicateManager
+from enml_renderer import format_conversation_to_enml
+from evernote_sync import EvernoteSync, EvernoteWriteError, NoteNotFoundError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# ステージ終了を示す番兵
+_DONE = object()
+
+# 元の会話URL（拡張機能側のconversationIdと同じIDを使う）
+CONVERSATION_URL = 'https://chatgpt.com/c/{}'
+
+
+class ProgressReporter:
+    """スループットと残り時間（ETA）を1行で表示する進捗表示"""
+
+    def __init__(self, stream=sys.stderr, interval: float = 0.5):
+        """
+        Args:
+            stream: 出力先ストリーム
+            interval: 表示更新の最小間隔（秒）
+        """
+        self.stream = stream
+        self.interval = interval
+        self.total: Optional[int] = None
+        self.done = 0
+        self.skipped = 0
+        self._started = time.monotonic()
+        self._last_render = 0.0
+
+    def update(self, force: bool = False) -> None:
+        """進捗行を再描画"""
+        now = time.monotonic()
+        if not force and now - self._last_render < self.interval:
+            return
+        self._last_render = now
+
+        elapsed = max(now - self._started, 1e-6)
+        rate = self.done / elapsed
+        if self.total is None:
+            line = f"解析中... {self.done}件完了"
+        else:
+            remaining = max(self.total - self.skipped - self.done, 0)
+            eta = self._format_seconds(remaining / rate) if rate > 0 else '--:--:--'
+            line = (
+                f"[{self.done + self.skipped}/{self.total}] "
+                f"{rate:.2f}件/秒 残り{remaining}件 ETA {eta}"
+                f" (スキップ {self.skipped}件)"
+            )
+        self.stream.write(f"\r{line}\033[K")
+        self.stream.flush()
+
+    def close(self) -> None:
+        """最終状態を表示して改行"""
+        self.update(force=True)
+        self.stream.write('\n')
+        self.stream.flush()
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        seconds = int(seconds)
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class BulkImporter:
+    """エクスポートZIPをEvernoteへ一括インポートするパイプライン"""
+
+    def __init__(
+        self,
+        parser: ChatGPTExportParser,
+        evernote: EvernoteSync,
+        duplicate_manager: DuplicateManager,
+        queue_size: int = 32,
+        tags: Optional[List[str]] = None,
+        progress: Optional[ProgressReporter] = None,
+        resource_cache: Optional[ResourceCache] = None,
+        upload_slot: Optional[Callable[[], ContextManager]] = None
+    ):
+        """
+        Args:
+            parser: エクスポート解析器
+            evernote: Evernote同期クライアント
+            duplicate_manager: 重複管理（ノートGUIDとチェックポイントを保持）
+            queue_size: ステージ間キューの上限
+            tags: 作成するノートに付けるタグ
+            progress: 進捗表示（Noneの場合は表示しない）
+            resource_cache: 添付ファイルのキャッシュ（Noneの場合は添付を取り込まない）
+            upload_slot: ノートの作成・更新の間だけ入るコンテキストを返す関数
+                （サーバーのバックフィルでは bulk レーンの枠、Noneの場合は制限しない）
+        """
+        self.parser = parser
+        self.evernote = evernote
+        self.duplicate_manager = duplicate_manager
+        self.queue_size = queue_size
+        self.tags = tags or ['ChatGPT', 'エクスポート']
+        self.progress = progress
+        self.resolver = AttachmentResolver(resource_cache) if resource_cache else None
+        self.upload_slot = upload_slot or nullcontext
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def run(self, zip_path: str) -> Dict[str, object]:
+        """
+        エクスポートファイルをインポート
+
+        Args:
+            zip_path: エクスポートZIPファイルのパス
+
+        Returns:
+            結果の集計（created, updated, unchanged, skipped, failed, rate_limit_duration）
+        """
+        self._stop.clear()
+        self._errors = []
+        parsed_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        rendered_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stats = {
+            'total': 0,
+            'created': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'skipped': 0,
+            'failed': 0,
+            'rate_limit_duration': None,
+        }
+
+        stages = [
+            threading.Thread(
+                target=self._guard, args=(self._parse_stage, zip_path, parsed_q, stats),
+                name='import-parse', daemon=True
+            ),
+        ]
+        render_q = parsed_q
+        if self.resolver:
+            render_q = queue.Queue(maxsize=self.queue_size)
+            stages.append(threading.Thread(
+                target=self._guard, args=(self._attach_stage, zip_path, parsed_q, render_q),
+                name='import-attach', daemon=True
+            ))
+        stages.append(threading.Thread(
+            target=self._guard, args=(self._render_stage, render_q, rendered_q),
+            name='import-render', daemon=True
+        ))
+        for stage in stages:
+            stage.start()
+
+        try:
+            self._upload_stage(rendered_q, stats)
+        finally:
+            self._stop.set()
+            for stage in stages:
+                stage.join(timeout=5)
+            # 終了時にバックグラウンドの書き込みを待たずに検索索引へ反映
+            self.duplicate_manager.flush_search_index()
+            if self.progress:
+                self.progress.close()
+
+        if self._errors:
+            raise self._errors[0]
+        return stats
+
+    def _guard(self, stage, *args) -> None:
+        """ステージ内の例外を記録してパイプライン全体を停止"""
+        try:
+            stage(*args)
+        except BaseException as e:
+            logger.error(f"インポートステージエラー ({threading.current_thread().name}): {e}",
+                         exc_info=True)
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """停止要求を監視しながらキューに投入（停止時はFalse）"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """停止要求を監視しながらキューから取得（停止時は番兵）"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    @profiling.profiled('import_parse')
+    def _parse_stage(self, zip_path: str, out_q: queue.Queue, stats: Dict) -> None:
+        """
+        解析ステージ: 会話を1件ずつ取り出し、取り込み済みのものを除外して次段へ
+
+        conversations.json を先頭から順に読むため、全件数は読み終えるまで分からない
+        （それまでの進捗表示は完了件数のみ）。
+        """
+        progress_map = self.duplicate_manager.get_import_progress()
+
+        for conversation in self.parser.iter_export_file(zip_path):
+            stats['total'] += 1
+            conversation_id = conversation.id
+            if (conversation_id in progress_map
+                    and progress_map[conversation_id] == conversation.update_time):
+                stats['skipped'] += 1
+                if self.progress:
+                    self.progress.skipped += 1
+                continue
+            if not self._put(out_q, conversation):
+                return
+        if self.progress:
+            self.progress.total = stats['total']
+        self._put(out_q, _DONE)
+
+    def _attach_stage(self, zip_path: str, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        """添付ステージ: 画像・ファイルをリソースキャッシュに登録して会話に紐付け"""
+        export_files = None
+        while True:
+            conversation = self._get(in_q)
+            if conversation is _DONE:
+                self._put(out_q, _DONE)
+                return
+
+            if export_files is None:
+                # 解析ステージがZIPを展開し終えてから最初の会話が届く
+                export_files = self.resolver.index_export_files(
+                    self.parser.extract_dir_for(zip_path)
+                )
+            self.resolver.resolve(conversation, export_files)
+            if not self._put(out_q, conversation):
+                return
+
+    def _render_stage(self, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        """レンダリングステージ: 会話をENMLに変換"""
+        while True:
+            conversation = self._get(in_q)
+            if conversation is _DONE:
+                self._put(out_q, _DONE)
+                return
+
+            digest = self.duplicate_manager.compute_content_digest(conversation.messages)
+            content = format_conversation_to_enml(
+                conversation.title,
+                conversation.messages,
+                CONVERSATION_URL.format(conversation.id)
+            )
+            if not self._put(out_q, (conversation, content, digest)):
+                return
+
+    def _upload_stage(self, in_q: queue.Queue, stats: Dict) -> None:
+        """アップロードステージ: Evernoteに作成/更新してチェックポイントを記録"""
+        while True:
+            item = self._get(in_q)
+            if item is _DONE:
+                return
+            conversation, content, digest = item
+
+            try:
+                action = self.upload_conversation(conversation, content, digest)
+            except RateLimitError as e:
+                # ここまでの進捗は記録済みなので、再実行で続きから再開できる
+                logger.warning(f"レート制限のためインポートを中断します: {e}")
+                stats['rate_limit_duration'] = e.duration
+                return
+            stats[action] += 1
+
+            if self.progress:
+                self.progress.done += 1
+                self.progress.update()
+
+    def import_conversation(self, conversation: Conversation, source: str = 'export') -> str:
+        """
+        解析済みの会話を1件インポート（パイプラインを使わない単発処理用）
+
+        Args:
+            conversation: ChatGPTExportParser._parse_conversation の戻り値
+            source: 取り込み経路
+
+        Returns:
+            'created' / 'updated' / 'unchanged' / 'skipped' / 'failed'
+
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+        """
+        if self.duplicate_manager.is_imported(conversation.id, conversation.update_time):
+            return 'skipped'
+
+        digest = self.duplicate_manager.compute_content_digest(conversation.messages)
+        content = format_conversation_to_enml(
+            conversation.title,
+            conversation.messages,
+            CONVERSATION_URL.format(conversation.id)
+        )
+        return self.upload_conversation(conversation, content, digest, source=source)
+
+    def upload_conversation(
+        self,
+        conversation: Conversation,
+        content: str,
+        digest: str,
+        source: str = 'export'
+    ) -> str:
+        """
+        レンダリング済みの会話をEvernoteに作成/更新してチェックポイントを記録
+
+        Args:
+            conversation: 解析済みの会話
+            content: ENML本文
+            digest: 本文ダイジェスト
+            source: 取り込み経路
+
+        Returns:
+            'created' / 'updated' / 'unchanged' / 'failed'
+
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+        """
+        conversation_id = conversation.id
+        canonical_id = self.duplicate_manager.canonical_conversation_id(conversation_id)
+        title = conversation.title or 'Untitled'
+
+        # 添付がない場合はNone（更新時に既存のリソースを消さない）
+        attachments = collect_attachments(conversation.messages) or None
+
+        # 拡張機能経由で保存済みの会話も同じインデックスで解決する
+        existing = self.duplicate_manager.lookup_conversation(canonical_id)
+        if existing and existing['content_digest'] == digest:
+            note_guid = existing['note_guid']
+            action = 'unchanged'
+        else:
+            try:
+                # 同時アップロード数の枠はEvernoteへの書き込みの間だけ使う
+                with self.upload_slot():
+                    action = None
+                    if existing:
+                        try:
+                            self.evernote.update_note(
+                                note_guid=existing['note_guid'],
+                                title=title,
+                                content=content,
+                                attachments=attachments,
+                                conversation_id=canonical_id,
+                                content_digest=digest
+                            )
+                            note_guid = existing['note_guid']
+                            action = 'updated'
+                        except NoteNotFoundError:
+                            # Evernote上で削除されたノート: 対応を外して新しいノートを作成
+                            self.duplicate_manager.unlink_note(existing['note_guid'])
+                    if action is None:
+                        note_guid = self.evernote.create_note(
+                            title=title,
+                            content=content,
+                            tags=self.tags,
+                            attachments=attachments,
+                            conversation_id=canonical_id,
+                            content_digest=digest
+                        )
+                        action = 'created'
+            except EvernoteWriteError as e:
+                # チェックポイントを記録しないため、再実行で再び取り込まれる
+                logger.error(f"インポート失敗: {title} ({conversation_id}): {e}")
+                return 'failed'
+
+        if action != 'unchanged':
+            self.duplicate_manager.record_conversation(
+                canonical_id, note_guid, digest, source=source,
+                note_content_hash=self.evernote.content_hash(content)
+            )
+        self.duplicate_manager.mark_imported(
+            conversation_id, conversation.update_time, note_guid
+        )
+        self.duplicate_manager.index_conversation(
+            canonical_id, note_guid, title, conversation.messages
+        )
+        return action
+
+
+def default_db_path() -> str:
+    """サーバーと共有する重複管理データベースのパス"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sync_history.db')
+
+
+def default_cache_dir() -> str:
+    """添付ファイルのリソースキャッシュのパス"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource_cache')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    コマンドラインエントリポイント
+
+    Returns:
+        終了コード（0: 完了、1: エラー、2: レート制限で中断）
+    """
+    default_export_dir = os.path.join(str(Path.home() / "Downloads"), "ChatGPT_Exports")
+
+    arg_parser = argparse.ArgumentParser(
+        description='ChatGPTエクスポートZIPをEvernoteに一括インポート'
+    )
+    arg_parser.add_argument('zip_path', nargs='?',
+                            help='エクスポートZIP（省略時はエクスポートディレクトリの最新ファイル）')
+    arg_parser.add_argument('--export-dir', default=default_export_dir,
+                            help='エクスポートファイルを配置するディレクトリ')
+    arg_parser.add_argument('--db', default=default_db_path(),
+                            help='重複管理データベースのパス（サーバーと共有）')
+    arg_parser.add_argument('--queue-size', type=int, default=32,
+                            help='ステージ間キューの上限')
+    arg_parser.add_argument('--cache-dir', default=default_cache_dir(),
+                            help='添付ファイルのリソースキャッシュ')
+    arg_parser.add_argument('--no-attachments', action='store_true',
+                            help='画像・ファイルを添付しない')
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='今回の実行をプロファイリングする')
+    args = arg_parser.parse_args(argv)
+
+    # 進捗表示を崩さないよう、コンソールには警告以上のみ出す
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.profile:
+        profiling.configure(enabled=True)
+
+    parser = ChatGPTExportParser(args.export_dir)
+    zip_path = args.zip_path
+    if not zip_path:
+        export_files = parser.find_export_files()
+        if not export_files:
+            print(f"エクスポートファイルが見つかりません: {args.export_dir}")
+            return 1
+        zip_path = export_files[0]
+
+    print(f"📦 インポート開始: {zip_path}")
+
+    try:
+        config = Config()
+        evernote = EvernoteSync.from_config(config)
+        duplicate_manager = DuplicateManager(db_path=args.db)
+
+        importer = BulkImporter(
+            parser,
+            evernote,
+            duplicate_manager,
+            queue_size=args.queue_size,
+            progress=ProgressReporter(),
+            resource_cache=None if args.no_attachments else ResourceCache(args.cache_dir)
+        )
+        stats = importer.run(zip_path)
+    except KeyboardInterrupt:
+        print("\n⏸️ 中断しました。再実行すると続きから再開します")
+        return 1
+    except Exception as e:
+        logger.error(f"インポートエラー: {e}", exc_info=True)
+        print(f"❌ インポートエラー: {e}")
+        return 1
+
+    print(
+        f"✅ 作成 {stats['created']}件 / 更新 {stats['updated']}件 / "
+        f"変更なし {stats['unchanged']}件 / スキップ {stats['skipped']}件 / "
+        f"失敗 {stats['failed']}件"
+    )
+    if stats['rate_limit_duration'] is not None:
+        print(
+            f"⏳ レート制限で中断しました。{stats['rate_limit_duration']}秒後に"
+            f"再実行すると続きから再開します"
+        )
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
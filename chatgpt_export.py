@@ -9,15 +9,97 @@ ChatGPT公式エクスポート監視モジュール
 4. このスクリプトが自動的に解析してEvernoteに同期
 """
 import os
+import sys
 import json
+import time
 import zipfile
 import logging
-from typing import List, Dict, Optional
+from typing import Any, IO, Iterator, List, Dict, Optional
 from datetime import datetime
 from pathlib import Path
 
+import profiling
+from attachments import file_id_from_asset_pointer
+from conversation_model import Conversation, Message
+
 logger = logging.getLogger(__name__)
 
+# conversations.json を読み込む単位（要素がこれより大きければ読み込み量を倍にする）
+_JSON_CHUNK_SIZE = 1 << 20
+
+
+def _iter_json_array(f: IO[str], chunk_size: int = _JSON_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    JSON配列の要素を先頭から1件ずつ読み込む（ファイル全体をメモリに載せない）
+    
+    Args:
+        f: テキストモードで開いたファイル
+        chunk_size: 一度に読み込む文字数
+    
+    Yields:
+        配列の要素
+    
+    Raises:
+        ValueError: 配列でない、またはJSONとして不正な場合
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    while not buf:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buf = chunk.lstrip()
+    if not buf.startswith('['):
+        raise ValueError("JSONの最上位が配列ではありません")
+    pos = 1
+    eof = False
+    expect_value = True
+    
+    while True:
+        # 区切り（空白・カンマ）を読み飛ばす
+        while pos < len(buf) and (buf[pos].isspace() or (buf[pos] == ',' and not expect_value)):
+            if buf[pos] == ',':
+                expect_value = True
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        if pos < len(buf) and not expect_value:
+            raise ValueError("JSON配列の要素の間にカンマがありません")
+        if pos < len(buf):
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                value, end = None, None
+            # 末尾で途切れた数値等（「-95」「00.5」と分かれた -9500.5 等）を誤って読まないよう、
+            # 要素の後に区切り（カンマ・閉じ括弧）が読み込めるまでは確定しない
+            if end is not None and not eof:
+                following = end
+                while following < len(buf) and buf[following].isspace():
+                    following += 1
+                if following == len(buf) or (
+                    buf[following] not in ',]'
+                    and buf.find(',', following) < 0 and buf.find(']', following) < 0
+                ):
+                    end = None
+            if end is not None:
+                yield value
+                pos = end
+                expect_value = False
+                continue
+        elif eof:
+            raise ValueError("JSON配列が途中で終わっています")
+        
+        # 要素の途中でバッファが尽きた: 読み込み済みの要素を捨てて続きを読む
+        buf = buf[pos:]
+        pos = 0
+        chunk = f.read(max(chunk_size, len(buf)))
+        if chunk:
+            buf += chunk
+        else:
+            eof = True
+
 
 class ChatGPTExportParser:
     """ChatGPT公式エクスポートファイル解析クラス"""
@@ -38,16 +120,32 @@ class ChatGPTExportParser:
         Returns:
             ZIPファイルのパスリスト
         """
-        zip_files = []
-        for file in os.listdir(self.export_dir):
-            if file.endswith('.zip') and 'chatgpt' in file.lower():
-                full_path = os.path.join(self.export_dir, file)
-                zip_files.append(full_path)
+        # scandirのDirEntryはstat結果をキャッシュするため、ソート時の再statが不要
+        entries = []
+        with os.scandir(self.export_dir) as it:
+            for entry in it:
+                if entry.is_file() and self.is_export_file(entry.name):
+                    entries.append((entry.stat().st_mtime, entry.path))
         
-        zip_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+        entries.sort(reverse=True)
+        zip_files = [path for _, path in entries]
         logger.info(f"検出されたエクスポートファイル: {len(zip_files)}個")
         return zip_files
     
+    @staticmethod
+    def is_export_file(filename: str) -> bool:
+        """
+        ファイル名がChatGPTエクスポートZIPかどうか判定
+        
+        Args:
+            filename: ファイル名（パス可）
+        
+        Returns:
+            エクスポートZIPの場合True
+        """
+        name = os.path.basename(filename)
+        return name.endswith('.zip') and 'chatgpt' in name.lower()
+    
     def extract_zip(self, zip_path: str, extract_dir: Optional[str] = None) -> str:
         """
         ZIPファイルを展開
@@ -60,19 +158,23 @@ class ChatGPTExportParser:
             展開先ディレクトリパス
         """
         if extract_dir is None:
-            zip_name = os.path.basename(zip_path).replace('.zip', '')
-            extract_dir = os.path.join(self.export_dir, f"extracted_{zip_name}")
+            extract_dir = self.extract_dir_for(zip_path)
         
         os.makedirs(extract_dir, exist_ok=True)
         
         logger.info(f"ZIPファイルを展開中: {zip_path}")
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(extract_dir)
+            # 更新日時をZIP内の値に揃える（再展開しても添付のハッシュキャッシュが効くように）
+            for info in zip_ref.infolist():
+                if not info.is_dir():
+                    stamp = time.mktime(info.date_time + (0, 0, -1))
+                    os.utime(os.path.join(extract_dir, info.filename), (stamp, stamp))
         
         logger.info(f"展開完了: {extract_dir}")
         return extract_dir
     
-    def parse_conversations_json(self, json_path: str) -> List[Dict]:
+    def parse_conversations_json(self, json_path: str) -> List[Conversation]:
         """
         conversations.jsonを解析
         
@@ -82,22 +184,8 @@ class ChatGPTExportParser:
         Returns:
             会話データのリスト
         """
-        logger.info(f"会話データを解析中: {json_path}")
-        
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            conversations = []
-            
-            # ChatGPTエクスポート形式の解析
-            # 形式例: [{"id": "...", "title": "...", "create_time": ..., "mapping": {...}}]
-            if isinstance(data, list):
-                for conv in data:
-                    parsed = self._parse_conversation(conv)
-                    if parsed:
-                        conversations.append(parsed)
-            
+            conversations = list(self.iter_conversations_json(json_path))
             logger.info(f"解析完了: {len(conversations)}件の会話")
             return conversations
         
@@ -105,7 +193,32 @@ class ChatGPTExportParser:
             logger.error(f"JSON解析エラー: {e}")
             return []
     
-    def _parse_conversation(self, conv_data: Dict) -> Optional[Dict]:
+    def iter_conversations_json(self, json_path: str) -> Iterator[Conversation]:
+        """
+        conversations.jsonを先頭から1件ずつ解析（全件をメモリに載せない）
+        
+        Args:
+            json_path: JSONファイルのパス
+        
+        Yields:
+            会話データ
+        
+        Raises:
+            ValueError: JSONとして不正な場合
+        """
+        logger.info(f"会話データを解析中: {json_path}")
+        
+        # ChatGPTエクスポート形式の解析
+        # 形式例: [{"id": "...", "title": "...", "create_time": ..., "mapping": {...}}]
+        with open(json_path, 'r', encoding='utf-8') as f:
+            for conv in _iter_json_array(f):
+                if not isinstance(conv, dict):
+                    continue
+                parsed = self._parse_conversation(conv)
+                if parsed:
+                    yield parsed
+    
+    def _parse_conversation(self, conv_data: Dict) -> Optional[Conversation]:
         """
         個別の会話データを解析
         
@@ -131,36 +244,81 @@ class ChatGPTExportParser:
                     author_role = message.get('author', {}).get('role')
                     content = message.get('content', {})
                     
-                    # テキストコンテンツを抽出
+                    # テキストコンテンツと画像・ファイルの参照を抽出
+                    attachments = self._extract_attachments(message)
                     if isinstance(content, dict):
                         parts = content.get('parts', [])
-                        text = '\n'.join(str(part) for part in parts if part)
+                        text = '\n'.join(str(part) for part in parts
+                                         if part and not isinstance(part, dict))
                     else:
                         text = str(content)
                     
-                    if text:
-                        messages.append({
-                            'role': author_role,
-                            'content': text,
-                            'create_time': message.get('create_time')
-                        })
+                    if text or attachments:
+                        messages.append(Message(
+                            author_role,
+                            text,
+                            message.get('create_time'),
+                            attachments or ()
+                        ))
             
             # メッセージを時系列でソート
-            messages.sort(key=lambda x: x.get('create_time', 0))
+            messages.sort(key=lambda m: m.create_time or 0)
             
-            return {
-                'id': conversation_id,
-                'title': title,
-                'messages': messages,
-                'create_time': create_time,
-                'update_time': update_time
-            }
+            return Conversation(conversation_id, title, messages, create_time, update_time)
         
         except Exception as e:
             logger.error(f"会話解析エラー: {e}")
             return None
     
-    def process_export_file(self, zip_path: str) -> List[Dict]:
+    @staticmethod
+    def _extract_attachments(message: Dict) -> List[Dict]:
+        """
+        メッセージが参照する画像・ファイルを抽出
+        
+        Args:
+            message: mapping内のメッセージ
+        
+        Returns:
+            添付のリスト（file_id, name, mime）
+        """
+        attachments = {}
+        
+        # 画像パート（{"content_type": "image_asset_pointer", "asset_pointer": "file-service://..."}）
+        content = message.get('content')
+        if isinstance(content, dict):
+            for part in content.get('parts') or []:
+                if isinstance(part, dict):
+                    file_id = file_id_from_asset_pointer(part.get('asset_pointer', ''))
+                    if file_id:
+                        attachments[file_id] = {'file_id': file_id, 'name': None, 'mime': None}
+        
+        # アップロードされたファイル（metadata.attachments）
+        for item in (message.get('metadata') or {}).get('attachments') or []:
+            file_id = item.get('id')
+            if file_id:
+                attachments[file_id] = {
+                    'file_id': file_id,
+                    'name': item.get('name'),
+                    'mime': item.get('mimeType') or item.get('mime_type')
+                }
+        
+        return list(attachments.values())
+    
+    def extract_dir_for(self, zip_path: str) -> str:
+        """
+        ZIPファイルの既定の展開先
+        
+        Args:
+            zip_path: ZIPファイルのパス
+        
+        Returns:
+            展開先ディレクトリ
+        """
+        zip_name = os.path.basename(zip_path).replace('.zip', '')
+        return os.path.join(self.export_dir, f"extracted_{zip_name}")
+    
+    @profiling.profiled('process_export_file')
+    def process_export_file(self, zip_path: str) -> List[Conversation]:
         """
         エクスポートファイルを処理
         
@@ -170,6 +328,32 @@ class ChatGPTExportParser:
         Returns:
             全会話データ
         """
+        conversations_file = self._extract_conversations_file(zip_path)
+        if not conversations_file:
+            return []
+        
+        # 会話データを解析
+        return self.parse_conversations_json(conversations_file)
+    
+    def iter_export_file(self, zip_path: str) -> Iterator[Conversation]:
+        """
+        エクスポートファイルを展開し、会話を1件ずつ解析
+        
+        Args:
+            zip_path: ZIPファイルのパス
+        
+        Yields:
+            会話データ（最初の会話はZIPの展開が終わってから返す）
+        
+        Raises:
+            ValueError: conversations.jsonがJSONとして不正な場合
+        """
+        conversations_file = self._extract_conversations_file(zip_path)
+        if conversations_file:
+            yield from self.iter_conversations_json(conversations_file)
+    
+    def _extract_conversations_file(self, zip_path: str) -> Optional[str]:
+        """ZIPを展開して conversations.json のパスを返す（見つからない場合はNone）"""
         # ZIPを展開
         extract_dir = self.extract_zip(zip_path)
         
@@ -185,12 +369,9 @@ class ChatGPTExportParser:
         
         if not conversations_file:
             logger.error("conversations.jsonが見つかりません")
-            return []
-        
-        # 会話データを解析
-        return self.parse_conversations_json(conversations_file)
+        return conversations_file
     
-    def format_for_evernote(self, conversation: Dict) -> Dict:
+    def format_for_evernote(self, conversation: Conversation) -> Dict:
         """
         会話データをEvernote用に整形
         
@@ -200,15 +381,14 @@ class ChatGPTExportParser:
         Returns:
             Evernote用の整形データ
         """
-        title = conversation['title']
-        create_time = datetime.fromtimestamp(conversation['create_time']) if conversation['create_time'] else None
+        title = conversation.title
+        create_time = datetime.fromtimestamp(conversation.create_time) if conversation.create_time else None
         
         # メッセージを整形
         content_parts = []
-        for msg in conversation['messages']:
-            role = msg['role']
-            role_label = "👤 User" if role == "user" else "🤖 Assistant"
-            content_parts.append(f"**{role_label}:**\n{msg['content']}\n")
+        for msg in conversation.messages:
+            role_label = "👤 User" if msg.role == "user" else "🤖 Assistant"
+            content_parts.append(f"**{role_label}:**\n{msg.content}\n")
         
         content = '\n---\n\n'.join(content_parts)
         
@@ -216,7 +396,7 @@ class ChatGPTExportParser:
             'title': title,
             'content': content,
             'create_time': create_time,
-            'conversation_id': conversation['id']
+            'conversation_id': conversation.id
         }
 
 
@@ -265,8 +445,8 @@ def test_export_parser():
     if conversations:
         print("\n=== 最初の会話サンプル ===")
         sample = conversations[0]
-        print(f"タイトル: {sample['title']}")
-        print(f"メッセージ数: {len(sample['messages'])}")
+        print(f"タイトル: {sample.title}")
+        print(f"メッセージ数: {len(sample.messages)}")
         
         formatted = parser.format_for_evernote(sample)
         print(f"\nEvernote用タイトル: {formatted['title']}")
@@ -274,4 +454,7 @@ def test_export_parser():
 
 
 if __name__ == "__main__":
+    # --profile: 今回の実行のみ process_export_file をプロファイリング
+    if '--profile' in sys.argv:
+        profiling.configure(enabled=True)
     test_export_parser()
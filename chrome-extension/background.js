@@ -3,7 +3,15 @@
  */
 
 const SERVER_URL = 'http://localhost:8765';
-const SYNC_INTERVAL_MINUTES = 60; // 1時間ごと
+const SYNC_INTERVAL_MINUTES = 60; // 1時間ごと（応答完了時の自動同期で漏れた会話の取りこぼし対策）
+const DEFAULT_EXTRACT_CONCURRENCY = 4; // 同時に抽出するタブ数（chrome.storage.sync の extractConcurrency で変更可）
+const MAX_UPLOAD_RETRIES = 3; // 429/503 時の再送回数
+const QUEUE_DEPTH_DELAY_MS = 500; // サーバーの処理待ち1件あたりの待機時間
+const MAX_PACING_DELAY_MS = 10000;
+const MAX_ACK_COUNTS = 1000; // 確認済みメッセージ数を記録する会話数の上限（古いものから削除）
+
+// 次のアップロードを開始してよい時刻（サーバーの応答ヘッダーから更新）
+let nextUploadAt = 0;
 
 console.log('🚀 ChatGPT to Evernote: Background service started');
 
@@ -53,6 +61,36 @@ chrome.action.onClicked.addListener(async (tab) => {
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
     console.log('📨 Received message from popup:', request.action);
     
+    if (request.action === 'backfillConversation') {
+        // content scriptのバックフィルから会話を1件受け取り、サーバーに転送
+        postWithRetry(request.conversation ? { conversation: request.conversation } : {}, '/api/backfill')
+            .then(response => response.json())
+            .then(result => sendResponse(result))
+            .catch(error => sendResponse({ success: false, error: error.message }));
+        return true;
+    }
+    
+    if (request.action === 'conversationCompleted') {
+        // 応答完了時の自動同期（content script側でデバウンス済み）
+        autoSyncConversation(request.data);
+        return false;
+    }
+    
+    if (request.action === 'backfillFinished') {
+        const result = request.result || {};
+        if (result.error) {
+            showNotification('バックフィル中断', `${result.error}\n再実行すると続きから再開します`);
+        } else {
+            const created = result.created || 0;
+            const updated = result.updated || 0;
+            showNotification(
+                result.done ? 'バックフィル完了' : 'バックフィル一時停止',
+                `${result.sent}件を処理しました（作成 ${created} / 更新 ${updated}）`
+            );
+        }
+        return false;
+    }
+    
     if (request.action === 'syncAll') {
         // 非同期処理なのでPromiseで処理
         syncAllConversations()
@@ -157,28 +195,34 @@ async function syncAllConversations() {
             tabs.push(newTab);
         }
         
-        // 各タブの会話を同期
+        // 各タブの会話を並列に抽出
+        const { extractConcurrency } = await chrome.storage.sync.get('extractConcurrency');
+        const extracted = await mapWithConcurrency(
+            tabs,
+            extractConcurrency || DEFAULT_EXTRACT_CONCURRENCY,
+            extractFromTab
+        );
+        const conversations = extracted.filter(Boolean);
+        
+        // サーバー側と内容が異なる会話だけをアップロード
+        const stale = await fetchStaleConversationIds(conversations);
         let syncCount = 0;
-        for (const tab of tabs) {
+        for (const conversation of conversations) {
+            if (!stale.has(conversation.conversationId)) {
+                continue;
+            }
             try {
-                // Content scriptが読み込まれているか確認
-                try {
-                    await chrome.tabs.sendMessage(tab.id, { action: 'ping' });
-                } catch (e) {
-                    console.warn(`⚠️ Content script not loaded in tab ${tab.id}, skipping...`);
-                    continue;
-                }
-                
-                await syncCurrentTab(tab.id);
+                // サーバーの処理待ち・レート制限に応じて送信ペースを調整
+                await waitForUploadSlot();
+                // 定期同期はサーバー側で手動保存より後に処理される
+                await saveToEvernote(conversation, 'scheduled');
                 syncCount++;
-                
-                // 少し待機（レート制限回避）
-                await sleep(2000);
             } catch (error) {
-                console.error(`❌ Error syncing tab ${tab.id}:`, error);
+                console.error(`❌ Error syncing ${conversation.conversationId}:`, error);
             }
         }
         
+        console.log(`ℹ️ ${conversations.length - stale.size} conversations already up to date`);
         console.log(`✅ Full sync completed: ${syncCount} conversations`);
         
         if (syncCount > 0) {
@@ -192,18 +236,169 @@ async function syncAllConversations() {
 }
 
 /**
- * Evernoteサーバーに保存
+ * 応答が完了した会話を1件だけ同期（chrome.storage.sync の autoSync が false なら何もしない）
+ */
+async function autoSyncConversation(conversation) {
+    const { autoSync = true } = await chrome.storage.sync.get('autoSync');
+    if (!autoSync || !conversation) {
+        return;
+    }
+    
+    try {
+        await waitForUploadSlot();
+        const result = await saveToEvernote(conversation);
+        console.log(`⚡ Auto synced: ${conversation.title} (${result.action})`);
+    } catch (error) {
+        // 失敗した会話は定期同期（/api/status で差分判定）で拾い直す
+        console.error('❌ Auto sync failed:', error);
+    }
+}
+
+/**
+ * タブから会話を抽出（content scriptが未読み込み・抽出失敗の場合はnull）
  */
-async function saveToEvernote(conversation) {
+async function extractFromTab(tab) {
     try {
-        const response = await fetch(`${SERVER_URL}/api/save`, {
+        const response = await chrome.tabs.sendMessage(tab.id, { action: 'extractConversation' });
+        if (response && response.success && response.data) {
+            response.data.clientDigest = await computeDigest(response.data.messages);
+            return response.data;
+        }
+    } catch (error) {
+        // 未読み込みのタブは sendMessage が失敗する（従来の ping と同じ判定）
+        console.warn(`⚠️ Content script not available in tab ${tab.id}:`, error.message);
+    }
+    return null;
+}
+
+/**
+ * 同時実行数を制限して非同期処理を適用（結果は入力と同じ順序）
+ */
+async function mapWithConcurrency(items, limit, fn) {
+    const results = new Array(items.length);
+    let next = 0;
+    const workers = Array.from({ length: Math.min(limit, items.length) }, async () => {
+        while (next < items.length) {
+            const index = next++;
+            results[index] = await fn(items[index]);
+        }
+    });
+    await Promise.all(workers);
+    return results;
+}
+
+/**
+ * 応答ヘッダー（Retry-After / X-Queue-Depth）から次の送信可能時刻を更新
+ */
+function updateUploadPacing(response) {
+    const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+    const queueDepth = parseInt(response.headers.get('X-Queue-Depth'), 10);
+    let delay = 0;
+    
+    if (!isNaN(retryAfter)) {
+        delay = retryAfter * 1000;
+    } else if (!isNaN(queueDepth)) {
+        delay = Math.min(queueDepth * QUEUE_DEPTH_DELAY_MS, MAX_PACING_DELAY_MS);
+    }
+    nextUploadAt = Math.max(nextUploadAt, Date.now() + delay);
+}
+
+/**
+ * 次のアップロードが可能になるまで待機
+ */
+async function waitForUploadSlot() {
+    const wait = nextUploadAt - Date.now();
+    if (wait > 0) {
+        console.log(`⏳ Pacing upload for ${wait}ms`);
+        await sleep(wait);
+    }
+}
+
+/**
+ * 会話内容のダイジェストを計算（ロールと本文のSHA-256、抽出時刻は含めない）
+ */
+async function computeDigest(messages) {
+    const canonical = JSON.stringify(messages.map(m => [m.role, m.content]));
+    const hash = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(canonical));
+    return Array.from(new Uint8Array(hash))
+        .map(b => b.toString(16).padStart(2, '0'))
+        .join('');
+}
+
+/**
+ * サーバーに問い合わせ、アップロードが必要な会話IDを取得
+ *
+ * 照会に失敗した場合は全件を対象とする。
+ */
+async function fetchStaleConversationIds(conversations) {
+    const allIds = new Set(conversations.map(c => c.conversationId));
+    if (conversations.length === 0) {
+        return allIds;
+    }
+    
+    try {
+        const response = await fetch(`${SERVER_URL}/api/status`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(conversation),
-            signal: AbortSignal.timeout(30000) // 30秒タイムアウト
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                conversations: conversations.map(c => ({
+                    conversationId: c.conversationId,
+                    digest: c.clientDigest
+                }))
+            }),
+            signal: AbortSignal.timeout(10000)
         });
+        if (!response.ok) {
+            throw new Error(`Server error: ${response.status}`);
+        }
+        const result = await response.json();
+        return new Set(result.stale);
+    } catch (error) {
+        console.warn('⚠️ Status check failed, uploading all conversations:', error.message);
+        return allIds;
+    }
+}
+
+/**
+ * Evernoteサーバーに保存
+ *
+ * サーバーが確認済みのメッセージ数（ack）があれば差分のみを送る。
+ * 最後の確認済みメッセージは応答生成中に変わっている可能性があるため、
+ * それを含めて送り直す。ベース（先頭 baseCount 件）のダイジェストも送り、
+ * 編集・再生成で内容が変わっていた場合（409）は全件で再送する。
+ *
+ * priority は 'interactive'（手動保存・応答完了時）か 'scheduled'（定期同期）。
+ */
+async function saveToEvernote(conversation, priority = 'interactive') {
+    try {
+        if (!conversation.clientDigest) {
+            conversation.clientDigest = await computeDigest(conversation.messages);
+        }
+        conversation = { ...conversation, priority: priority };
+        const ackCount = await getAckCount(conversation.conversationId);
+        let payload = conversation;
+        
+        if (ackCount > 0 && conversation.messages.length >= ackCount) {
+            const baseCount = ackCount - 1;
+            payload = {
+                ...conversation,
+                baseCount: baseCount,
+                baseDigest: await computeDigest(conversation.messages.slice(0, baseCount)),
+                messages: conversation.messages.slice(baseCount)
+            };
+        }
+        
+        let response = await postConversation(payload);
+        
+        if (response.status === 409 && payload !== conversation) {
+            console.log('↩️ Delta base mismatch, resending full conversation');
+            response = await postConversation(conversation);
+        }
+        
+        // サーバー混雑（503）・レート制限（429）は Retry-After に従って再送
+        if (response.status === 429 || response.status === 503) {
+            response = await postWithRetry(conversation, '/api/save');
+        }
         
         if (!response.ok) {
             const errorData = await response.json();
@@ -213,6 +408,10 @@ async function saveToEvernote(conversation) {
         const result = await response.json();
         console.log(`✅ Saved to Evernote: ${result.message}`);
         
+        if (typeof result.ack_count === 'number') {
+            await setAckCount(conversation.conversationId, result.ack_count);
+        }
+        
         return result;
         
     } catch (error) {
@@ -221,6 +420,71 @@ async function saveToEvernote(conversation) {
     }
 }
 
+/**
+ * サーバーに送信し、混雑（503）・レート制限（429）の間は Retry-After に従って再送
+ */
+async function postWithRetry(payload, path) {
+    let response;
+    for (let attempt = 0; attempt <= MAX_UPLOAD_RETRIES; attempt++) {
+        await waitForUploadSlot();
+        response = await postConversation(payload, path);
+        if (response.status !== 429 && response.status !== 503) {
+            break;
+        }
+        console.log(`⏳ Server busy (${response.status}), retrying...`);
+    }
+    return response;
+}
+
+/**
+ * 会話をサーバーに送信（対応ブラウザではgzip圧縮）
+ */
+async function postConversation(payload, path = '/api/save') {
+    const json = JSON.stringify(payload);
+    const headers = { 'Content-Type': 'application/json' };
+    let body = json;
+    
+    if (typeof CompressionStream !== 'undefined') {
+        const stream = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+        body = await new Response(stream).blob();
+        headers['Content-Encoding'] = 'gzip';
+    }
+    
+    const response = await fetch(`${SERVER_URL}${path}`, {
+        method: 'POST',
+        headers: headers,
+        body: body,
+        signal: AbortSignal.timeout(30000) // 30秒タイムアウト
+    });
+    updateUploadPacing(response);
+    return response;
+}
+
+/**
+ * サーバーが確認済みのメッセージ数を取得
+ */
+async function getAckCount(conversationId) {
+    const { ackCounts = {} } = await chrome.storage.local.get('ackCounts');
+    return ackCounts[conversationId] || 0;
+}
+
+/**
+ * サーバーが確認済みのメッセージ数を保存
+ *
+ * 記録は更新順に並べ、上限を超えたら最も長く保存していない会話から削除する
+ * （削除された会話は次回全件で送信される）。
+ */
+async function setAckCount(conversationId, count) {
+    const { ackCounts = {} } = await chrome.storage.local.get('ackCounts');
+    delete ackCounts[conversationId];
+    ackCounts[conversationId] = count;
+    const ids = Object.keys(ackCounts);
+    for (const id of ids.slice(0, Math.max(0, ids.length - MAX_ACK_COUNTS))) {
+        delete ackCounts[id];
+    }
+    await chrome.storage.local.set({ ackCounts });
+}
+
 /**
  * 通知表示
  */
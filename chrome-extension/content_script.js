@@ -4,8 +4,273 @@
 
 console.log('🔧 ChatGPT to Evernote: Content Script loaded');
 
+// 複数のセレクタパターンを試行（ChatGPTのUI変更に対応）
+const MESSAGE_SELECTORS = [
+    '[data-message-author-role]',
+    '[data-testid^="conversation-turn"]',
+    '.group.w-full'
+];
+
+// 応答生成中に表示される要素（生成中の最後のメッセージは完了まで取り込まない）
+const STREAMING_SELECTOR = '[data-testid="stop-button"], .result-streaming';
+
+const CAPTURE_FLUSH_DELAY_MS = 200;
+
+// 応答完了から自動同期までの待機（続けて応答が完了した場合はまとめて1回送る）
+const AUTO_SYNC_DEBOUNCE_MS = 5000;
+let autoSyncTimer = null;
+
+/**
+ * 差分取り込みの状態
+ *
+ * MutationObserver が追加されたメッセージ要素だけを拾い、完了したものから
+ * バッファに追加する。抽出時はバッファを返すだけなので DOM 全体を走査しない。
+ * メッセージ要素の削除（再生成・編集）や会話の切り替えがあった場合は
+ * valid を落とし、少し待ってから全件走査でバッファを作り直す。
+ */
+const capture = {
+    valid: false,
+    conversationId: null,
+    path: null,          // バッファを作った時点のURLパス（会話の切り替え検出用）
+    selector: null,
+    messages: [],        // 取り込み済みメッセージ（表示順）
+    elementCount: 0,     // 取り込み済み要素数（空メッセージを含む、ロール推定用）
+    lastElement: null,   // 最後に取り込んだ要素
+    seen: new WeakSet(), // 取り込み済み・保留中の要素
+    pending: [],         // 完了待ちの要素（表示順）
+    addedNodes: [],      // 未処理の追加ノード
+    flushTimer: null,
+    rebuildTimer: null
+};
+
+/**
+ * URLから会話IDを取得
+ */
+function getConversationId() {
+    return window.location.pathname.split('/').pop() || 'conv_' + Date.now();
+}
+
+/**
+ * 応答を生成中かどうか
+ */
+function isStreaming() {
+    return document.querySelector(STREAMING_SELECTOR) !== null;
+}
+
+/**
+ * メッセージ要素から1件分のデータを読み取る（空の場合はnull）
+ */
+function readMessage(el, index) {
+    // ロール判定（複数パターン）
+    let role = el.getAttribute('data-message-author-role');
+    if (!role) {
+        // クラス名から判定
+        const classes = el.className;
+        if (classes.includes('user')) {
+            role = 'user';
+        } else if (classes.includes('assistant') || classes.includes('gpt')) {
+            role = 'assistant';
+        } else {
+            // 順番から判定（偶数=user, 奇数=assistant）
+            role = index % 2 === 0 ? 'user' : 'assistant';
+        }
+    }
+    
+    // コンテンツ取得（複数パターン）
+    const contentEl = el.querySelector('.markdown') || 
+                     el.querySelector('.whitespace-pre-wrap') ||
+                     el.querySelector('[data-message-content]') ||
+                     el;
+    
+    const content = contentEl?.innerHTML || contentEl?.textContent || '';
+    
+    // 空のメッセージをスキップ
+    if (!content.trim()) {
+        return null;
+    }
+    return {
+        role: role,
+        content: content.trim(),
+        timestamp: new Date().toISOString()
+    };
+}
+
+/**
+ * 完了したメッセージ要素をバッファに追加
+ */
+function appendCaptured(el) {
+    const message = readMessage(el, capture.elementCount);
+    capture.elementCount++;
+    capture.lastElement = el;
+    if (message) {
+        capture.messages.push(message);
+    }
+}
+
+/**
+ * DOM全体を走査してバッファを作り直す
+ */
+function rebuildCapture() {
+    clearTimeout(capture.rebuildTimer);
+    capture.rebuildTimer = null;
+    capture.valid = false;
+    capture.conversationId = getConversationId();
+    capture.path = window.location.pathname;
+    capture.messages = [];
+    capture.elementCount = 0;
+    capture.lastElement = null;
+    capture.seen = new WeakSet();
+    capture.pending = [];
+    capture.addedNodes = [];
+    
+    let messageElements = [];
+    for (const selector of MESSAGE_SELECTORS) {
+        messageElements = document.querySelectorAll(selector);
+        if (messageElements.length > 0) {
+            console.log(`✅ Found ${messageElements.length} messages using selector: ${selector}`);
+            capture.selector = selector;
+            break;
+        }
+    }
+    
+    if (messageElements.length === 0) {
+        return false;
+    }
+    
+    const streaming = isStreaming();
+    messageElements.forEach((el, index) => {
+        capture.seen.add(el);
+        if (streaming && index === messageElements.length - 1) {
+            // 生成中の応答は完了後に取り込む
+            capture.pending.push(el);
+        } else {
+            appendCaptured(el);
+        }
+    });
+    capture.valid = true;
+    return true;
+}
+
+/**
+ * 追加ノードからメッセージ要素を拾い、完了したものをバッファに追加
+ */
+function flushCapture() {
+    capture.flushTimer = null;
+    if (!capture.valid) {
+        capture.addedNodes = [];
+        return;
+    }
+    
+    const selector = capture.selector;
+    for (const node of capture.addedNodes) {
+        if (!node.isConnected) {
+            continue;
+        }
+        const candidates = node.matches(selector) ? [node] : node.querySelectorAll(selector);
+        for (const el of candidates) {
+            if (capture.seen.has(el)) {
+                continue;
+            }
+            capture.seen.add(el);
+            const last = capture.pending[capture.pending.length - 1] || capture.lastElement;
+            if (last && !(last.compareDocumentPosition(el) & Node.DOCUMENT_POSITION_FOLLOWING)) {
+                // 末尾以外への挿入は順序を保証できないため全件走査に戻す
+                capture.valid = false;
+                capture.addedNodes = [];
+                scheduleRebuild();
+                return;
+            }
+            capture.pending.push(el);
+        }
+    }
+    capture.addedNodes = [];
+    
+    // 最後の要素は生成中でなければ完了とみなす
+    const streaming = isStreaming();
+    const before = capture.messages.length;
+    while (capture.pending.length > 0 && (capture.pending.length > 1 || !streaming)) {
+        appendCaptured(capture.pending.shift());
+    }
+    
+    if (capture.messages.slice(before).some(message => message.role === 'assistant')) {
+        scheduleAutoSync();
+    }
+}
+
+/**
+ * 応答完了後、デバウンスしてこの会話だけをバックグラウンドに送る
+ */
+function scheduleAutoSync() {
+    clearTimeout(autoSyncTimer);
+    autoSyncTimer = setTimeout(() => {
+        autoSyncTimer = null;
+        const conversation = extractCurrentConversation();
+        if (conversation) {
+            console.log('⚡ Response completed, requesting auto sync');
+            chrome.runtime.sendMessage({ action: 'conversationCompleted', data: conversation })
+                .catch(error => console.warn('⚠️ Auto sync request failed:', error.message));
+        }
+    }, AUTO_SYNC_DEBOUNCE_MS);
+}
+
+/**
+ * バッファの作り直しを予約（描画中の連続した変更は1回の走査にまとめる）
+ *
+ * 作り直した時点で表示済みのメッセージは自動同期の対象にせず、
+ * その後に完了した応答から自動同期する。
+ */
+function scheduleRebuild() {
+    if (capture.rebuildTimer) {
+        return;
+    }
+    capture.rebuildTimer = setTimeout(() => {
+        capture.rebuildTimer = null;
+        rebuildCapture();
+    }, CAPTURE_FLUSH_DELAY_MS);
+}
+
+/**
+ * DOM変更の監視（メッセージ要素の追加・削除のみを扱う）
+ */
+function onDomMutation(mutations) {
+    if (!capture.valid || capture.path !== window.location.pathname) {
+        // 初回表示前・会話の切り替え・メッセージ削除後は全件走査で作り直す
+        capture.valid = false;
+        scheduleRebuild();
+        return;
+    }
+    for (const mutation of mutations) {
+        for (const node of mutation.removedNodes) {
+            if (node.nodeType === Node.ELEMENT_NODE && capture.selector &&
+                (node.matches(capture.selector) || node.querySelector(capture.selector))) {
+                // 再生成・編集でメッセージが消えた
+                capture.valid = false;
+                capture.addedNodes = [];
+                scheduleRebuild();
+                return;
+            }
+        }
+        for (const node of mutation.addedNodes) {
+            if (node.nodeType === Node.ELEMENT_NODE) {
+                capture.addedNodes.push(node);
+            }
+        }
+    }
+    // 生成中の細かい変更をまとめて処理（停止ボタンの消滅でも再評価される）
+    if (!capture.flushTimer) {
+        capture.flushTimer = setTimeout(flushCapture, CAPTURE_FLUSH_DELAY_MS);
+    }
+}
+
+// 読み込み時に表示済みのメッセージを取り込み、以降は追加分だけを拾う
+rebuildCapture();
+new MutationObserver(onDomMutation).observe(document.body, { childList: true, subtree: true });
+
 /**
  * 現在開いている会話を抽出
+ *
+ * 差分取り込みのバッファが有効ならそれを返し、無効（初回・会話切り替え・
+ * メッセージ削除後）なら DOM 全体を走査してバッファを作り直す。
  */
 function extractCurrentConversation() {
     try {
@@ -14,73 +279,27 @@ function extractCurrentConversation() {
         const title = titleElement?.textContent?.trim() || 'ChatGPT会話';
         
         // 会話IDを取得（URLから）
-        const conversationId = window.location.pathname.split('/').pop() || 
-                              'conv_' + Date.now();
-        
-        // メッセージ取得
-        const messages = [];
-        
-        // 複数のセレクタパターンを試行（ChatGPTのUI変更に対応）
-        const messageSelectors = [
-            '[data-message-author-role]',
-            '[data-testid^="conversation-turn"]',
-            '.group.w-full'
-        ];
+        const conversationId = getConversationId();
         
-        let messageElements = [];
-        for (const selector of messageSelectors) {
-            messageElements = document.querySelectorAll(selector);
-            if (messageElements.length > 0) {
-                console.log(`✅ Found ${messageElements.length} messages using selector: ${selector}`);
-                break;
+        if (capture.valid && capture.conversationId === conversationId) {
+            if (capture.flushTimer) {
+                clearTimeout(capture.flushTimer);
+                flushCapture();
             }
         }
-        
-        if (messageElements.length === 0) {
-            console.warn('⚠️ No messages found');
-            return null;
-        }
-        
-        messageElements.forEach((el, index) => {
-            // ロール判定（複数パターン）
-            let role = el.getAttribute('data-message-author-role');
-            if (!role) {
-                // クラス名から判定
-                const classes = el.className;
-                if (classes.includes('user')) {
-                    role = 'user';
-                } else if (classes.includes('assistant') || classes.includes('gpt')) {
-                    role = 'assistant';
-                } else {
-                    // 順番から判定（偶数=user, 奇数=assistant）
-                    role = index % 2 === 0 ? 'user' : 'assistant';
-                }
+        if (!capture.valid || capture.conversationId !== conversationId) {
+            if (!rebuildCapture()) {
+                console.warn('⚠️ No messages found');
+                return null;
             }
-            
-            // コンテンツ取得（複数パターン）
-            let contentEl = el.querySelector('.markdown') || 
-                           el.querySelector('.whitespace-pre-wrap') ||
-                           el.querySelector('[data-message-content]') ||
-                           el;
-            
-            let content = contentEl?.innerHTML || contentEl?.textContent || '';
-            
-            // 空のメッセージをスキップ
-            if (content.trim()) {
-                messages.push({
-                    role: role,
-                    content: content.trim(),
-                    timestamp: new Date().toISOString()
-                });
-            }
-        });
+        }
         
-        console.log(`✅ Extracted ${messages.length} messages from conversation`);
+        console.log(`✅ Extracted ${capture.messages.length} messages from conversation`);
         
         return {
             conversationId: conversationId,
             title: title,
-            messages: messages,
+            messages: capture.messages.slice(),
             url: window.location.href,
             extractedAt: new Date().toISOString()
         };
@@ -91,6 +310,145 @@ function extractCurrentConversation() {
     }
 }
 
+// バックフィル設定
+const BACKFILL_PAGE_SIZE = 28;             // 会話一覧の1ページあたりの件数
+const BACKFILL_MAX_PER_RUN = 500;          // 1回の実行で取り込む上限（続きは次回再開）
+const BACKFILL_FETCH_INTERVAL_MS = 1000;   // 会話取得の間隔
+const BACKFILL_MAX_RETRIES = 5;            // backend-api の429/5xx時の再試行回数
+
+let backfillRunning = false;
+let backfillCancelled = false;
+
+/**
+ * 会話履歴のバックフィル
+ *
+ * ログイン中のページから backend-api の会話一覧を更新日時の新しい順に
+ * ページングし、会話1件ずつ（conversations.json と同じ mapping 形式）を
+ * バックグラウンド経由でサーバーの /api/backfill に送る。
+ *
+ * 進捗（offset）は chrome.storage.local に1件ごとに保存するため、
+ * タブを閉じても次回は続きから再開する。全件完了後の再実行では、
+ * 前回完了時点より新しく更新された会話だけを取り込む。
+ *
+ * chrome.storage.local の backfillBaseUrl を設定すると、
+ * 記録済みフィクスチャ（backfill_fixture.py）に対して実行できる。
+ */
+async function runBackfill(maxConversations = BACKFILL_MAX_PER_RUN) {
+    const { backfillBaseUrl } = await chrome.storage.local.get('backfillBaseUrl');
+    const baseUrl = backfillBaseUrl || window.location.origin;
+    const stateKey = `backfillState:${baseUrl}`;
+    
+    let state = (await chrome.storage.local.get(stateKey))[stateKey];
+    if (!state || state.done) {
+        // 新しい実行: 前回完了時点の最新更新日時より古い会話は取り込み済み
+        state = { offset: 0, watermark: state ? state.newest : 0, newest: 0, done: false };
+    }
+    const saveState = () => chrome.storage.local.set({ [stateKey]: state });
+    
+    const headers = {};
+    const session = await fetchBackendJson(baseUrl, '/api/auth/session', {});
+    if (session && session.accessToken) {
+        headers['Authorization'] = `Bearer ${session.accessToken}`;
+    }
+    
+    const counts = { sent: 0, created: 0, updated: 0, unchanged: 0, skipped: 0 };
+    console.log(`📚 Backfill started at offset ${state.offset} (${baseUrl})`);
+    
+    while (!backfillCancelled && counts.sent < maxConversations) {
+        const page = await fetchBackendJson(
+            baseUrl,
+            `/backend-api/conversations?offset=${state.offset}&limit=${BACKFILL_PAGE_SIZE}&order=updated`,
+            headers
+        );
+        const items = page.items || [];
+        if (items.length === 0) {
+            state.done = true;
+            break;
+        }
+        
+        for (const item of items) {
+            if (backfillCancelled || counts.sent >= maxConversations) {
+                break;
+            }
+            const updateTime = toEpochSeconds(item.update_time);
+            if (updateTime <= state.watermark) {
+                // ここから先は前回の実行で取り込み済み
+                state.done = true;
+                break;
+            }
+            state.newest = Math.max(state.newest, updateTime);
+            
+            const conversation = await fetchBackendJson(
+                baseUrl, `/backend-api/conversation/${item.id}`, headers
+            );
+            const result = await chrome.runtime.sendMessage({
+                action: 'backfillConversation',
+                conversation: conversation
+            });
+            if (!result || !result.success) {
+                // 進捗は保存済みなので、次回はこの会話から再開する
+                throw new Error(result ? result.error : 'サーバーに送信できませんでした');
+            }
+            
+            counts.sent++;
+            counts[result.action] = (counts[result.action] || 0) + 1;
+            state.offset++;
+            await saveState();
+            await sleep(BACKFILL_FETCH_INTERVAL_MS);
+        }
+        
+        if (state.done || (page.total !== undefined && state.offset >= page.total)) {
+            state.done = true;
+            break;
+        }
+    }
+    
+    await saveState();
+    console.log(`📚 Backfill ${state.done ? 'completed' : 'paused'}:`, counts);
+    return { done: state.done, ...counts };
+}
+
+/**
+ * backend-api からJSONを取得（429/5xxは Retry-After または指数バックオフで再試行）
+ */
+async function fetchBackendJson(baseUrl, path, headers) {
+    for (let attempt = 0; ; attempt++) {
+        const response = await fetch(`${baseUrl}${path}`, {
+            headers: headers,
+            credentials: 'include'
+        });
+        if (response.ok) {
+            return response.json();
+        }
+        if ((response.status === 429 || response.status >= 500) && attempt < BACKFILL_MAX_RETRIES) {
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+            const delay = isNaN(retryAfter) ? 2000 * 2 ** attempt : retryAfter * 1000;
+            console.warn(`⏳ backend-api ${response.status}, retrying in ${delay}ms`);
+            await sleep(delay);
+            continue;
+        }
+        throw new Error(`backend-api error: ${response.status} (${path})`);
+    }
+}
+
+/**
+ * 更新日時（ISO文字列またはUNIX秒）をUNIX秒に変換
+ */
+function toEpochSeconds(value) {
+    if (typeof value === 'number') {
+        return value;
+    }
+    const parsed = Date.parse(value);
+    return isNaN(parsed) ? 0 : parsed / 1000;
+}
+
+/**
+ * スリープ
+ */
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
 /**
  * バックグラウンドスクリプトからのメッセージリスナー
  */
@@ -103,6 +461,28 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
     } else if (request.action === 'extractConversation') {
         const conversation = extractCurrentConversation();
         sendResponse({ success: !!conversation, data: conversation });
+    } else if (request.action === 'startBackfill') {
+        // 長時間かかるため開始だけを応答し、結果はバックグラウンドに通知する
+        if (backfillRunning) {
+            sendResponse({ success: false, error: 'バックフィルは実行中です' });
+            return true;
+        }
+        backfillRunning = true;
+        backfillCancelled = false;
+        sendResponse({ success: true });
+        runBackfill(request.maxConversations)
+            .then(result => chrome.runtime.sendMessage({ action: 'backfillFinished', result }))
+            .catch(error => {
+                console.error('❌ Backfill error:', error);
+                chrome.runtime.sendMessage({
+                    action: 'backfillFinished',
+                    result: { error: error.message }
+                });
+            })
+            .finally(() => { backfillRunning = false; });
+    } else if (request.action === 'cancelBackfill') {
+        backfillCancelled = true;
+        sendResponse({ success: true });
     }
     
     return true; // 非同期レスポンスを有効化
@@ -7,6 +7,7 @@ const SERVER_URL = 'http://localhost:8765';
 // DOM要素
 const statusDiv = document.getElementById('status');
 const syncCurrentBtn = document.getElementById('syncCurrent');
+const backfillBtn = document.getElementById('backfill');
 const loadingDiv = document.getElementById('loading');
 
 // 初期化
@@ -78,8 +79,12 @@ function setupEventListeners() {
                 
                 if (saveResponse.ok) {
                     const result = await saveResponse.json();
-                    const actionText = result.action === 'updated' ? '更新' : '保存';
-                    setStatus('ok', `✅ ${actionText}完了\n${result.message}`);
+                    if (result.action === 'unchanged') {
+                        setStatus('ok', `✅ 変更なし\n${result.message}`);
+                    } else {
+                        const actionText = result.action === 'updated' ? '更新' : '保存';
+                        setStatus('ok', `✅ ${actionText}完了\n${result.message}`);
+                    }
                 } else {
                     const errorText = await saveResponse.text();
                     console.error('Server error:', errorText);
@@ -96,6 +101,28 @@ function setupEventListeners() {
             setLoading(false);
         }
     });
+    
+    // 会話履歴のバックフィル（ChatGPTタブのcontent scriptで実行）
+    backfillBtn.addEventListener('click', async () => {
+        try {
+            const [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
+            
+            if (!tab.url || (!tab.url.includes('chat.openai.com') && !tab.url.includes('chatgpt.com'))) {
+                setStatus('error', '⚠️ ChatGPTページで開いてください');
+                return;
+            }
+            
+            const response = await chrome.tabs.sendMessage(tab.id, { action: 'startBackfill' });
+            if (response && response.success) {
+                setStatus('ok', '📚 取り込みを開始しました\n完了すると通知されます');
+            } else {
+                setStatus('error', `⚠️ ${response ? response.error : '開始できませんでした'}`);
+            }
+        } catch (error) {
+            console.error('Error details:', error);
+            setStatus('error', `❌ ${error.message}`);
+        }
+    });
 }
 
 /**
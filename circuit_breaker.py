@@ -0,0 +1,120 @@
+"""
+回路遮断（サーキットブレーカー）モジュール
+Evernoteへの呼び出しが連続して失敗したら一定時間は呼び出さずに即座に失敗させ、
+障害中に保存リクエストのスレッドがタイムアウト待ちで滞留しないようにする
+
+状態:
+- closed: 通常どおり呼び出す（連続失敗が閾値に達すると open）
+- open: 呼び出さずに CircuitOpenError（待機時間が過ぎると half_open）
+- half_open: 1件だけ試行（成功で closed、失敗で再び open）
+"""
+import logging
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """回路遮断中のため呼び出さなかった"""
+
+    def __init__(self, retry_after: float):
+        """
+        Args:
+            retry_after: 次に試行できるまでの秒数
+        """
+        super().__init__(f"Evernoteへの接続を一時停止しています（{retry_after:.0f}秒後に再試行）")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """連続失敗で呼び出しを遮断し、一定時間後に試行して復旧を確認する"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: この回数連続で失敗したら遮断する
+            reset_timeout: 遮断してから試行を再開するまでの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        呼び出し前の確認
+
+        Raises:
+            CircuitOpenError: 遮断中、または復旧確認の試行中の場合
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            remaining = self._remaining()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            now = time.monotonic()
+            if self._probing and now - self._probe_started < self.reset_timeout:
+                # 復旧確認は1件ずつ（他の呼び出しは結果が出るまで待たせずに失敗させる）
+                raise CircuitOpenError(1.0)
+            self._state = HALF_OPEN
+            self._probing = True
+            self._probe_started = now
+        logger.info("🔌 Evernoteへの接続を試行して復旧を確認します")
+
+    def record_success(self) -> None:
+        """呼び出しが成功した（Evernoteが応答した）"""
+        with self._lock:
+            recovered = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+        if recovered:
+            logger.info("✅ Evernoteへの接続が復旧しました")
+
+    def record_failure(self) -> None:
+        """呼び出しが失敗した（タイムアウト・通信エラー・システムエラー）"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                tripped = self._state == CLOSED
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+            else:
+                tripped = False
+        if tripped:
+            logger.warning(
+                f"⚡ Evernoteへの呼び出しが{self._failures}回連続で失敗したため、"
+                f"{self.reset_timeout:.0f}秒間停止します"
+            )
+
+    def snapshot(self) -> Dict:
+        """ヘルスチェック用の状態"""
+        with self._lock:
+            state = self._state
+            remaining = self._remaining() if state == OPEN else 0.0
+            failures = self._failures
+        if state == OPEN and remaining <= 0:
+            state = HALF_OPEN
+        return {
+            'state': state,
+            'consecutive_failures': failures,
+            'retry_after': round(max(remaining, 0.0), 1),
+        }
+
+    def _remaining(self) -> float:
+        """遮断が解けるまでの秒数（ロック内で呼ぶ）"""
+        if self._state != OPEN:
+            return 0.0
+        return self._opened_at + self.reset_timeout - time.monotonic()
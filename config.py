@@ -1,168 +1,511 @@
 """
 設定ファイル読み込みモジュール
 環境変数と.envファイルから設定を読み込む
+
+設定は読み込み時に一度だけ解析し、不変のスナップショット（ConfigSnapshot）として
+保持する。各プロパティはスナップショットの値を返すだけなので、参照のたびに
+環境変数を解析し直すことはない。.env の変更検知（start_watching）または
+SIGHUP（install_reload_signal）で reload() すると、新しいスナップショットに
+まとめて差し替える。
 """
 import os
-from typing import List
-from dotenv import load_dotenv
+import signal
+import threading
+from dataclasses import dataclass, fields
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from dotenv import dotenv_values, find_dotenv
 import logging
 
-# .envファイルを読み込む
-load_dotenv()
-
 logger = logging.getLogger(__name__)
 
+# 除外対象のパスパターン（部分一致）
+# TODO: 会話本文ファイルの構造が判明したら、このリストを更新する
+# 現時点では、明らかに会話内容ではないファイルを除外
+_DEFAULT_IGNORE_PATHS = (
+    'sentry',           # Sentryテレメトリフォルダ
+    'session.json',     # セッション情報
+    'GPUCache',         # GPUキャッシュ
+    'Code Cache',       # コードキャッシュ
+    'Cache',            # 一般キャッシュ
+    'logs',             # アプリログ
+    'Local Storage',    # ローカルストレージ（LevelDB）
+    'IndexedDB',        # IndexedDB（LevelDB）
+    'Session Storage',  # セッションストレージ
+)
+
+# 除外対象のファイル名（完全一致）
+# TODO: 会話本文ファイルの構造が判明したら、このリストを更新する
+_DEFAULT_IGNORE_FILENAMES = (
+    'session.json',
+    'LOCK',
+    'LOG',
+    'MANIFEST',
+)
+
+# 変更しても再起動しないと反映されない設定
+RESTART_REQUIRED_FIELDS = (
+    'evernote_api_token',
+    'evernote_consumer_key',
+    'evernote_consumer_secret',
+    'evernote_notebook_name',
+    'evernote_environment',
+    'evernote_timeout_seconds',
+    'circuit_failure_threshold',
+    'circuit_reset_seconds',
+    'server_mode',
+    'async_workers',
+    'async_max_backlog',
+    'duplicate_db_path',
+    'log_file',
+)
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """解析済みの設定値（不変）"""
+
+    evernote_api_token: str
+    evernote_consumer_key: str
+    evernote_consumer_secret: str
+    evernote_notebook_name: str
+    evernote_environment: str
+    evernote_timeout_seconds: float
+    circuit_failure_threshold: int
+    circuit_reset_seconds: int
+    chatgpt_data_path: str
+    watch_extensions: Tuple[str, ...]
+    watch_interval: int
+    log_level: str
+    log_file: str
+    slow_request_threshold_ms: float
+    save_debounce_ms: int
+    upload_slots: int
+    upload_starvation_seconds: int
+    profile_enabled: bool
+    profile_dir: str
+    profile_top_n: int
+    profile_max_runs: int
+    server_mode: str
+    async_workers: int
+    async_max_backlog: int
+    duplicate_db_path: str
+    reconcile_interval_minutes: int
+    ignore_paths: Tuple[str, ...]
+    ignore_filenames: Tuple[str, ...]
+
+    @property
+    def use_oauth(self) -> bool:
+        """OAuth認証を使用するかどうか"""
+        return bool(self.evernote_consumer_key and self.evernote_consumer_secret)
+
+
+def _parse_int(env: Mapping[str, str], key: str, default: int, warning: str) -> int:
+    """整数の設定値を解析（不正な値は警告して既定値）"""
+    try:
+        return int(env.get(key, str(default)))
+    except ValueError:
+        logger.warning(warning)
+        return default
+
+
+def _parse_choice(env: Mapping[str, str], key: str, default: str, choices: List[str]) -> str:
+    """選択肢のいずれかである設定値を解析（不正な値は警告して既定値）"""
+    value = env.get(key, default).lower()
+    if value not in choices:
+        logger.warning(f"無効な{key}: {value}. '{default}'を使用します。")
+        return default
+    return value
+
+
+def _parse_list(env: Mapping[str, str], key: str) -> List[str]:
+    """カンマ区切りの設定値を解析"""
+    return [item.strip() for item in env.get(key, '').split(',') if item.strip()]
+
+
+def load_snapshot(env: Mapping[str, str]) -> ConfigSnapshot:
+    """
+    環境変数からスナップショットを作成（値の解析・警告はここで一度だけ行う）
+
+    Args:
+        env: 環境変数（.envの値を含む）
+
+    Returns:
+        ConfigSnapshot
+    """
+    chatgpt_data_path = env.get('CHATGPT_DATA_PATH', '')
+    if not chatgpt_data_path:
+        # デフォルトパスを試行
+        username = env.get('USERNAME', '')
+        chatgpt_data_path = f"C:\\Users\\{username}\\AppData\\Roaming\\ChatGPT"
+        logger.warning(
+            f"CHATGPT_DATA_PATH が設定されていません。"
+            f"デフォルトパス '{chatgpt_data_path}' を試行します。"
+        )
+
+    # 先頭に . がない場合は追加
+    extensions = [ext.strip() for ext in env.get('WATCH_EXTENSIONS', '.html,.json,.txt').split(',')]
+    watch_extensions = tuple(ext if ext.startswith('.') else f'.{ext}' for ext in extensions)
+
+    log_level = env.get('LOG_LEVEL', 'INFO').upper()
+    if log_level not in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
+        logger.warning(f"無効なLOG_LEVEL: {log_level}. 'INFO'を使用します。")
+        log_level = 'INFO'
+
+    try:
+        slow_request_threshold_ms = float(env.get('SLOW_REQUEST_THRESHOLD_MS', '3000'))
+    except ValueError:
+        logger.warning("無効なSLOW_REQUEST_THRESHOLD_MS値。デフォルトの3000msを使用します。")
+        slow_request_threshold_ms = 3000.0
+
+    try:
+        evernote_timeout_seconds = max(1.0, float(env.get('EVERNOTE_TIMEOUT_SECONDS', '20')))
+    except ValueError:
+        logger.warning("無効なEVERNOTE_TIMEOUT_SECONDS値。デフォルトの20秒を使用します。")
+        evernote_timeout_seconds = 20.0
+
+    return ConfigSnapshot(
+        evernote_api_token=env.get('EVERNOTE_API_TOKEN', ''),
+        evernote_consumer_key=env.get('EVERNOTE_CONSUMER_KEY', ''),
+        evernote_consumer_secret=env.get('EVERNOTE_CONSUMER_SECRET', ''),
+        evernote_notebook_name=env.get('EVERNOTE_NOTEBOOK_NAME', 'ChatGPT Logs'),
+        evernote_environment=_parse_choice(
+            env, 'EVERNOTE_ENVIRONMENT', 'production', ['production', 'sandbox']
+        ),
+        evernote_timeout_seconds=evernote_timeout_seconds,
+        circuit_failure_threshold=max(1, _parse_int(
+            env, 'CIRCUIT_FAILURE_THRESHOLD', 5,
+            "無効なCIRCUIT_FAILURE_THRESHOLD値。デフォルトの5回を使用します。"
+        )),
+        circuit_reset_seconds=max(1, _parse_int(
+            env, 'CIRCUIT_RESET_SECONDS', 30,
+            "無効なCIRCUIT_RESET_SECONDS値。デフォルトの30秒を使用します。"
+        )),
+        chatgpt_data_path=chatgpt_data_path,
+        watch_extensions=watch_extensions,
+        watch_interval=_parse_int(
+            env, 'WATCH_INTERVAL', 5, "無効なWATCH_INTERVAL値。デフォルトの5秒を使用します。"
+        ),
+        log_level=log_level,
+        log_file=env.get('LOG_FILE', 'chatgpt_evernote_sync.log'),
+        slow_request_threshold_ms=slow_request_threshold_ms,
+        save_debounce_ms=max(0, _parse_int(
+            env, 'SAVE_DEBOUNCE_MS', 300, "無効なSAVE_DEBOUNCE_MS値。デフォルトの300msを使用します。"
+        )),
+        upload_slots=max(1, _parse_int(
+            env, 'UPLOAD_SLOTS', 8, "無効なUPLOAD_SLOTS値。デフォルトの8を使用します。"
+        )),
+        upload_starvation_seconds=max(1, _parse_int(
+            env, 'UPLOAD_STARVATION_SECONDS', 30,
+            "無効なUPLOAD_STARVATION_SECONDS値。デフォルトの30秒を使用します。"
+        )),
+        profile_enabled=env.get('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        profile_dir=env.get('PROFILE_DIR', './profiles'),
+        profile_top_n=_parse_int(
+            env, 'PROFILE_TOP_N', 20, "無効なPROFILE_TOP_N値。デフォルトの20件を使用します。"
+        ),
+        profile_max_runs=_parse_int(
+            env, 'PROFILE_MAX_RUNS', 1, "無効なPROFILE_MAX_RUNS値。デフォルトの1回を使用します。"
+        ),
+        server_mode=_parse_choice(env, 'SERVER_MODE', 'threaded', ['threaded', 'async']),
+        async_workers=max(1, _parse_int(
+            env, 'ASYNC_WORKERS', 4, "無効なASYNC_WORKERS値。デフォルトの4を使用します。"
+        )),
+        async_max_backlog=max(1, _parse_int(
+            env, 'ASYNC_MAX_BACKLOG', 64, "無効なASYNC_MAX_BACKLOG値。デフォルトの64を使用します。"
+        )),
+        duplicate_db_path=env.get('DUPLICATE_DB_PATH', './sync_history.db'),
+        reconcile_interval_minutes=max(0, _parse_int(
+            env, 'RECONCILE_INTERVAL_MINUTES', 60,
+            "無効なRECONCILE_INTERVAL_MINUTES値。デフォルトの60分を使用します。"
+        )),
+        # 環境変数から追加の除外パターンを取得
+        ignore_paths=_DEFAULT_IGNORE_PATHS + tuple(_parse_list(env, 'IGNORE_PATHS')),
+        ignore_filenames=_DEFAULT_IGNORE_FILENAMES + tuple(_parse_list(env, 'IGNORE_FILENAMES')),
+    )
+
 
 class Config:
     """アプリケーション設定クラス"""
-    
-    def __init__(self):
-        self._validate_config()
-    
+
+    def __init__(self, env_file: Optional[str] = None, validate: bool = True):
+        """
+        Args:
+            env_file: .envファイルのパス（省略時は自動検出）
+            validate: 認証情報等を検証するかどうか（不足時はValueError）
+        """
+        self.env_file = env_file or find_dotenv() or os.path.join(os.getcwd(), '.env')
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[ConfigSnapshot, ConfigSnapshot], None]] = []
+        self._watch_stop = threading.Event()
+        self._watch_thread = None
+
+        self._snapshot = self._load()
+        if validate:
+            self._validate_config(self._snapshot)
+
+    def _load(self) -> ConfigSnapshot:
+        """.envと環境変数を読み込んでスナップショットを作成（環境変数が優先）"""
+        env: Dict[str, str] = {}
+        if os.path.exists(self.env_file):
+            env.update((k, v) for k, v in dotenv_values(self.env_file).items() if v is not None)
+        env.update(os.environ)
+        return load_snapshot(env)
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """現在のスナップショット（複数の値を一貫して読む場合に使う）"""
+        return self._snapshot
+
     @property
     def evernote_api_token(self) -> str:
         """Evernote APIトークン（オプション、OAuth使用時は不要）"""
-        return os.getenv('EVERNOTE_API_TOKEN', '')
-    
+        return self._snapshot.evernote_api_token
+
     @property
     def evernote_consumer_key(self) -> str:
         """Evernote Consumer Key（OAuth認証用）"""
-        return os.getenv('EVERNOTE_CONSUMER_KEY', '')
-    
+        return self._snapshot.evernote_consumer_key
+
     @property
     def evernote_consumer_secret(self) -> str:
         """Evernote Consumer Secret（OAuth認証用）"""
-        return os.getenv('EVERNOTE_CONSUMER_SECRET', '')
-    
+        return self._snapshot.evernote_consumer_secret
+
     @property
     def use_oauth(self) -> bool:
         """OAuth認証を使用するかどうか"""
-        return bool(self.evernote_consumer_key and self.evernote_consumer_secret)
-    
+        return self._snapshot.use_oauth
+
     @property
     def evernote_notebook_name(self) -> str:
         """保存先ノートブック名"""
-        return os.getenv('EVERNOTE_NOTEBOOK_NAME', 'ChatGPT Logs')
-    
+        return self._snapshot.evernote_notebook_name
+
     @property
     def evernote_environment(self) -> str:
         """Evernote環境（production or sandbox）"""
-        env = os.getenv('EVERNOTE_ENVIRONMENT', 'production').lower()
-        if env not in ['production', 'sandbox']:
-            logger.warning(f"無効なEVERNOTE_ENVIRONMENT: {env}. 'production'を使用します。")
-            return 'production'
-        return env
-    
+        return self._snapshot.evernote_environment
+
+    @property
+    def evernote_timeout_seconds(self) -> float:
+        """Evernote API呼び出し1回あたりの通信タイムアウト（秒）"""
+        return self._snapshot.evernote_timeout_seconds
+
+    @property
+    def circuit_failure_threshold(self) -> int:
+        """Evernoteへの呼び出しを遮断するまでの連続失敗回数"""
+        return self._snapshot.circuit_failure_threshold
+
+    @property
+    def circuit_reset_seconds(self) -> int:
+        """遮断してからEvernoteへの接続を再試行するまでの秒数"""
+        return self._snapshot.circuit_reset_seconds
+
     @property
     def chatgpt_data_path(self) -> str:
         """ChatGPTデータフォルダパス"""
-        path = os.getenv('CHATGPT_DATA_PATH', '')
-        if not path:
-            # デフォルトパスを試行
-            username = os.getenv('USERNAME', '')
-            default_path = f"C:\\Users\\{username}\\AppData\\Roaming\\ChatGPT"
-            logger.warning(
-                f"CHATGPT_DATA_PATH が設定されていません。"
-                f"デフォルトパス '{default_path}' を試行します。"
-            )
-            return default_path
-        return path
-    
-    @property
-    def watch_extensions(self) -> List[str]:
+        return self._snapshot.chatgpt_data_path
+
+    @property
+    def watch_extensions(self) -> Tuple[str, ...]:
         """監視対象の拡張子リスト"""
-        extensions_str = os.getenv('WATCH_EXTENSIONS', '.html,.json,.txt')
-        extensions = [ext.strip() for ext in extensions_str.split(',')]
-        # 先頭に . がない場合は追加
-        return [ext if ext.startswith('.') else f'.{ext}' for ext in extensions]
-    
+        return self._snapshot.watch_extensions
+
     @property
     def watch_interval(self) -> int:
         """監視間隔（秒）"""
-        try:
-            return int(os.getenv('WATCH_INTERVAL', '5'))
-        except ValueError:
-            logger.warning("無効なWATCH_INTERVAL値。デフォルトの5秒を使用します。")
-            return 5
-    
+        return self._snapshot.watch_interval
+
     @property
     def log_level(self) -> str:
         """ログレベル"""
-        level = os.getenv('LOG_LEVEL', 'INFO').upper()
-        valid_levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
-        if level not in valid_levels:
-            logger.warning(f"無効なLOG_LEVEL: {level}. 'INFO'を使用します。")
-            return 'INFO'
-        return level
-    
+        return self._snapshot.log_level
+
     @property
     def log_file(self) -> str:
         """ログファイルパス"""
-        return os.getenv('LOG_FILE', 'chatgpt_evernote_sync.log')
-    
+        return self._snapshot.log_file
+
+    @property
+    def slow_request_threshold_ms(self) -> float:
+        """低速リクエストとしてステージ内訳を記録する閾値（ミリ秒）"""
+        return self._snapshot.slow_request_threshold_ms
+
+    @property
+    def save_debounce_ms(self) -> int:
+        """同じ会話の保存をまとめるために待つ時間（ミリ秒、0で待たない）"""
+        return self._snapshot.save_debounce_ms
+
+    @property
+    def upload_slots(self) -> int:
+        """Evernoteへの同時アップロード数の最大値（実際の数は応答時間・エラーから自動調整）"""
+        return self._snapshot.upload_slots
+
+    @property
+    def upload_starvation_seconds(self) -> int:
+        """定期同期・一括取り込みを優先度に関わらず実行するまでの待ち時間（秒）"""
+        return self._snapshot.upload_starvation_seconds
+
+    @property
+    def profile_enabled(self) -> bool:
+        """プロファイリングを有効にするかどうか"""
+        return self._snapshot.profile_enabled
+
+    @property
+    def profile_dir(self) -> str:
+        """プロファイル出力先ディレクトリ"""
+        return self._snapshot.profile_dir
+
+    @property
+    def profile_top_n(self) -> int:
+        """プロファイル要約に出力するホットスポット数"""
+        return self._snapshot.profile_top_n
+
+    @property
+    def profile_max_runs(self) -> int:
+        """プロファイリングする最大回数（0以下で無制限）"""
+        return self._snapshot.profile_max_runs
+
+    @property
+    def server_mode(self) -> str:
+        """サーバー実行モード（threaded: Flask / async: asyncio）"""
+        return self._snapshot.server_mode
+
+    @property
+    def async_workers(self) -> int:
+        """非同期モードでEvernote I/Oに使うスレッド数"""
+        return self._snapshot.async_workers
+
+    @property
+    def async_max_backlog(self) -> int:
+        """非同期モードで受け付ける保存処理（実行中＋待機中）の上限"""
+        return self._snapshot.async_max_backlog
+
     @property
     def duplicate_db_path(self) -> str:
         """重複管理データベースパス"""
-        return os.getenv('DUPLICATE_DB_PATH', './sync_history.db')
-    
+        return self._snapshot.duplicate_db_path
+
+    @property
+    def reconcile_interval_minutes(self) -> int:
+        """Evernoteとの定期照合の間隔（分、0で無効）"""
+        return self._snapshot.reconcile_interval_minutes
+
+    @property
+    def ignore_paths(self) -> Tuple[str, ...]:
+        """除外対象のパスパターンリスト（部分一致、IGNORE_PATHSで追加）"""
+        return self._snapshot.ignore_paths
+
     @property
-    def ignore_paths(self) -> List[str]:
+    def ignore_filenames(self) -> Tuple[str, ...]:
+        """除外対象のファイル名リスト（完全一致、IGNORE_FILENAMESで追加）"""
+        return self._snapshot.ignore_filenames
+
+    def add_reload_listener(
+        self,
+        listener: Callable[[ConfigSnapshot, ConfigSnapshot], None]
+    ) -> None:
         """
-        除外対象のパスパターンリスト（部分一致）
-        
-        TODO: 会話本文ファイルの構造が判明したら、このリストを更新する
-        現時点では、明らかに会話内容ではないファイルを除外
+        再読み込みで設定が変わったときに呼ばれる処理を登録
+
+        Args:
+            listener: (変更前, 変更後) のスナップショットを受け取る関数
         """
-        default_ignores = [
-            'sentry',           # Sentryテレメトリフォルダ
-            'session.json',     # セッション情報
-            'GPUCache',         # GPUキャッシュ
-            'Code Cache',       # コードキャッシュ
-            'Cache',            # 一般キャッシュ
-            'logs',             # アプリログ
-            'Local Storage',    # ローカルストレージ（LevelDB）
-            'IndexedDB',        # IndexedDB（LevelDB）
-            'Session Storage',  # セッションストレージ
-        ]
-        
-        # 環境変数から追加の除外パターンを取得
-        custom_ignores = os.getenv('IGNORE_PATHS', '')
-        if custom_ignores:
-            custom_list = [p.strip() for p in custom_ignores.split(',') if p.strip()]
-            default_ignores.extend(custom_list)
-        
-        return default_ignores
-    
-    @property
-    def ignore_filenames(self) -> List[str]:
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """
+        .envと環境変数を読み直し、スナップショットを差し替える
+        （検証に失敗した場合は現在の設定を維持）
+
+        Returns:
+            設定が変わった場合True
+        """
+        try:
+            snapshot = self._load()
+            self._validate_config(snapshot)
+        except (OSError, ValueError) as e:
+            logger.error(f"設定の再読み込みに失敗しました（現在の設定を継続します）: {e}")
+            return False
+
+        with self._lock:
+            old, self._snapshot = self._snapshot, snapshot
+
+        changed = [f.name for f in fields(snapshot) if getattr(old, f.name) != getattr(snapshot, f.name)]
+        if not changed:
+            return False
+
+        # 値そのものは認証情報を含むためログに出さない
+        logger.info(f"🔄 設定を再読み込みしました: {', '.join(changed)}")
+        restart_required = [name for name in changed if name in RESTART_REQUIRED_FIELDS]
+        if restart_required:
+            logger.warning(f"次の設定の反映には再起動が必要です: {', '.join(restart_required)}")
+
+        for listener in self._listeners:
+            try:
+                listener(old, snapshot)
+            except Exception as e:
+                logger.error(f"設定変更の反映エラー: {e}", exc_info=True)
+        return True
+
+    def start_watching(self, interval: float = 2.0) -> None:
+        """
+        .envの更新日時を監視し、変更されたら再読み込みする
+
+        Args:
+            interval: 確認間隔（秒）
+        """
+        if self._watch_thread is not None:
+            return
+
+        def mtime() -> Optional[float]:
+            try:
+                return os.stat(self.env_file).st_mtime
+            except OSError:
+                return None
+
+        def watch_loop() -> None:
+            last = mtime()
+            while not self._watch_stop.wait(interval):
+                current = mtime()
+                if current != last:
+                    last = current
+                    self.reload()
+
+        self._watch_thread = threading.Thread(target=watch_loop, name='config-watch', daemon=True)
+        self._watch_thread.start()
+        logger.info(f"設定ファイルの変更を監視します: {self.env_file}")
+
+    def stop_watching(self) -> None:
+        """.envの監視を停止"""
+        self._watch_stop.set()
+
+    def install_reload_signal(self) -> bool:
         """
-        除外対象のファイル名リスト（完全一致）
-        
-        TODO: 会話本文ファイルの構造が判明したら、このリストを更新する
+        SIGHUPで再読み込みするよう登録（メインスレッドから呼ぶ、SIGHUPのないWindowsでは何もしない）
+
+        Returns:
+            登録した場合True
         """
-        default_files = [
-            'session.json',
-            'LOCK',
-            'LOG',
-            'MANIFEST',
-        ]
-        
-        # 環境変数から追加
-        custom_files = os.getenv('IGNORE_FILENAMES', '')
-        if custom_files:
-            custom_list = [f.strip() for f in custom_files.split(',') if f.strip()]
-            default_files.extend(custom_list)
-        
-        return default_files
-    
-    def _validate_config(self):
+        if not hasattr(signal, 'SIGHUP'):
+            return False
+        # シグナルハンドラ内ではロックやログを扱わず、別スレッドで再読み込みする
+        signal.signal(
+            signal.SIGHUP,
+            lambda signum, frame: threading.Thread(
+                target=self.reload, name='config-reload', daemon=True
+            ).start()
+        )
+        return True
+
+    def _validate_config(self, snapshot: ConfigSnapshot):
         """設定の検証"""
         try:
             # OAuth または APIトークンのいずれかが必要
-            has_oauth = self.use_oauth
-            has_token = bool(self.evernote_api_token and 
-                           self.evernote_api_token != 'your_evernote_api_token_here')
-            
+            has_oauth = snapshot.use_oauth
+            has_token = bool(snapshot.evernote_api_token and
+                           snapshot.evernote_api_token != 'your_evernote_api_token_here')
+
             if not has_oauth and not has_token:
                 raise ValueError(
                     "Evernote認証情報が設定されていません。\n"
@@ -170,26 +513,18 @@ class Config:
                     "  - EVERNOTE_CONSUMER_KEY と EVERNOTE_CONSUMER_SECRET (OAuth認証)\n"
                     "  - EVERNOTE_API_TOKEN (Developer Token)\n"
                 )
-            
+
             if has_oauth:
                 logger.info("OAuth認証を使用します")
             else:
                 logger.info("Developer Token認証を使用します")
-            
+
             # ChatGPTデータパスの存在確認
-            if not os.path.exists(self.chatgpt_data_path):
+            if not os.path.exists(snapshot.chatgpt_data_path):
                 logger.warning(
-                    f"ChatGPTデータフォルダが見つかりません: {self.chatgpt_data_path}\n"
+                    f"ChatGPTデータフォルダが見つかりません: {snapshot.chatgpt_data_path}\n"
                     f"パスが正しいか確認してください。"
                 )
         except ValueError as e:
             logger.error(f"設定エラー: {e}")
             raise
-
-
-# グローバル設定インスタンス
-try:
-    config = Config()
-except Exception as e:
-    logger.error(f"設定の読み込みに失敗しました: {e}")
-    raise
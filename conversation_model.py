@@ -0,0 +1,69 @@
+"""
+会話データモデル
+エクスポート・バックフィル・拡張機能の会話を共通の軽量なレコードで表す
+
+メッセージごとの dict は、キー表と値の格納領域を個別に持つため、
+10万件規模のエクスポートでは本文以外のオーバーヘッドが支配的になる。
+__slots__ 付きのデータクラスにし、ロール文字列をインターンして
+メッセージあたりのメモリを抑える。
+"""
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+
+def intern_role(role: Optional[str]) -> str:
+    """ロール文字列をインターン（'user' / 'assistant' 等を全メッセージで共有）"""
+    return sys.intern(str(role)) if role else ''
+
+
+@dataclass(slots=True)
+class Message:
+    """会話中の1メッセージ"""
+
+    role: str
+    content: str
+    create_time: Optional[float] = None
+    # 紐付け済みの添付（md5, mime, name, path）。ほとんどのメッセージは空なので共有の空タプル
+    attachments: Sequence[Dict] = ()
+
+    def __post_init__(self):
+        self.role = intern_role(self.role)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Message':
+        """
+        拡張機能・スナップショットのメッセージ（dict）から作成
+
+        Args:
+            data: role, content（と任意の create_time, attachments）
+
+        Returns:
+            Message
+        """
+        return cls(
+            data.get('role'),
+            str(data.get('content', '')),
+            data.get('create_time'),
+            tuple(data.get('attachments') or ())
+        )
+
+    def to_dict(self) -> Dict:
+        """dictに変換"""
+        return {
+            'role': self.role,
+            'content': self.content,
+            'create_time': self.create_time,
+            'attachments': list(self.attachments),
+        }
+
+
+@dataclass(slots=True)
+class Conversation:
+    """1つの会話"""
+
+    id: str
+    title: str
+    messages: List[Message] = field(default_factory=list)
+    create_time: Optional[float] = None
+    update_time: Optional[float] = None
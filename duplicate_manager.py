@@ -4,24 +4,66 @@
 """
 import sqlite3
 import hashlib
+import html
+import json
 import os
+import re
+import threading
+import zlib
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 import logging
 
+from conversation_model import Message
+from message_text import message_plain_text
+
 logger = logging.getLogger(__name__)
 
+# 会話URL中の会話ID（UUID）
+_CONVERSATION_UUID_RE = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE
+)
+# 本文ダイジェスト計算時に1つの空白にまとめる連続した空白
+# HTMLとMarkdownの改行・インデントの差は吸収し、本文中の記号（コード・数式）は区別する
+_DIGEST_WHITESPACE_RE = re.compile(r'\s+')
+# 本文ダイジェストの計算方法の版（変更時に上げると、保存済みの値を再計算する）
+_DIGEST_VERSION = 3
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# 全文検索の語（trigramトークナイザは3文字未満の語を索引から引けない）
+_SEARCH_TERM_RE = re.compile(r'\S+')
+_TRIGRAM_MIN_LENGTH = 3
+
 
 class DuplicateManager:
     """重複チェック管理クラス"""
     
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        search_batch_size: int = 100,
+        search_flush_interval: float = 2.0
+    ):
         """
         Args:
             db_path: SQLiteデータベースファイルのパス
+            search_batch_size: 全文検索索引をまとめて書き込む件数
+            search_flush_interval: 全文検索索引を書き込むまでの最大待ち時間（秒）
         """
         self.db_path = db_path
+        self.search_batch_size = search_batch_size
+        self.search_flush_interval = search_flush_interval
+        self.search_enabled = False
+        self.search_trigram = False
+        
+        # 全文検索索引の書き込み待ち（正規化した会話ID → 行）
+        self._search_pending: Dict[str, tuple] = {}
+        self._search_cond = threading.Condition()
+        self._search_write_lock = threading.Lock()
+        self._search_thread = None
+        
         self._init_database()
+        self._upgrade_content_digests()
     
     def _init_database(self):
         """データベースとテーブルの初期化"""
@@ -53,6 +95,119 @@ class DuplicateManager:
                 )
             ''')
             
+            # エクスポート一括インポートの進捗（チェックポイント）
+            # 会話ID + update_time が一致すれば取り込み済みとしてスキップする
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS import_progress (
+                    conversation_id TEXT PRIMARY KEY,
+                    update_time REAL,
+                    note_guid TEXT NOT NULL,
+                    imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 会話IDインデックス（拡張機能・エクスポート共通）
+            # 正規化した会話ID → ノートGUIDと本文ダイジェスト
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_index (
+                    canonical_id TEXT PRIMARY KEY,
+                    note_guid TEXT NOT NULL,
+                    content_digest TEXT,
+                    source TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 会話ごとの最新メッセージ（差分保存のベース、zlib圧縮JSON）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_snapshot (
+                    canonical_id TEXT PRIMARY KEY,
+                    message_count INTEGER NOT NULL,
+                    messages BLOB NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 拡張機能が計算した本文ダイジェスト（/api/status の比較用）
+            # 最後にアップロードしたENMLのMD5（Evernote側の contentHash と照合する）
+            cursor.execute('PRAGMA table_info(conversation_index)')
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'client_digest' not in columns:
+                cursor.execute('ALTER TABLE conversation_index ADD COLUMN client_digest TEXT')
+            if 'note_content_hash' not in columns:
+                cursor.execute('ALTER TABLE conversation_index ADD COLUMN note_content_hash TEXT')
+            
+            # 既存の file_note_mapping（拡張機能の会話ID）を初回のみ取り込む
+            cursor.execute('SELECT COUNT(*) FROM conversation_index')
+            if cursor.fetchone()[0] == 0:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO conversation_index (canonical_id, note_guid, source)
+                    SELECT LOWER(file_path), note_guid, 'legacy' FROM file_note_mapping
+                ''')
+            
+            # Evernoteとの照合済み位置（アカウントの updateCount）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS evernote_sync_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Evernoteへの書き込みに失敗した操作（バックグラウンドで再試行、zlib圧縮JSON）
+            # 同じ会話の操作は1件にまとめ、最新の内容で再試行する
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(kind, key)
+                )
+            ''')
+            
+            # 再試行しても成功しない操作（/api/dead-letters で確認）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS dead_letter (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    error TEXT,
+                    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 全文検索索引（日本語も部分一致で引けるtrigramを優先、FTS5がなければ無効）
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversation_search'")
+            search_created = cursor.fetchone() is None
+            for tokenizer in ('trigram', 'unicode61'):
+                try:
+                    cursor.execute(f'''
+                        CREATE VIRTUAL TABLE IF NOT EXISTS conversation_search USING fts5(
+                            canonical_id, note_guid, title, body,
+                            tokenize='{tokenizer}'
+                        )
+                    ''')
+                    self.search_enabled = True
+                    break
+                except sqlite3.OperationalError as e:
+                    logger.debug(f"全文検索索引を作成できません（{tokenizer}）: {e}")
+            if self.search_enabled:
+                cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = 'conversation_search'"
+                )
+                self.search_trigram = 'trigram' in cursor.fetchone()[0]
+                if search_created:
+                    self._backfill_search_index(cursor)
+            else:
+                logger.warning("SQLiteがFTS5に対応していないため、全文検索は無効です")
+            
             # インデックス作成
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_file_hash 
@@ -64,6 +219,11 @@ class DuplicateManager:
                 ON file_note_mapping(file_path)
             ''')
             
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt
+                ON outbox(next_attempt_at)
+            ''')
+            
             conn.commit()
             conn.close()
             
@@ -73,6 +233,76 @@ class DuplicateManager:
             logger.error(f"データベース初期化エラー: {e}")
             raise
     
+    def _backfill_search_index(self, cursor: sqlite3.Cursor) -> None:
+        """
+        索引の作成前に保存済みの会話を全文検索索引に登録（初回のみ）
+        
+        変更のない保存は索引を更新しないため、スナップショットから作成する。
+        タイトルは保存していないため、次に内容が変わった保存で反映される。
+        """
+        cursor.execute('''
+            SELECT i.canonical_id, i.note_guid, s.messages
+            FROM conversation_index i
+            JOIN conversation_snapshot s ON s.canonical_id = i.canonical_id
+        ''')
+        rows = []
+        for canonical_id, note_guid, blob in cursor.fetchall():
+            try:
+                messages = json.loads(zlib.decompress(blob))
+            except (zlib.error, ValueError):
+                continue
+            records = [Message.from_dict(m) for m in messages]
+            rows.append(self._search_row(canonical_id, note_guid, '', records))
+        cursor.executemany(
+            'INSERT INTO conversation_search (canonical_id, note_guid, title, body) '
+            'VALUES (?, ?, ?, ?)',
+            rows
+        )
+        if rows:
+            logger.info(f"保存済みの会話を全文検索索引に登録しました: {len(rows)}件")
+    
+    def _upgrade_content_digests(self) -> None:
+        """
+        本文ダイジェストの計算方法が変わっていれば、保存済みの値を再計算
+        
+        スナップショットがある会話はそのメッセージから計算し直す。
+        スナップショットがない会話（エクスポートのみ）は次回の保存時に1回更新される。
+        """
+        if (self.get_sync_state('digest_version') or 1) >= _DIGEST_VERSION:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT i.canonical_id, s.messages
+                FROM conversation_index i
+                JOIN conversation_snapshot s ON s.canonical_id = i.canonical_id
+            ''')
+            updates = []
+            for canonical_id, blob in cursor.fetchall():
+                try:
+                    messages = json.loads(zlib.decompress(blob))
+                except (zlib.error, ValueError):
+                    continue
+                records = [Message.from_dict(m) for m in messages]
+                updates.append((self.compute_content_digest(records), canonical_id))
+            
+            cursor.executemany(
+                'UPDATE conversation_index SET content_digest = ? WHERE canonical_id = ?',
+                updates
+            )
+            
+            conn.commit()
+            conn.close()
+            
+        except sqlite3.Error as e:
+            logger.error(f"本文ダイジェストの再計算エラー: {e}")
+            return
+        
+        self.set_sync_state('digest_version', _DIGEST_VERSION)
+        logger.info(f"本文ダイジェストを再計算しました: {len(updates)}件")
+    
     def calculate_file_hash(self, file_path: str, mtime: float) -> str:
         """
         ファイルパスと更新日時からハッシュ値を生成
@@ -287,3 +517,1064 @@ class DuplicateManager:
         except sqlite3.Error as e:
             logger.error(f"ファイル→ノート対応数取得エラー: {e}")
             return 0
+    
+    def get_import_progress(self) -> Dict[str, Optional[float]]:
+        """
+        一括インポート済みの会話IDとupdate_timeの対応を一括取得
+        
+        Returns:
+            会話ID → 取り込み時のupdate_time
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT conversation_id, update_time FROM import_progress')
+            progress = dict(cursor.fetchall())
+            
+            conn.close()
+            return progress
+            
+        except sqlite3.Error as e:
+            logger.error(f"インポート進捗取得エラー: {e}")
+            return {}
+    
+    def is_imported(self, conversation_id: str, update_time: Optional[float]) -> bool:
+        """
+        会話がこのupdate_timeのまま取り込み済みかどうかを1件だけ確認
+        
+        Args:
+            conversation_id: 会話ID
+            update_time: 会話更新日時
+        
+        Returns:
+            取り込み済みでupdate_timeが一致する場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT 1 FROM import_progress WHERE conversation_id = ? AND update_time IS ?',
+                (conversation_id, update_time)
+            )
+            imported = cursor.fetchone() is not None
+            
+            conn.close()
+            return imported
+            
+        except sqlite3.Error as e:
+            logger.error(f"インポート進捗取得エラー: {e}")
+            return False
+    
+    def mark_imported(
+        self,
+        conversation_id: str,
+        update_time: Optional[float],
+        note_guid: str
+    ) -> bool:
+        """
+        会話を一括インポート済みとして記録（チェックポイント）
+        
+        Args:
+            conversation_id: 会話ID
+            update_time: エクスポート上の会話更新日時
+            note_guid: EvernoteノートGUID
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO import_progress (conversation_id, update_time, note_guid, imported_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(conversation_id)
+                DO UPDATE SET update_time = excluded.update_time,
+                              note_guid = excluded.note_guid,
+                              imported_at = CURRENT_TIMESTAMP
+            ''', (conversation_id, update_time, note_guid))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.debug(f"インポート進捗を記録: {conversation_id}")
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"インポート進捗記録エラー: {e}")
+            return False
+    
+    @staticmethod
+    def canonical_conversation_id(value: str) -> str:
+        """
+        会話ID・会話URLを正規化した会話IDに変換
+        
+        拡張機能はURLパスの末尾、エクスポートは id フィールドを使うため、
+        どちらもChatGPTの会話UUID（小文字）に揃える。
+        
+        Args:
+            value: 会話ID、または会話URL
+        
+        Returns:
+            正規化した会話ID（UUIDを含まない場合は入力をそのまま返す）
+        """
+        match = _CONVERSATION_UUID_RE.search(value or '')
+        if match:
+            return match.group(0).lower()
+        return value
+    
+    @staticmethod
+    def compute_content_digest(messages: List[Message]) -> str:
+        """
+        メッセージ本文のダイジェストを計算
+        
+        拡張機能のHTMLとエクスポートのMarkdownを同じ表示テキストに揃え
+        （message_plain_text）、連続した空白を1つにまとめた本文とロールから計算する。
+        添付は拡張機能から届かないため含めない（経路をまたいで比較できるように）。
+        計算方法を変えた場合は _DIGEST_VERSION を上げる。
+        
+        Args:
+            messages: メッセージ（Message）のリスト
+        
+        Returns:
+            SHA256ハッシュ文字列
+        """
+        digest = hashlib.sha256()
+        for msg in messages:
+            text = _DIGEST_WHITESPACE_RE.sub(' ', message_plain_text(msg.content)).strip()
+            role = 'user' if msg.role == 'user' else 'assistant'
+            if text:
+                digest.update(f"{role}\x1f{text}\x1e".encode('utf-8'))
+        return digest.hexdigest()
+    
+    @staticmethod
+    def compute_client_digest(messages: List[Dict]) -> str:
+        """
+        拡張機能（background.js の computeDigest）と同じ方法でダイジェストを計算
+        
+        ロールと本文の組を JSON.stringify と同じ形式で直列化したSHA256。
+        差分保存で、拡張機能が送ったベースとスナップショットの一致を確認する。
+        
+        Args:
+            messages: メッセージ（受信形式のdict）のリスト
+        
+        Returns:
+            SHA256ハッシュ文字列
+        """
+        canonical = json.dumps(
+            [[m.get('role'), m.get('content')] for m in messages],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(canonical.encode('utf-8', 'surrogatepass')).hexdigest()
+    
+    def lookup_conversation(self, canonical_id: str) -> Optional[Dict[str, Optional[str]]]:
+        """
+        会話IDインデックスから既存ノートを取得
+        
+        Args:
+            canonical_id: 正規化した会話ID
+        
+        Returns:
+            note_guid と content_digest を持つ辞書、未登録の場合はNone
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT note_guid, content_digest FROM conversation_index WHERE canonical_id = ?',
+                (canonical_id,)
+            )
+            
+            result = cursor.fetchone()
+            conn.close()
+            
+            if result:
+                return {'note_guid': result[0], 'content_digest': result[1]}
+            return None
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話インデックス取得エラー: {e}")
+            return None
+    
+    def record_conversation(
+        self,
+        canonical_id: str,
+        note_guid: str,
+        content_digest: Optional[str],
+        source: str,
+        client_digest: Optional[str] = None,
+        note_content_hash: Optional[str] = None
+    ) -> bool:
+        """
+        会話IDインデックスにノートGUIDと本文ダイジェストを記録
+        
+        Args:
+            canonical_id: 正規化した会話ID
+            note_guid: EvernoteノートGUID
+            content_digest: 本文ダイジェスト
+            source: 取り込み経路（'extension' / 'export'）
+            client_digest: 拡張機能が計算した本文ダイジェスト（エクスポートの場合はNone）
+            note_content_hash: アップロードしたENMLのMD5（不明な場合はNone、照合時に採用）
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO conversation_index
+                    (canonical_id, note_guid, content_digest, source, client_digest,
+                     note_content_hash, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(canonical_id)
+                DO UPDATE SET note_guid = excluded.note_guid,
+                              content_digest = excluded.content_digest,
+                              source = excluded.source,
+                              client_digest = excluded.client_digest,
+                              note_content_hash = excluded.note_content_hash,
+                              updated_at = CURRENT_TIMESTAMP
+            ''', (canonical_id, note_guid, content_digest, source, client_digest,
+                  note_content_hash))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.debug(f"会話インデックスを記録: {canonical_id} -> {note_guid} ({source})")
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話インデックス記録エラー: {e}")
+            return False
+    
+    def get_note_mapping(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        会話IDインデックスをノートGUID単位で一括取得（Evernoteとの照合用）
+        
+        Returns:
+            ノートGUID → canonical_id と note_content_hash を持つ辞書
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT note_guid, canonical_id, note_content_hash FROM conversation_index'
+            )
+            mapping = {
+                note_guid: {'canonical_id': canonical_id, 'note_content_hash': content_hash}
+                for note_guid, canonical_id, content_hash in cursor.fetchall()
+            }
+            
+            conn.close()
+            return mapping
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話インデックス取得エラー: {e}")
+            return {}
+    
+    def apply_reconciliation(
+        self,
+        unlink: Dict[str, Optional[str]],
+        adopt_hashes: Dict[str, str]
+    ) -> bool:
+        """
+        Evernoteとの照合結果を1トランザクションで反映
+        
+        削除された・Evernote上で編集されたノートは対応を外し、次回の保存で
+        新しいノートを作成させる（更新の失敗や編集内容の上書きを防ぐ）。
+        照合中に保存が記録されたノート（ハッシュが判定時から変わったもの）は外さない。
+        
+        Args:
+            unlink: 対応を外すノートGUID → 判定時に記録されていたハッシュ
+            adopt_hashes: ノートGUID → contentHash（記録がなかったものを基準として採用）
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            unlinked = []
+            for guid, expected_hash in unlink.items():
+                cursor.execute(
+                    'DELETE FROM conversation_index WHERE note_guid = ? AND note_content_hash IS ?',
+                    (guid, expected_hash)
+                )
+                if cursor.rowcount:
+                    unlinked.append((guid,))
+            cursor.executemany('DELETE FROM import_progress WHERE note_guid = ?', unlinked)
+            cursor.executemany('DELETE FROM file_note_mapping WHERE note_guid = ?', unlinked)
+            cursor.executemany(
+                'UPDATE conversation_index SET note_content_hash = ? '
+                'WHERE note_guid = ? AND note_content_hash IS NULL',
+                [(content_hash, guid) for guid, content_hash in adopt_hashes.items()]
+            )
+            
+            conn.commit()
+            conn.close()
+            
+            logger.info(
+                f"照合結果を反映: 対応解除 {len(unlinked)}件 / "
+                f"ハッシュ採用 {len(adopt_hashes)}件"
+            )
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"照合結果の反映エラー: {e}")
+            return False
+    
+    def unlink_note(self, note_guid: str) -> bool:
+        """
+        Evernote上で削除されたノートの対応を外す（次の保存・取り込みで作成し直す）
+        
+        Args:
+            note_guid: 削除されていたノートGUID
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM conversation_index WHERE note_guid = ?', (note_guid,))
+            cursor.execute('DELETE FROM import_progress WHERE note_guid = ?', (note_guid,))
+            cursor.execute('DELETE FROM file_note_mapping WHERE note_guid = ?', (note_guid,))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.info(f"削除されたノートの対応を解除: {note_guid}")
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"ノートの対応解除エラー: {e}")
+            return False
+    
+    def get_sync_cursor(self) -> Optional[int]:
+        """
+        照合済みのEvernoteアカウントの updateCount を取得
+        
+        Returns:
+            updateCount、未照合の場合はNone
+        """
+        return self.get_sync_state('update_count')
+    
+    def set_sync_cursor(self, update_count: int) -> bool:
+        """
+        照合済みのEvernoteアカウントの updateCount を記録
+        
+        Args:
+            update_count: 照合が完了した時点の updateCount
+        
+        Returns:
+            成功した場合True
+        """
+        return self.set_sync_state('update_count', update_count)
+    
+    def get_sync_state(self, name: str) -> Optional[int]:
+        """
+        Evernoteとの照合・再構築の状態を取得
+        
+        Args:
+            name: 'update_count'（照合済みの updateCount）/ 'rebuild_offset'（再構築の再開位置）等
+        
+        Returns:
+            記録された値、未記録の場合はNone
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT value FROM evernote_sync_state WHERE name = ?', (name,))
+            result = cursor.fetchone()
+            
+            conn.close()
+            return result[0] if result else None
+            
+        except sqlite3.Error as e:
+            logger.error(f"照合状態の取得エラー: {e}")
+            return None
+    
+    def set_sync_state(self, name: str, value: Optional[int]) -> bool:
+        """
+        Evernoteとの照合・再構築の状態を記録
+        
+        Args:
+            name: 状態の名前
+            value: 記録する値（Noneの場合は削除）
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            if value is None:
+                cursor.execute('DELETE FROM evernote_sync_state WHERE name = ?', (name,))
+            else:
+                cursor.execute('''
+                    INSERT INTO evernote_sync_state (name, value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(name)
+                    DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+                ''', (name, value))
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"照合状態の記録エラー: {e}")
+            return False
+    
+    def restore_conversations(
+        self,
+        rows: List[tuple],
+        rebuild_offset: Optional[int] = None
+    ) -> bool:
+        """
+        Evernoteのノート属性から復元した会話IDインデックスを一括登録
+        （再開位置も同じトランザクションで記録）
+        
+        Args:
+            rows: (canonical_id, note_guid, content_digest, note_content_hash) のリスト
+            rebuild_offset: 次に取得するノートの位置
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                INSERT INTO conversation_index
+                    (canonical_id, note_guid, content_digest, source, note_content_hash, updated_at)
+                VALUES (?, ?, ?, 'recovered', ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(canonical_id)
+                DO UPDATE SET note_guid = excluded.note_guid,
+                              content_digest = excluded.content_digest,
+                              source = excluded.source,
+                              note_content_hash = excluded.note_content_hash,
+                              updated_at = CURRENT_TIMESTAMP
+            ''', rows)
+            if rebuild_offset is not None:
+                cursor.execute('''
+                    INSERT INTO evernote_sync_state (name, value, updated_at)
+                    VALUES ('rebuild_offset', ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(name)
+                    DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+                ''', (rebuild_offset,))
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話インデックスの復元エラー: {e}")
+            return False
+    
+    @staticmethod
+    def _pack_payload(payload: Dict) -> bytes:
+        """送信待ちの操作をzlib圧縮JSONに変換"""
+        return zlib.compress(
+            json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        )
+    
+    @staticmethod
+    def _unpack_payload(blob: bytes) -> Dict:
+        """zlib圧縮JSONから送信待ちの操作を復元"""
+        return json.loads(zlib.decompress(blob).decode('utf-8'))
+    
+    def enqueue_outbox(
+        self,
+        kind: str,
+        key: str,
+        payload: Dict,
+        next_attempt_at: float,
+        error: Optional[str] = None
+    ) -> bool:
+        """
+        Evernoteへの書き込みに失敗した操作を送信待ちに登録
+        （同じ kind・key の操作があれば内容を最新のものに置き換え、試行回数は引き継ぐ）
+        
+        再試行を始めた操作は、保存のたびにバックオフが最初に戻らないよう
+        次に試行する時刻を引き継ぐ。
+        
+        Args:
+            kind: 操作の種類（'save' 等）
+            key: 操作の対象（正規化した会話ID）
+            payload: 再試行に必要な内容
+            next_attempt_at: 次に試行する時刻（UNIX時間、再試行前の操作にのみ使う）
+            error: 失敗したときのエラー
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO outbox (kind, key, payload, next_attempt_at, last_error)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(kind, key)
+                DO UPDATE SET payload = excluded.payload,
+                              next_attempt_at = CASE
+                                  WHEN outbox.attempts > 0 THEN outbox.next_attempt_at
+                                  ELSE MIN(outbox.next_attempt_at, excluded.next_attempt_at)
+                              END,
+                              last_error = excluded.last_error
+            ''', (kind, key, self._pack_payload(payload), next_attempt_at, error))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.debug(f"送信待ちに登録: {kind} {key}")
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"送信待ちの登録エラー: {e}")
+            return False
+    
+    def get_due_outbox(self, now: float, limit: int = 20) -> List[Dict]:
+        """
+        試行時刻を過ぎた送信待ちの操作を取得
+        
+        Args:
+            now: 現在時刻（UNIX時間）
+            limit: 最大件数
+        
+        Returns:
+            id, kind, key, payload, attempts を持つ辞書のリスト（試行時刻の早い順）
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT id, kind, key, payload, attempts FROM outbox '
+                'WHERE next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?',
+                (now, limit)
+            )
+            rows = cursor.fetchall()
+            
+            conn.close()
+            return [
+                {
+                    'id': row_id,
+                    'kind': kind,
+                    'key': key,
+                    'payload': self._unpack_payload(payload),
+                    'attempts': attempts,
+                }
+                for row_id, kind, key, payload, attempts in rows
+            ]
+            
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.error(f"送信待ちの取得エラー: {e}")
+            return []
+    
+    def reschedule_outbox(
+        self,
+        outbox_id: int,
+        attempts: int,
+        next_attempt_at: float,
+        error: Optional[str]
+    ) -> bool:
+        """
+        送信待ちの操作の次の試行を設定
+        
+        Args:
+            outbox_id: 送信待ちのID
+            attempts: これまでの試行回数
+            next_attempt_at: 次に試行する時刻（UNIX時間）
+            error: 直近のエラー
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                (attempts, next_attempt_at, error, outbox_id)
+            )
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"送信待ちの更新エラー: {e}")
+            return False
+    
+    def get_outbox_payload(self, kind: str, key: str) -> Optional[Dict]:
+        """
+        送信待ちに登録されている操作の内容を取得
+        
+        Args:
+            kind: 操作の種類
+            key: 操作の対象
+        
+        Returns:
+            操作の内容（登録されていなければNone）
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT payload FROM outbox WHERE kind = ? AND key = ?', (kind, key))
+            row = cursor.fetchone()
+            
+            conn.close()
+            return self._unpack_payload(row[0]) if row else None
+            
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.error(f"送信待ちの取得エラー: {e}")
+            return None
+    
+    def remove_outbox(self, kind: str, key: str, payload: Optional[Dict] = None) -> bool:
+        """
+        送信待ちの操作を削除（再試行の成功時、または新しい内容で直接保存できた時）
+        
+        Args:
+            kind: 操作の種類
+            key: 操作の対象
+            payload: 指定した場合、内容が一致するときだけ削除する
+                （再試行中に新しい内容で登録し直された操作は残す）
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            if payload is None:
+                cursor.execute('DELETE FROM outbox WHERE kind = ? AND key = ?', (kind, key))
+            else:
+                cursor.execute(
+                    'DELETE FROM outbox WHERE kind = ? AND key = ? AND payload = ?',
+                    (kind, key, self._pack_payload(payload))
+                )
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"送信待ちの削除エラー: {e}")
+            return False
+    
+    def add_dead_letter(
+        self,
+        kind: str,
+        key: str,
+        payload: Dict,
+        attempts: int,
+        error: str
+    ) -> bool:
+        """
+        再試行しても成功しない操作を記録（送信待ちにあれば取り除く）
+        
+        Args:
+            kind: 操作の種類
+            key: 操作の対象
+            payload: 操作の内容
+            attempts: 試行回数
+            error: 最後のエラー
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'INSERT INTO dead_letter (kind, key, payload, attempts, error) VALUES (?, ?, ?, ?, ?)',
+                (kind, key, self._pack_payload(payload), attempts, error)
+            )
+            cursor.execute('DELETE FROM outbox WHERE kind = ? AND key = ?', (kind, key))
+            
+            conn.commit()
+            conn.close()
+            
+            logger.warning(f"☠️ 再試行を打ち切りました: {kind} {key}: {error}")
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"デッドレターの記録エラー: {e}")
+            return False
+    
+    def list_dead_letters(self, limit: int = 50) -> List[Dict]:
+        """
+        デッドレターを新しい順に取得（内容は本文を除いた要約のみ）
+        
+        Args:
+            limit: 最大件数
+        
+        Returns:
+            id, kind, key, title, message_count, attempts, error, failed_at を持つ辞書のリスト
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT id, kind, key, payload, attempts, error, failed_at FROM dead_letter '
+                'ORDER BY id DESC LIMIT ?',
+                (limit,)
+            )
+            rows = cursor.fetchall()
+            
+            conn.close()
+            
+        except sqlite3.Error as e:
+            logger.error(f"デッドレターの取得エラー: {e}")
+            return []
+        
+        dead_letters = []
+        for row_id, kind, key, payload, attempts, error, failed_at in rows:
+            try:
+                data = self._unpack_payload(payload)
+            except (zlib.error, ValueError):
+                data = {}
+            dead_letters.append({
+                'id': row_id,
+                'kind': kind,
+                'key': key,
+                'title': data.get('title'),
+                'message_count': len(data.get('messages') or []),
+                'attempts': attempts,
+                'error': error,
+                'failed_at': failed_at,
+            })
+        return dead_letters
+    
+    def get_outbox_count(self) -> int:
+        """
+        送信待ちの操作の件数を取得
+        
+        Returns:
+            件数
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT COUNT(*) FROM outbox')
+            count = cursor.fetchone()[0]
+            
+            conn.close()
+            return count
+            
+        except sqlite3.Error as e:
+            logger.error(f"送信待ち件数の取得エラー: {e}")
+            return 0
+    
+    def get_conversation_snapshot(self, canonical_id: str) -> Optional[List[Dict]]:
+        """
+        差分保存のベースとなる会話の最新メッセージを取得
+        
+        Args:
+            canonical_id: 正規化した会話ID
+        
+        Returns:
+            メッセージのリスト、未保存の場合はNone
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'SELECT messages FROM conversation_snapshot WHERE canonical_id = ?',
+                (canonical_id,)
+            )
+            
+            result = cursor.fetchone()
+            conn.close()
+            
+            if result:
+                return json.loads(zlib.decompress(result[0]))
+            return None
+            
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.error(f"会話スナップショット取得エラー: {e}")
+            return None
+    
+    def save_conversation_snapshot(
+        self,
+        canonical_id: str,
+        messages: List[Dict],
+        replace: bool = True
+    ) -> bool:
+        """
+        会話の最新メッセージを保存
+        
+        Args:
+            canonical_id: 正規化した会話ID
+            messages: メッセージのリスト
+            replace: Falseの場合、既に保存済みなら何もしない
+        
+        Returns:
+            成功した場合True
+        """
+        blob = zlib.compress(
+            json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        )
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+            cursor.execute(f'''
+                {verb} INTO conversation_snapshot (canonical_id, message_count, messages, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (canonical_id, len(messages), blob))
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話スナップショット保存エラー: {e}")
+            return False
+    
+    def set_client_digest(self, canonical_id: str, client_digest: Optional[str]) -> bool:
+        """
+        拡張機能が計算した本文ダイジェストのみを更新
+        
+        Args:
+            canonical_id: 正規化した会話ID
+            client_digest: 拡張機能が計算した本文ダイジェスト
+        
+        Returns:
+            成功した場合True
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                'UPDATE conversation_index SET client_digest = ? WHERE canonical_id = ?',
+                (client_digest, canonical_id)
+            )
+            
+            conn.commit()
+            conn.close()
+            return True
+            
+        except sqlite3.Error as e:
+            logger.error(f"クライアントダイジェスト更新エラー: {e}")
+            return False
+    
+    def find_stale_conversations(self, client_digests: Dict[str, str]) -> List[str]:
+        """
+        拡張機能のダイジェストと一致しない（未保存・変更あり）会話を一括判定
+        
+        Args:
+            client_digests: 正規化した会話ID → 拡張機能が計算した本文ダイジェスト
+        
+        Returns:
+            アップロードが必要な会話IDのリスト
+        """
+        stored: Dict[str, Optional[str]] = {}
+        ids = list(client_digests)
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            # SQLiteのバインド変数上限を超えないよう分割して照会
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(
+                    f'SELECT canonical_id, client_digest FROM conversation_index '
+                    f'WHERE canonical_id IN ({placeholders})',
+                    chunk
+                )
+                stored.update(cursor.fetchall())
+            
+            conn.close()
+            
+        except sqlite3.Error as e:
+            logger.error(f"会話状態の照会エラー: {e}")
+            # 判定できない場合はすべてアップロード対象とする
+            return ids
+        
+        return [
+            canonical_id for canonical_id, digest in client_digests.items()
+            if stored.get(canonical_id) != digest
+        ]
+    
+    def index_conversation(
+        self,
+        canonical_id: str,
+        note_guid: str,
+        title: str,
+        messages: List[Message]
+    ) -> None:
+        """
+        会話を全文検索索引の書き込み待ちに追加（書き込みはバックグラウンドでまとめて行う）
+        
+        Args:
+            canonical_id: 正規化した会話ID
+            note_guid: EvernoteノートGUID
+            title: 会話タイトル
+            messages: メッセージ（Message）のリスト
+        """
+        if not self.search_enabled:
+            return
+        row = self._search_row(canonical_id, note_guid, title, messages)
+        with self._search_cond:
+            self._search_pending[canonical_id] = row
+            if self._search_thread is None:
+                self._search_thread = threading.Thread(
+                    target=self._search_flush_loop, name='search-index', daemon=True
+                )
+                self._search_thread.start()
+            if len(self._search_pending) >= self.search_batch_size:
+                self._search_cond.notify()
+    
+    @staticmethod
+    def _search_row(
+        canonical_id: str,
+        note_guid: str,
+        title: str,
+        messages: List[Message]
+    ) -> tuple:
+        """全文検索索引の1行（本文はHTMLタグを除いたテキスト）"""
+        body = '\n'.join(
+            html.unescape(_HTML_TAG_RE.sub(' ', msg.content))
+            for msg in messages
+        )
+        return (canonical_id, note_guid, title or '', body)
+    
+    def _search_flush_loop(self) -> None:
+        """書き込み待ちが一定件数になるか一定時間経ったら索引に書き込む"""
+        while True:
+            with self._search_cond:
+                while not self._search_pending:
+                    self._search_cond.wait()
+                self._search_cond.wait_for(
+                    lambda: len(self._search_pending) >= self.search_batch_size,
+                    timeout=self.search_flush_interval
+                )
+            self.flush_search_index()
+    
+    def flush_search_index(self) -> int:
+        """
+        書き込み待ちの会話を1トランザクションで全文検索索引に反映
+        
+        Returns:
+            反映した件数
+        """
+        # 取り出しから書き込みまでを直列化（古い行が新しい行を上書きしないように）
+        with self._search_write_lock:
+            with self._search_cond:
+                rows = list(self._search_pending.values())
+                self._search_pending.clear()
+            if not rows:
+                return 0
+            return self._write_search_rows(rows)
+    
+    def _write_search_rows(self, rows: List[tuple]) -> int:
+        """全文検索索引の行を置き換え"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.executemany(
+                'DELETE FROM conversation_search WHERE canonical_id = ?',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                'INSERT INTO conversation_search (canonical_id, note_guid, title, body) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+            
+            conn.commit()
+            conn.close()
+            
+            logger.debug(f"全文検索索引を更新: {len(rows)}件")
+            return len(rows)
+            
+        except sqlite3.Error as e:
+            logger.error(f"全文検索索引の更新エラー: {e}")
+            return 0
+    
+    def search_conversations(self, query: str, limit: int = 20) -> List[Dict[str, str]]:
+        """
+        会話ID・タイトル・本文・ノートGUIDを全文検索
+        
+        Args:
+            query: 検索語（空白区切りですべてを含む会話を検索）
+            limit: 最大件数
+        
+        Returns:
+            検索結果のリスト（canonical_id, note_guid, title, snippet）
+        """
+        terms = _SEARCH_TERM_RE.findall(query or '')
+        if not self.search_enabled or not terms:
+            return []
+        
+        # 書き込み待ちも検索対象にする
+        self.flush_search_index()
+        
+        # 各語をフレーズとして扱う（FTS5の演算子として解釈させない）
+        # trigramで引けない短い語は LIKE で絞り込む
+        min_length = _TRIGRAM_MIN_LENGTH if self.search_trigram else 1
+        match_terms = ['"' + t.replace('"', '""') + '"' for t in terms if len(t) >= min_length]
+        like_terms = [t for t in terms if len(t) < min_length]
+        
+        conditions = []
+        params: List[object] = []
+        if match_terms:
+            conditions.append('conversation_search MATCH ?')
+            params.append(' '.join(match_terms))
+        for term in like_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append(
+                "(title LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\' "
+                "OR canonical_id LIKE ? ESCAPE '\\' OR note_guid LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern] * 4)
+        params.append(limit)
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT canonical_id, note_guid, title,
+                       snippet(conversation_search, 3, '[', ']', '…', 16)
+                FROM conversation_search
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {'rank' if match_terms else 'rowid DESC'}
+                LIMIT ?
+            ''', params)
+            results = [
+                {'canonical_id': row[0], 'note_guid': row[1], 'title': row[2], 'snippet': row[3]}
+                for row in cursor.fetchall()
+            ]
+            
+            conn.close()
+            return results
+            
+        except sqlite3.Error as e:
+            logger.error(f"全文検索エラー: {e}")
+            return []
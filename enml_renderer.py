@@ -0,0 +1,74 @@
+"""
+ENMLレンダリングモジュール
+会話データをEvernoteのENML形式に変換する（サーバー・一括インポート共通）
+"""
+import re
+
+
+def format_conversation_to_enml(title, messages, url):
+    """
+    会話をENML形式に変換
+    
+    Args:
+        title: 会話タイトル
+        messages: メッセージ（Message）のリスト
+        url: 元の会話のURL
+    
+    Returns:
+        ENML形式の文字列
+    """
+    enml = '<?xml version="1.0" encoding="UTF-8"?>'
+    enml += '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">'
+    enml += '<en-note>'
+    
+    # タイトル
+    enml += f'<h1>{escape_html(title)}</h1>'
+    
+    # URL
+    if url:
+        enml += f'<p><a href="{escape_html(url)}">元の会話を開く</a></p>'
+    
+    enml += '<hr/>'
+    
+    # メッセージ
+    for msg in messages:
+        role = msg.role
+        content = msg.content
+        
+        # HTMLタグとカスタム属性を削除してプレーンテキストに
+        # ENMLでは限られたタグのみ許可されているため
+        cleaned_content = re.sub(r'<[^>]+>', '', str(content))
+        cleaned_content = escape_html(cleaned_content)
+        # 改行を<br/>に変換
+        cleaned_content = cleaned_content.replace('\n', '<br/>')
+        
+        if role == 'user':
+            enml += '<div><strong>👤 あなた:</strong><br/>'
+        else:
+            enml += '<div><strong>🤖 ChatGPT:</strong><br/>'
+        
+        enml += cleaned_content
+        
+        # 添付（ノートのリソースをMD5で参照）
+        for attachment in msg.attachments:
+            if attachment.get('md5'):
+                enml += (f'<br/><en-media type="{escape_html(attachment["mime"])}" '
+                         f'hash="{attachment["md5"]}"/>')
+        
+        enml += '</div><br/>'
+    
+    enml += '</en-note>'
+    
+    return enml
+
+
+def escape_html(text):
+    """HTML特殊文字をエスケープ"""
+    if not text:
+        return ''
+    return (str(text)
+            .replace('&', '&amp;')
+            .replace('<', '&lt;')
+            .replace('>', '&gt;')
+            .replace('"', '&quot;')
+            .replace("'", '&#39;'))
@@ -3,77 +3,122 @@ ChatGPT to Evernote - ローカルサーバー
 
 Chrome拡張からのリクエストを受けてEvernoteに保存する
 アプリケーション化対応:ダブルクリック起動、システムトレイ常駐
+--headless で起動するとトレイ・画像ライブラリ（pystray, PIL）を読み込まずに待ち受ける
+（画面のないLinuxサーバー向け）
 """
 
+import time
+
+# 起動時間の計測基準（以降のモジュール読み込みを含めて計測する）
+_started_at = time.perf_counter()
+
+import argparse
 import sys
 import os
+import json
 import logging
+import signal
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pystray
-from PIL import Image, ImageDraw
 import threading
 import webbrowser
 
 # プロジェクトのルートディレクトリをパスに追加
 sys.path.insert(0, str(Path(__file__).parent))
 
-from evernote_sync import EvernoteSync
+from evernote_sync import EvernoteSync, EvernoteWriteError, NoteNotFoundError, RateLimitError
+from circuit_breaker import CircuitOpenError
+from bulk_import import BulkImporter
+from chatgpt_export import ChatGPTExportParser
 from duplicate_manager import DuplicateManager
-from config import Config
-
-# ログ設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('evernote_server.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from config import Config, ConfigSnapshot
+from conversation_model import Message
+from enml_renderer import format_conversation_to_enml
+from request_tracing import RequestTrace, setup_logging
+from request_codec import UnsupportedEncodingError, decode_body
+from reconcile import Reconciler
+from outbox import OutboxRetrier
+from single_flight import SingleFlight
+from upload_scheduler import LANE_BULK, LANE_INTERACTIVE, LANE_SCHEDULED, UploadScheduler
+import profiling
+
+# 起動時間の内訳（ミリ秒、/api/health でも返す）
+startup_timings = {'import_ms': round((time.perf_counter() - _started_at) * 1000, 1)}
+
+# ログ設定（QueueListener経由でリクエストスレッド外に書き出す）
+log_listener = setup_logging('evernote_server.log', 'evernote_trace.log')
 logger = logging.getLogger(__name__)
 
 # Flask設定
 app = Flask(__name__)
-CORS(app)  # Chrome拡張からのアクセス許可
+# Chrome拡張からのアクセス許可（送信ペース調整用のヘッダーも読めるようにする）
+CORS(app, expose_headers=['X-Trace-Id', 'X-Queue-Depth', 'Retry-After'])
 
 # グローバル変数
 evernote = None
 duplicate_manager = None
+backfill_importer = None
+outbox_retrier = None
+save_flights = SingleFlight()
+upload_scheduler = UploadScheduler()
 server_thread = None
 icon = None
+slow_request_threshold_ms = 3000.0
+app_config = None
+
+# 処理中の保存リクエスト数（X-Queue-Depth として拡張機能に返す）
+_saves_in_flight = 0
+_saves_lock = threading.Lock()
+
+
+def apply_config_change(old: ConfigSnapshot, new: ConfigSnapshot) -> None:
+    """再読み込みした設定のうち、実行中に切り替えられるものを反映"""
+    global slow_request_threshold_ms
+
+    slow_request_threshold_ms = new.slow_request_threshold_ms
+    save_flights.debounce = new.save_debounce_ms / 1000
+    upload_scheduler.starvation_seconds = new.upload_starvation_seconds
+    upload_scheduler.set_max_slots(new.upload_slots)
+    profiling.configure(
+        enabled=new.profile_enabled,
+        output_dir=new.profile_dir,
+        top_n=new.profile_top_n,
+        max_runs=new.profile_max_runs
+    )
 
 
 def initialize_services():
     """サービス初期化"""
-    global evernote, duplicate_manager
+    global evernote, duplicate_manager, backfill_importer, outbox_retrier
+    global slow_request_threshold_ms, app_config
     
+    init_started = time.perf_counter()
     try:
         logger.info("🔧 サービス初期化中...")
         
         # 設定読み込み
         config = Config()
-        
+        app_config = config
+        slow_request_threshold_ms = config.slow_request_threshold_ms
+        save_flights.debounce = config.save_debounce_ms / 1000
+        upload_scheduler.starvation_seconds = config.upload_starvation_seconds
+        upload_scheduler.set_max_slots(config.upload_slots)
+        profiling.configure(
+            enabled=config.profile_enabled,
+            output_dir=config.profile_dir,
+            top_n=config.profile_top_n,
+            max_runs=config.profile_max_runs
+        )
+
+        # .env の変更・SIGHUP で設定を再読み込み（認証情報等は再起動で反映）
+        config.add_reload_listener(apply_config_change)
+        config.start_watching()
+        config.install_reload_signal()
+
         # Evernote接続
-        # サンドボックス環境かどうか
-        sandbox = config.evernote_environment == 'sandbox'
-        
-        # OAuth認証の場合
-        if config.use_oauth:
-            evernote = EvernoteSync(
-                notebook_name=config.evernote_notebook_name,
-                sandbox=sandbox,
-                consumer_key=config.evernote_consumer_key,
-                consumer_secret=config.evernote_consumer_secret
-            )
-        # Developer Token の場合
-        else:
-            evernote = EvernoteSync(
-                notebook_name=config.evernote_notebook_name,
-                sandbox=sandbox,
-                api_token=config.evernote_api_token
-            )
+        evernote = EvernoteSync.from_config(config)
         
         logger.info("✅ Evernote接続成功")
         
@@ -82,6 +127,31 @@ def initialize_services():
         duplicate_manager = DuplicateManager(db_path=db_path)
         logger.info("✅ 重複管理初期化完了")
         
+        # バックフィル（拡張機能が会話履歴を1件ずつ送信）はエクスポート取り込みと同じ経路で処理
+        export_dir = os.path.join(str(Path.home() / "Downloads"), "ChatGPT_Exports")
+        backfill_importer = BulkImporter(
+            ChatGPTExportParser(export_dir),
+            evernote,
+            duplicate_manager,
+            tags=['ChatGPT', 'バックフィル'],
+            # Evernoteへの書き込みだけを手動保存・定期同期の後に回す
+            # （変更なし・取り込み済みの会話は枠を使わない）
+            upload_slot=lambda: upload_scheduler.slot(LANE_BULK)
+        )
+        
+        # 保存に失敗した会話をバックグラウンドで再試行（再起動後も送信待ちから再開）
+        outbox_retrier = OutboxRetrier(duplicate_manager, {'save': replay_save})
+        outbox_retrier.start()
+        
+        # Evernoteとの定期照合（変更がなければ1回のAPI呼び出しで終わる）
+        threading.Thread(
+            target=reconcile_loop,
+            args=(Reconciler(evernote, duplicate_manager),),
+            name='reconcile',
+            daemon=True
+        ).start()
+        
+        startup_timings['init_ms'] = round((time.perf_counter() - init_started) * 1000, 1)
         return True
         
     except Exception as e:
@@ -89,129 +159,598 @@ def initialize_services():
         return False
 
 
+def reconcile_loop(reconciler: Reconciler) -> None:
+    """設定された間隔でEvernoteと照合する（間隔は再読み込みした設定に従う）"""
+    while True:
+        interval = app_config.reconcile_interval_minutes
+        if interval <= 0:
+            # 無効の間も設定の再読み込みで有効になるよう、定期的に確認する
+            time.sleep(60)
+            continue
+        time.sleep(interval * 60)
+        try:
+            stats = reconciler.run()
+            if stats['mode'] != 'unchanged':
+                logger.info(
+                    f"🔁 Evernote照合: {stats['checked']}件 "
+                    f"（削除・移動 {stats['missing']}件 / 編集 {stats['edited']}件）"
+                )
+        except RateLimitError as e:
+            logger.warning(f"⏳ Evernote照合がレート制限で中断: {e.duration}秒後以降に再実行します")
+            time.sleep(e.duration)
+        except CircuitOpenError as e:
+            logger.warning(f"⏸️ Evernote照合を中止（接続停止中）: {e}")
+        except Exception as e:
+            logger.error(f"❌ Evernote照合エラー: {e}", exc_info=True)
+
+
+def get_health() -> Dict:
+    """ヘルスチェック応答"""
+    health = {
+        'status': 'ok',
+        'service': 'ChatGPT to Evernote',
+        'version': '1.0.0',
+        'startup': startup_timings
+    }
+    if evernote is not None:
+        # 回路遮断中（Evernote障害中）は保存が送信待ちに回る
+        health['evernote_circuit'] = evernote.breaker.snapshot()
+    health['uploads'] = upload_scheduler.snapshot()
+    return health
+
+
+def mark_ready() -> None:
+    """待ち受け開始までの時間を記録"""
+    startup_timings['ready_ms'] = round((time.perf_counter() - _started_at) * 1000, 1)
+    logger.info(
+        f"⏱️ 起動完了: 読み込み {startup_timings['import_ms']}ms / "
+        f"初期化 {startup_timings.get('init_ms', 0)}ms / "
+        f"待ち受け開始まで {startup_timings['ready_ms']}ms"
+    )
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """ヘルスチェック"""
-    return jsonify({
-        'status': 'ok',
-        'service': 'ChatGPT to Evernote',
-        'version': '1.0.0'
-    })
+    return jsonify(get_health())
 
 
 @app.route('/api/save', methods=['POST'])
 def save_conversation():
     """Chrome拡張から会話を受け取ってEvernoteに保存"""
+    return _run_evernote_request(handle_save)
+
+
+@app.route('/api/backfill', methods=['POST'])
+def backfill_conversation():
+    """Chrome拡張が会話履歴から取得した会話（エクスポート形式）を取り込む"""
+    return _run_evernote_request(handle_backfill)
+
+
+def _run_evernote_request(handler):
+    """Evernoteに書き込むリクエストを処理し、送信ペース調整用のヘッダーを付ける"""
+    global _saves_in_flight
+    with _saves_lock:
+        _saves_in_flight += 1
+    try:
+        body, status = handler(request.get_data(), request.headers.get('Content-Encoding'))
+    finally:
+        with _saves_lock:
+            _saves_in_flight -= 1
+            queue_depth = _saves_in_flight
+    response = jsonify(body)
+    response.headers['X-Trace-Id'] = body['trace_id']
+    response.headers['X-Queue-Depth'] = str(queue_depth)
+    if body.get('retry_after') is not None:
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response, status
+
+
+@app.route('/api/status', methods=['POST'])
+def conversation_status():
+    """拡張機能のダイジェストと比較し、アップロードが必要な会話を返す"""
+    body, status = handle_status(request.get_data(), request.headers.get('Content-Encoding'))
+    return jsonify(body), status
+
+
+@app.route('/api/dead-letters', methods=['GET'])
+def dead_letters():
+    """再試行を打ち切った保存の一覧"""
+    body, status = handle_dead_letters(request.args.get('limit'))
+    return jsonify(body), status
+
+
+@app.route('/api/search', methods=['GET'])
+def search_conversations():
+    """会話の全文検索（会話ID・タイトル・本文・ノートGUID）"""
+    body, status = handle_search(request.args.get('q', ''), request.args.get('limit'))
+    return jsonify(body), status
+
+
+def handle_search(query: str, limit: Optional[str] = None) -> Tuple[Dict, int]:
+    """
+    全文検索を処理（Flask・非同期サーバー共通）
+    
+    Args:
+        query: 検索語（空白区切りですべてを含む会話を検索）
+        limit: 最大件数（1〜100、省略時20）
+    
+    Returns:
+        レスポンス本文とHTTPステータスコード
+    """
+    try:
+        limit_value = min(max(int(limit or 20), 1), 100)
+    except ValueError:
+        return {'success': False, 'error': f'無効なlimit: {limit}'}, 400
+    
+    results = duplicate_manager.search_conversations(query, limit=limit_value)
+    return {
+        'success': True,
+        'query': query,
+        'results': [
+            dict(result, url=f"https://chatgpt.com/c/{result['canonical_id']}")
+            for result in results
+        ]
+    }, 200
+
+
+def handle_dead_letters(limit: Optional[str] = None) -> Tuple[Dict, int]:
+    """
+    デッドレターの一覧を返す（Flask・非同期サーバー共通）
+    
+    Args:
+        limit: 最大件数（1〜200、省略時50）
+    
+    Returns:
+        レスポンス本文とHTTPステータスコード
+    """
+    try:
+        limit_value = min(max(int(limit or 50), 1), 200)
+    except ValueError:
+        return {'success': False, 'error': f'無効なlimit: {limit}'}, 400
+    
+    return {
+        'success': True,
+        'dead_letters': duplicate_manager.list_dead_letters(limit=limit_value),
+        'outbox_pending': duplicate_manager.get_outbox_count()
+    }, 200
+
+
+def handle_status(raw_body: bytes, content_encoding: Optional[str] = None) -> Tuple[Dict, int]:
+    """
+    会話状態の照会を処理（Flask・非同期サーバー共通）
+    
+    リクエスト: {"conversations": [{"conversationId": "...", "digest": "..."}]}
+    レスポンス: {"success": true, "stale": ["conversationId", ...]}
+    
+    Args:
+        raw_body: リクエスト本文（JSON、gzip/deflate圧縮可）
+        content_encoding: Content-Encodingヘッダーの値
+    
+    Returns:
+        レスポンス本文とHTTPステータスコード
+    """
+    try:
+        data = json.loads(decode_body(raw_body, content_encoding))
+        items = data.get('conversations', []) if isinstance(data, dict) else []
+        
+        # 正規化した会話ID → リクエスト上の会話ID
+        requested = {}
+        client_digests = {}
+        for item in items:
+            conversation_id = item.get('conversationId', '')
+            if not conversation_id:
+                continue
+            canonical_id = duplicate_manager.canonical_conversation_id(conversation_id)
+            requested[canonical_id] = conversation_id
+            client_digests[canonical_id] = item.get('digest', '')
+        
+        stale = duplicate_manager.find_stale_conversations(client_digests)
+        logger.info(f"🔎 状態照会: {len(client_digests)}件中 {len(stale)}件が要アップロード")
+        
+        return {
+            'success': True,
+            'stale': [requested[canonical_id] for canonical_id in stale]
+        }, 200
+        
+    except Exception as e:
+        logger.error(f"❌ 状態照会エラー: {e}", exc_info=True)
+        return {'success': False, 'error': str(e)}, 400
+
+
+def handle_backfill(raw_body: bytes, content_encoding: Optional[str] = None) -> Tuple[Dict, int]:
+    """
+    バックフィルの会話1件を処理（Flask・非同期サーバー共通）
+    
+    リクエスト: {"conversation": {...}}（conversations.json と同じ mapping 形式）
+    取り込み済みで update_time が変わっていない会話はスキップするため、
+    拡張機能側が中断・再開して同じ会話を再送しても重複しない。
+    
+    Args:
+        raw_body: リクエスト本文（JSON、gzip/deflate圧縮可）
+        content_encoding: Content-Encodingヘッダーの値
+    
+    Returns:
+        レスポンス本文とHTTPステータスコード
+    """
+    trace = RequestTrace('api.backfill', slow_threshold_ms=slow_request_threshold_ms)
+    try:
+        trace.set(wire_bytes=len(raw_body), content_encoding=content_encoding or 'identity')
+        with trace.span('parse'):
+            data = json.loads(decode_body(raw_body, content_encoding))
+            raw_conversation = data.get('conversation') if isinstance(data, dict) else None
+            if not isinstance(raw_conversation, dict):
+                raise ValueError("リクエスト本文に会話データがありません")
+            # backend-api の応答は id ではなく conversation_id を持つ
+            if not raw_conversation.get('id') and raw_conversation.get('conversation_id'):
+                raw_conversation = dict(raw_conversation, id=raw_conversation['conversation_id'])
+            conversation = backfill_importer.parser._parse_conversation(raw_conversation)
+        if not conversation or not conversation.id:
+            raise ValueError("会話データを解析できませんでした")
+        trace.set(conversation_id=conversation.id, message_count=len(conversation.messages))
+        
+        with trace.span('import'):
+            action = backfill_importer.import_conversation(conversation, source='backfill')
+        trace.set(action=action)
+        logger.info(f"📚 バックフィル: {conversation.title} ({action})")
+        trace.finish('ok' if action != 'failed' else 'error')
+        
+        return {
+            'success': action != 'failed',
+            'action': action,
+            'conversation_id': conversation.id,
+            'trace_id': trace.trace_id
+        }, 200 if action != 'failed' else 502
+        
+    except RateLimitError as e:
+        logger.warning(f"⏳ レート制限 [{trace.trace_id}]: {e.duration}秒後に再試行")
+        trace.set(error=str(e), rate_limit_duration=e.duration)
+        trace.finish('error')
+        return {
+            'success': False,
+            'error': str(e),
+            'retry_after': e.duration,
+            'trace_id': trace.trace_id
+        }, 429
+        
+    except UnsupportedEncodingError as e:
+        trace.set(error=str(e))
+        trace.finish('error')
+        return {'success': False, 'error': str(e), 'trace_id': trace.trace_id}, 415
+        
+    except Exception as e:
+        logger.error(f"❌ バックフィルエラー [{trace.trace_id}]: {e}", exc_info=True)
+        trace.set(error=str(e))
+        trace.finish('error')
+        return {'success': False, 'error': str(e), 'trace_id': trace.trace_id}, 500
+
+
+@profiling.profiled('save_conversation')
+def handle_save(raw_body: bytes, content_encoding: Optional[str] = None) -> Tuple[Dict, int]:
+    """
+    保存リクエストを処理（Flask・非同期サーバー共通）
+    
+    baseCount を含むリクエストは差分保存として扱い、サーバーに保存済みの
+    先頭 baseCount 件のメッセージに続けて受信したメッセージを連結する。
+    先頭部分のダイジェスト（baseDigest）が一致しない場合は 409 で全件送信を求める。
+    同じ会話の保存が処理中・SAVE_DEBOUNCE_MS 以内に重なった場合は最新の内容で
+    1回だけアップロードし、すべてのリクエストに同じ結果を返す。
+    Evernoteへの書き込みが一時的に失敗した場合は送信待ちに登録して 202 を返し、
+    バックグラウンドで再試行する（ENMLの検証エラー等は 422 でデッドレターに記録）。
+    
+    Args:
+        raw_body: リクエスト本文（JSON、gzip/deflate圧縮可）
+        content_encoding: Content-Encodingヘッダーの値
+    
+    Returns:
+        レスポンス本文とHTTPステータスコード
+    """
+    trace = RequestTrace('api.save', slow_threshold_ms=slow_request_threshold_ms)
     try:
-        data = request.json
+        trace.set(wire_bytes=len(raw_body), content_encoding=content_encoding or 'identity')
+        with trace.span('parse'):
+            data = json.loads(decode_body(raw_body, content_encoding))
+        if not isinstance(data, dict):
+            raise ValueError("リクエスト本文が会話データではありません")
         
         conversation_id = data.get('conversationId', '')
         title = data.get('title', 'ChatGPT会話')
         messages = data.get('messages', [])
         url = data.get('url', '')
+        base_count = data.get('baseCount')
+        base_digest = data.get('baseDigest')
+        client_digest = data.get('clientDigest')
+        # 拡張機能の定期同期は手動保存より後に回す
+        lane = LANE_SCHEDULED if data.get('priority') == LANE_SCHEDULED else LANE_INTERACTIVE
+        trace.set(conversation_id=conversation_id, message_count=len(messages), lane=lane)
         
-        logger.info(f"📥 会話受信: {title} (ID: {conversation_id})")
+        logger.info(f"📥 会話受信 [{trace.trace_id}]: {title} (ID: {conversation_id})")
         
-        # Evernote形式に変換
-        content = format_conversation_to_enml(title, messages, url)
+        # エクスポート経由の取り込みと同じ会話IDに正規化
+        canonical_id = duplicate_manager.canonical_conversation_id(conversation_id or url)
         
-        # 既存ノートをチェック
-        existing_guid = duplicate_manager.get_note_guid_by_path(conversation_id)
+        if base_count is not None:
+            # 差分保存: 保存済みメッセージの先頭 base_count 件に連結
+            with trace.span('delta.merge'):
+                base = duplicate_manager.get_conversation_snapshot(canonical_id)
+            # 編集・再生成で先頭部分が変わっていれば連結しない
+            if (base is None or not 0 <= base_count <= len(base)
+                    or base_digest != duplicate_manager.compute_client_digest(base[:base_count])):
+                logger.info(f"↩️ 差分のベース不一致、全件送信を要求: {title}")
+                trace.set(action='delta_mismatch')
+                trace.finish('ok')
+                return {
+                    'success': False,
+                    'error': 'delta_base_mismatch',
+                    'ack_count': len(base) if base else 0,
+                    'trace_id': trace.trace_id
+                }, 409
+            messages = base[:base_count] + messages
+            trace.set(delta=True, message_count=len(messages))
         
-        if existing_guid:
-            # 更新
-            logger.info(f"🔄 既存ノート更新: {title}")
-            note_guid = evernote.update_note(
-                note_guid=existing_guid,
-                title=title,
-                content=content
-            )
-            action = 'updated'
-        else:
-            # 新規作成
-            logger.info(f"✨ 新規ノート作成: {title}")
-            note_guid = evernote.create_note(
-                title=title,
-                content=content,
-                tags=['ChatGPT', '自動同期']
-            )
-            
-            if note_guid:
-                # GUID保存
-                duplicate_manager.save_note_guid_for_path(conversation_id, note_guid)
-                action = 'created'
-            else:
-                raise Exception("ノート作成に失敗しました")
+        # 同じ会話の保存が重なった場合は1回のアップロードにまとめる（最新の内容が勝つ）
+        outcome, coalesced = save_flights.run(canonical_id, {
+            'conversationId': canonical_id,
+            'title': title,
+            'url': url,
+            'messages': messages,
+            'clientDigest': client_digest
+        }, lambda latest: commit_save(trace, latest, lane))
+        action = outcome['action']
+        trace.set(action=action, coalesced=coalesced)
+        
+        if action in ('dead_letter', 'failed'):
+            trace.set(error=outcome['error'])
+            trace.finish('error')
+            return {
+                'success': False,
+                'error': outcome['error'],
+                'action': action,
+                'trace_id': trace.trace_id
+            }, 422 if action == 'dead_letter' else 502
         
-        logger.info(f"✅ 保存完了: {title}")
+        if action == 'queued':
+            message = f'送信待ちに登録: {title}'
+        elif action == 'unchanged':
+            logger.info(f"⏭️ 変更なし: {title}")
+            message = f'変更なし: {title}'
+        else:
+            logger.info(f"✅ 保存完了: {title}")
+            message = f'保存完了: {title}'
+        trace.finish('ok')
         
-        return jsonify({
+        body = {
             'success': True,
-            'note_guid': note_guid,
             'action': action,
-            'message': f'保存完了: {title}'
-        })
+            'message': message,
+            'ack_count': len(messages),
+            'trace_id': trace.trace_id
+        }
+        if outcome.get('note_guid'):
+            body['note_guid'] = outcome['note_guid']
+        return body, 202 if action == 'queued' else 200
+        
+    except RateLimitError as e:
+        # 拡張機能には Retry-After で待機時間を伝え、送信を一時停止させる
+        logger.warning(f"⏳ レート制限 [{trace.trace_id}]: {e.duration}秒後に再試行")
+        trace.set(error=str(e), rate_limit_duration=e.duration)
+        trace.finish('error')
+        return {
+            'success': False,
+            'error': str(e),
+            'retry_after': e.duration,
+            'trace_id': trace.trace_id
+        }, 429
+        
+    except UnsupportedEncodingError as e:
+        logger.warning(f"⚠️ 未対応の圧縮形式 [{trace.trace_id}]: {e}")
+        trace.set(error=str(e))
+        trace.finish('error')
+        return {
+            'success': False,
+            'error': str(e),
+            'trace_id': trace.trace_id
+        }, 415
         
     except Exception as e:
-        logger.error(f"❌ 保存エラー: {e}", exc_info=True)
-        return jsonify({
+        logger.error(f"❌ 保存エラー [{trace.trace_id}]: {e}", exc_info=True)
+        trace.set(error=str(e))
+        trace.finish('error')
+        return {
             'success': False,
-            'error': str(e)
-        }), 500
+            'error': str(e),
+            'trace_id': trace.trace_id
+        }, 500
 
 
-def format_conversation_to_enml(title, messages, url):
-    """会話をENML形式に変換"""
-    import re
+def write_conversation(
+    trace: RequestTrace,
+    canonical_id: str,
+    title: str,
+    url: str,
+    messages: List[Dict],
+    client_digest: Optional[str] = None,
+    lane: str = LANE_INTERACTIVE
+) -> Tuple[str, str]:
+    """
+    会話をEvernoteに書き込み、対応表・スナップショット・検索インデックスを更新
+    （保存リクエストと送信待ちの再試行で共通）
     
-    enml = '<?xml version="1.0" encoding="UTF-8"?>'
-    enml += '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">'
-    enml += '<en-note>'
+    Args:
+        trace: ステージを記録するトレース
+        canonical_id: 正規化した会話ID
+        title: 会話タイトル
+        url: 会話URL
+        messages: 全メッセージ（受信形式のdict）
+        client_digest: 拡張機能側のダイジェスト
+        lane: アップロードの優先度（同時アップロード数の枠を優先度順に割り当てる）
     
-    # タイトル
-    enml += f'<h1>{escape_html(title)}</h1>'
+    Returns:
+        (ノートGUID, 'unchanged' / 'created' / 'updated')
     
-    # URL
-    if url:
-        enml += f'<p><a href="{escape_html(url)}">元の会話を開く</a></p>'
+    Raises:
+        EvernoteWriteError: ノートの作成・更新に失敗した場合
+        RateLimitError: Evernoteのレート制限に達した場合
+    """
+    # スナップショットは受信形式（dict）のまま保存し、ダイジェスト・レンダリングはMessageで行う
+    records = [Message.from_dict(m) for m in messages]
+    content_digest = duplicate_manager.compute_content_digest(records)
     
-    enml += '<hr/>'
+    # 既存ノートをチェック
+    with trace.span('lookup'):
+        existing = duplicate_manager.lookup_conversation(canonical_id)
     
-    # メッセージ
-    for msg in messages:
-        role = msg.get('role', 'unknown')
-        content = msg.get('content', '')
-        
-        # HTMLタグとカスタム属性を削除してプレーンテキストに
-        # ENMLでは限られたタグのみ許可されているため
-        cleaned_content = re.sub(r'<[^>]+>', '', str(content))
-        cleaned_content = escape_html(cleaned_content)
-        # 改行を<br/>に変換
-        cleaned_content = cleaned_content.replace('\n', '<br/>')
-        
-        if role == 'user':
-            enml += '<div><strong>👤 あなた:</strong><br/>'
-        else:
-            enml += '<div><strong>🤖 ChatGPT:</strong><br/>'
-        
-        enml += cleaned_content
-        enml += '</div><br/>'
+    if existing and existing['content_digest'] == content_digest:
+        # 内容に変更がなければEvernoteへのアップロードを省略
+        duplicate_manager.save_conversation_snapshot(canonical_id, messages, replace=False)
+        if client_digest:
+            duplicate_manager.set_client_digest(canonical_id, client_digest)
+        return existing['note_guid'], 'unchanged'
+    
+    # Evernote形式に変換
+    with trace.span('render'):
+        content = format_conversation_to_enml(title, records, url)
+    trace.set(content_bytes=len(content))
+    
+    # 同時アップロード数の枠を優先度順に待つ
+    queued_at = time.perf_counter()
+    with upload_scheduler.slot(lane):
+        trace.set(
+            upload_wait_ms=round((time.perf_counter() - queued_at) * 1000, 1),
+            concurrency_limit=upload_scheduler.slots
+        )
+        action = None
+        if existing:
+            # 更新
+            logger.info(f"🔄 既存ノート更新: {title}")
+            try:
+                with trace.span('evernote.update'):
+                    evernote.update_note(
+                        note_guid=existing['note_guid'],
+                        title=title,
+                        content=content,
+                        conversation_id=canonical_id,
+                        content_digest=content_digest
+                    )
+                note_guid = existing['note_guid']
+                action = 'updated'
+            except NoteNotFoundError:
+                # Evernote上で削除されたノート: 対応を外して新しいノートを作成
+                duplicate_manager.unlink_note(existing['note_guid'])
+        if action is None:
+            # 新規作成
+            logger.info(f"✨ 新規ノート作成: {title}")
+            with trace.span('evernote.create'):
+                note_guid = evernote.create_note(
+                    title=title,
+                    content=content,
+                    tags=['ChatGPT', '自動同期'],
+                    conversation_id=canonical_id,
+                    content_digest=content_digest
+                )
+            action = 'created'
+    
+    # GUIDとダイジェストを保存
+    with trace.span('mapping.save'):
+        duplicate_manager.record_conversation(
+            canonical_id, note_guid, content_digest, source='extension',
+            client_digest=client_digest,
+            note_content_hash=evernote.content_hash(content)
+        )
+        duplicate_manager.save_conversation_snapshot(canonical_id, messages)
+        duplicate_manager.index_conversation(canonical_id, note_guid, title, records)
+    
+    return note_guid, action
+
+
+def commit_save(trace: RequestTrace, payload: Dict, lane: str = LANE_INTERACTIVE) -> Dict:
+    """
+    保存を書き込み、一時的な失敗は送信待ちに、再試行しても成功しないものはデッドレターに登録
+    
+    Args:
+        trace: ステージを記録するトレース
+        payload: 正規化した会話ID・タイトル・URL・全メッセージ・拡張機能側のダイジェスト
+        lane: アップロードの優先度（LANE_INTERACTIVE / LANE_SCHEDULED）
     
-    enml += '</en-note>'
+    Returns:
+        結果（action: 'unchanged' / 'created' / 'updated' / 'queued' / 'dead_letter' /
+        'failed'、note_guid、error）
     
-    return enml
+    Raises:
+        RateLimitError: Evernoteのレート制限に達した場合
+    """
+    canonical_id = payload['conversationId']
+    try:
+        note_guid, action = write_conversation(
+            trace,
+            canonical_id,
+            payload['title'],
+            payload['url'],
+            payload['messages'],
+            payload['clientDigest'],
+            lane=lane
+        )
+    except EvernoteWriteError as e:
+        trace.set(permanent=e.permanent)
+        if e.permanent:
+            duplicate_manager.add_dead_letter('save', canonical_id, payload, 1, str(e))
+            return {'action': 'dead_letter', 'error': str(e)}
+        if not outbox_retrier.enqueue('save', canonical_id, payload, str(e)):
+            return {'action': 'failed', 'error': str(e)}
+        # 受け付けた内容は保存済みとして扱い、次の差分保存のベースにする
+        duplicate_manager.save_conversation_snapshot(canonical_id, payload['messages'])
+        logger.warning(f"📮 保存を送信待ちに登録 [{trace.trace_id}]: {payload['title']}: {e}")
+        return {'action': 'queued', 'error': str(e)}
+    
+    if action != 'unchanged':
+        # 直接保存できたため、同じ会話の古い送信待ちは不要
+        duplicate_manager.remove_outbox('save', canonical_id)
+    return {'action': action, 'note_guid': note_guid}
 
 
-def escape_html(text):
-    """HTML特殊文字をエスケープ"""
-    if not text:
-        return ''
-    return (str(text)
-            .replace('&', '&amp;')
-            .replace('<', '&lt;')
-            .replace('>', '&gt;')
-            .replace('"', '&quot;')
-            .replace("'", '&#39;'))
+def replay_save(payload: Dict) -> None:
+    """
+    送信待ちの保存を再試行
+    
+    同じ会話の保存が実行中であれば合流し、その結果を待つ（内容は上書きしない）。
+    送信待ちの内容が新しいものに置き換わっていれば、古い内容では書き込まない。
+    
+    Raises:
+        EvernoteWriteError: ノートの作成・更新に失敗した場合
+        RateLimitError: Evernoteのレート制限に達した場合
+    """
+    canonical_id = payload['conversationId']
+    
+    def replay(latest: Dict) -> Dict:
+        if duplicate_manager.get_outbox_payload('save', canonical_id) != latest:
+            return {'action': 'superseded'}
+        trace = RequestTrace('outbox.save', slow_threshold_ms=slow_request_threshold_ms)
+        trace.set(conversation_id=canonical_id, message_count=len(latest['messages']))
+        try:
+            note_guid, action = write_conversation(
+                trace,
+                canonical_id,
+                latest['title'],
+                latest['url'],
+                latest['messages'],
+                latest.get('clientDigest'),
+                lane=LANE_SCHEDULED
+            )
+        except Exception as e:
+            trace.set(error=str(e))
+            trace.finish('error')
+            raise
+        trace.set(action=action)
+        trace.finish('ok')
+        return {'action': action, 'note_guid': note_guid}
+    
+    # 合流した保存が送信待ち・失敗になった場合は、この再試行も失敗として扱う
+    outcome, _ = save_flights.run(canonical_id, payload, replay, replace=False)
+    if outcome['action'] not in ('created', 'updated', 'unchanged', 'superseded'):
+        raise EvernoteWriteError(
+            outcome.get('error') or f"保存できませんでした: {outcome['action']}",
+            permanent=outcome['action'] == 'dead_letter'
+        )
 
 
 def run_server():
@@ -220,13 +759,36 @@ def run_server():
     logger.info("📡 Chrome拡張からの接続を待機: http://localhost:8765")
     
     try:
-        app.run(host='0.0.0.0', port=8765, debug=False, use_reloader=False, threaded=True)
+        if app_config is not None and app_config.server_mode == 'async':
+            # 非同期モード: イベントループ1本＋固定数のEvernote I/Oスレッド
+            from async_server import AsyncSaveServer, serve
+            serve(AsyncSaveServer(
+                handle_save,
+                get_health,
+                status_handler=handle_status,
+                backfill_handler=handle_backfill,
+                search_handler=handle_search,
+                dead_letter_handler=handle_dead_letters,
+                max_workers=app_config.async_workers,
+                max_backlog=app_config.async_max_backlog,
+                on_startup=mark_ready
+            ), host='0.0.0.0', port=8765)
+        else:
+            # app.run と同じ開発サーバーを、待ち受け開始を記録できるよう直接起動
+            from werkzeug.serving import make_server
+            server = make_server('0.0.0.0', 8765, app, threaded=True)
+            mark_ready()
+            server.serve_forever()
     except Exception as e:
         logger.error(f"❌ サーバーエラー: {e}", exc_info=True)
 
 
 def create_tray_icon():
     """システムトレイアイコン作成"""
+    # トレイ・画像ライブラリは使うときに読み込む（ヘッドレス起動では読み込まない）
+    import pystray
+    from PIL import Image, ImageDraw
+    
     # アイコン画像生成
     width = 64
     height = 64
@@ -265,15 +827,33 @@ def open_log(icon, item):
 
 def quit_app(icon, item):
     """アプリケーション終了"""
-    logger.info("👋 アプリケーション終了")
     icon.stop()
+    shutdown()
     sys.exit(0)
 
 
-def main():
+def shutdown() -> None:
+    """設定監視・再試行・ログ出力を停止"""
+    logger.info("👋 アプリケーション終了")
+    if outbox_retrier is not None:
+        outbox_retrier.stop()
+    if duplicate_manager is not None:
+        # 書き込み待ちの全文検索索引を反映（索引スレッドはデーモンのため終了時に失われる）
+        duplicate_manager.flush_search_index()
+    if app_config is not None:
+        app_config.stop_watching()
+    log_listener.stop()
+
+
+def main(argv=None):
     """メイン処理"""
     global server_thread, icon
     
+    arg_parser = argparse.ArgumentParser(description='ChatGPT to Evernote - 自動同期サーバー')
+    arg_parser.add_argument('--headless', action='store_true',
+                            help='システムトレイを使わずに起動する（pystray / PIL を読み込まない）')
+    args = arg_parser.parse_args(argv)
+    
     print("=" * 60)
     print("ChatGPT to Evernote - 自動同期サーバー")
     print("=" * 60)
@@ -283,13 +863,27 @@ def main():
     if not initialize_services():
         print("❌ 初期化に失敗しました")
         print("詳細はevernote_server.logを確認してください")
-        input("Enterキーを押して終了...")
+        if not args.headless:
+            input("Enterキーを押して終了...")
         sys.exit(1)
     
     print("✅ 初期化完了")
     print()
     print("📡 サーバー起動: http://localhost:8765")
     print("🔧 Chrome拡張機能をインストールしてください")
+    
+    if args.headless:
+        # メインスレッドで待ち受け（SIGTERM / Ctrl+C で終了）
+        print()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            run_server()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shutdown()
+        return
+    
     print("📋 システムトレイアイコンから管理できます")
     print()
     
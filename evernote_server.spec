@@ -21,7 +21,11 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # トレイは PIL の描画機能だけを使うため、Tk 連携は同梱しない
+    excludes=[
+        'tkinter',
+        'PIL.ImageTk',
+    ],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
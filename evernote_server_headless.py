@@ -0,0 +1,12 @@
+"""
+ChatGPT to Evernote - ヘッドレスサーバー起動用エントリポイント
+
+システムトレイ・画像ライブラリ（pystray, PIL）を読み込まずにサーバーを起動する。
+画面のないLinuxサーバーや evernote_server_headless.spec でのビルドに使う。
+"""
+
+from evernote_server import main
+
+
+if __name__ == '__main__':
+    main(['--headless'])
@@ -0,0 +1,57 @@
+# -*- mode: python ; coding: utf-8 -*-
+# ヘッドレス版（システムトレイなし・コンソールあり）
+# トレイ・画像ライブラリを同梱しないため、evernote_server.spec より小さくなる
+
+block_cipher = None
+
+a = Analysis(
+    ['evernote_server_headless.py'],
+    pathex=[],
+    binaries=[],
+    datas=[
+        ('.env.example', '.'),
+    ],
+    hiddenimports=[
+        'flask',
+        'flask_cors',
+        'evernote3',
+        'oauth2',
+        'sqlite3',
+    ],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        'pystray',
+        'PIL',
+        'tkinter',
+    ],
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False,
+)
+
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    [],
+    name='ChatGPT_to_Evernote_Headless',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    runtime_tmpdir=None,
+    console=True,  # ヘッドレスモード（ログはコンソールとファイルに出力）
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
@@ -3,16 +3,27 @@ Evernote連携モジュール
 Evernote APIを使用してノートを作成する
 """
 import logging
+import threading
 from datetime import datetime
-from typing import Optional, TYPE_CHECKING
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 import hashlib
 import webbrowser
+from urllib.parse import quote, unquote, urlparse
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
 
 try:
     from evernote.api.client import EvernoteClient
-    from evernote.edam.type.ttypes import Note, Notebook
-    from evernote.edam.notestore.ttypes import NoteFilter, NotesMetadataResultSpec
-    from evernote.edam.error.ttypes import EDAMUserException, EDAMSystemException
+    from evernote.edam.type.ttypes import (
+        Data, Note, NoteAttributes, Notebook, NoteSortOrder, Resource,
+        ResourceAttributes
+    )
+    from evernote.edam.notestore.ttypes import (
+        NoteFilter, NotesMetadataResultSpec, SyncChunkFilter
+    )
+    from evernote.edam.error.ttypes import (
+        EDAMErrorCode, EDAMNotFoundException, EDAMSystemException, EDAMUserException
+    )
     EVERNOTE_AVAILABLE = True
 except ImportError:
     EVERNOTE_AVAILABLE = False
@@ -22,6 +33,101 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# findNotesMetadata の1回あたりの最大件数（APIの上限）
+NOTES_METADATA_PAGE_SIZE = 250
+
+# NoteStore 呼び出し1回あたりの通信タイムアウト（秒）の既定値
+DEFAULT_TIMEOUT_SECONDS = 20.0
+
+# getFilteredSyncChunk の1回あたりの最大件数
+SYNC_CHUNK_MAX_ENTRIES = 250
+
+# ノート属性に記録する会話の出典
+SOURCE_APPLICATION = 'chatgpt-to-evernote'
+_CONVERSATION_URL = 'https://chatgpt.com/c/'
+_DIGEST_FRAGMENT = 'digest='
+
+
+def conversation_source_url(conversation_id: str, content_digest: Optional[str] = None) -> str:
+    """
+    ノートの sourceURL（会話URL、フラグメントに本文ダイジェスト）を作成
+    
+    findNotesMetadata で取得できる属性に、対応表の再構築に必要な
+    会話IDとダイジェストを記録する（applicationData は他のアプリと共有のため使わない）。
+    
+    Args:
+        conversation_id: 正規化した会話ID
+        content_digest: 本文ダイジェスト
+    
+    Returns:
+        例 'https://chatgpt.com/c/<会話ID>#digest=<ダイジェスト>'
+    """
+    url = _CONVERSATION_URL + quote(conversation_id, safe='')
+    if content_digest:
+        url += f'#{_DIGEST_FRAGMENT}{content_digest}'
+    return url
+
+
+def parse_conversation_source_url(url: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    conversation_source_url で作成した sourceURL から会話IDとダイジェストを取り出す
+    
+    Args:
+        url: ノートの sourceURL
+    
+    Returns:
+        (会話ID, 本文ダイジェスト)、このツールが記録したURLでなければNone
+    """
+    if not url or not url.startswith(_CONVERSATION_URL):
+        return None
+    parsed = urlparse(url)
+    conversation_id = unquote(parsed.path[len('/c/'):])
+    if not conversation_id:
+        return None
+    digest = None
+    if parsed.fragment.startswith(_DIGEST_FRAGMENT):
+        digest = parsed.fragment[len(_DIGEST_FRAGMENT):] or None
+    return conversation_id, digest
+
+
+class RateLimitError(Exception):
+    """EvernoteのAPIレート制限（RATE_LIMIT_REACHED）に達した"""
+    
+    def __init__(self, duration: int):
+        """
+        Args:
+            duration: 制限解除までの秒数
+        """
+        super().__init__(f"Evernoteのレート制限に達しました（{duration}秒後に再試行可能）")
+        self.duration = duration
+
+
+class EvernoteWriteError(Exception):
+    """ノートの作成・更新に失敗した"""
+    
+    def __init__(self, message: str, permanent: bool, retry_after: Optional[float] = None):
+        """
+        Args:
+            message: エラー内容
+            permanent: 再試行しても成功しない場合True（ENMLの検証エラー、ノートが存在しない等）
+            retry_after: 回路遮断中のため呼び出さなかった場合、再試行できるまでの秒数
+        """
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+
+class NoteNotFoundError(EvernoteWriteError):
+    """更新対象のノートがEvernote上にない（削除された）"""
+    
+    def __init__(self, note_guid: str):
+        """
+        Args:
+            note_guid: 見つからなかったノートGUID
+        """
+        super().__init__(f"更新対象のノートが見つかりません: {note_guid}", permanent=True)
+        self.note_guid = note_guid
+
 
 class EvernoteSync:
     """Evernote同期クラス"""
@@ -32,7 +138,10 @@ class EvernoteSync:
         sandbox: bool = False,
         api_token: Optional[str] = None,
         consumer_key: Optional[str] = None,
-        consumer_secret: Optional[str] = None
+        consumer_secret: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
     ):
         """
         Args:
@@ -41,6 +150,9 @@ class EvernoteSync:
             api_token: Evernote APIトークン（Developer Token使用時）
             consumer_key: Consumer Key（OAuth使用時）
             consumer_secret: Consumer Secret（OAuth使用時）
+            timeout: NoteStore 呼び出し1回あたりの通信タイムアウト（秒）
+            failure_threshold: この回数連続で失敗したら呼び出しを遮断する
+            reset_timeout: 遮断してから接続を再試行するまでの秒数
         """
         if not EVERNOTE_AVAILABLE:
             raise ImportError(
@@ -50,6 +162,9 @@ class EvernoteSync:
         
         self.notebook_name = notebook_name
         self.sandbox = sandbox
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.timeout = timeout
+        self._local = threading.local()
         
         try:
             # OAuth認証を使用する場合
@@ -63,7 +178,6 @@ class EvernoteSync:
             else:
                 raise ValueError("APIトークンまたはOAuth認証情報が必要です")
             
-            self.note_store = self.client.get_note_store()
             self.notebook_guid = self._get_or_create_notebook()
             
             logger.info(f"Evernote接続成功: ノートブック '{notebook_name}'")
@@ -72,6 +186,44 @@ class EvernoteSync:
             logger.error(f"Evernote接続エラー: {e}")
             raise
     
+    @classmethod
+    def from_config(cls, config) -> 'EvernoteSync':
+        """
+        設定（Config）から接続済みのインスタンスを生成
+        
+        Args:
+            config: Configインスタンス
+        
+        Returns:
+            EvernoteSyncインスタンス
+        """
+        # サンドボックス環境かどうか
+        sandbox = config.evernote_environment == 'sandbox'
+        
+        # 通信タイムアウトと回路遮断
+        resilience = {
+            'timeout': config.evernote_timeout_seconds,
+            'failure_threshold': config.circuit_failure_threshold,
+            'reset_timeout': config.circuit_reset_seconds,
+        }
+        
+        # OAuth認証の場合
+        if config.use_oauth:
+            return cls(
+                notebook_name=config.evernote_notebook_name,
+                sandbox=sandbox,
+                consumer_key=config.evernote_consumer_key,
+                consumer_secret=config.evernote_consumer_secret,
+                **resilience
+            )
+        # Developer Token の場合
+        return cls(
+            notebook_name=config.evernote_notebook_name,
+            sandbox=sandbox,
+            api_token=config.evernote_api_token,
+            **resilience
+        )
+    
     def _oauth_authentication(
         self, 
         consumer_key: str, 
@@ -192,7 +344,10 @@ class EvernoteSync:
         title: str, 
         content: str, 
         tags: list = None,
-        is_html: bool = False
+        is_html: bool = False,
+        attachments: Optional[List[Dict]] = None,
+        conversation_id: Optional[str] = None,
+        content_digest: Optional[str] = None
     ) -> Optional[str]:
         """
         Evernoteノートを作成
@@ -202,19 +357,19 @@ class EvernoteSync:
             content: ノート本文（ENMLまたはテキスト）
             tags: タグのリスト
             is_html: contentがHTMLの場合True（ENMLの場合はFalse）
+            attachments: 添付（md5, mime, name, path）。本文の en-media から参照される
+            conversation_id: 正規化した会話ID（ノート属性に記録し、対応表の再構築に使う）
+            content_digest: 本文ダイジェスト（同上）
         
         Returns:
-            作成されたノートのGUID、失敗時はNone
+            作成されたノートのGUID
+        
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+            EvernoteWriteError: 作成に失敗した場合（permanent で再試行の可否を判別）
         """
         try:
-            # ENML形式に変換（contentが既にENMLの場合はそのまま使用）
-            if is_html:
-                enml_content = self._html_to_enml(content, '')
-            elif content.startswith('<?xml'):
-                # 既にENML形式
-                enml_content = content
-            else:
-                enml_content = self._text_to_enml(content, '')
+            enml_content = self.to_enml(content, is_html)
             
             # ノート作成
             note = Note()
@@ -226,27 +381,44 @@ class EvernoteSync:
             if tags:
                 note.tagNames = tags
             
-            created_note = self.note_store.createNote(note)
+            if attachments:
+                note.resources = [self._build_resource(a) for a in attachments]
+            
+            if conversation_id:
+                note.attributes = NoteAttributes()
+                self._stamp_conversation(note.attributes, conversation_id, content_digest)
+            
+            created_note = self._call('createNote', note)
             
             logger.info(f"Evernoteノート作成成功: {title}")
             return created_note.guid
             
         except EDAMUserException as e:
             logger.error(f"Evernoteユーザーエラー: {e.errorCode} - {e.parameter}")
-            return None
+            raise EvernoteWriteError(
+                f"Evernoteユーザーエラー: {e.errorCode} - {e.parameter}", permanent=True
+            ) from e
         except EDAMSystemException as e:
+            self._raise_if_rate_limited(e)
             logger.error(f"Evernoteシステムエラー: {e.errorCode} - {e.message}")
-            return None
+            raise EvernoteWriteError(
+                f"Evernoteシステムエラー: {e.errorCode} - {e.message}", permanent=False
+            ) from e
+        except CircuitOpenError as e:
+            raise EvernoteWriteError(str(e), permanent=False, retry_after=e.retry_after) from e
         except Exception as e:
             logger.error(f"ノート作成エラー: {e}")
-            return None
+            raise EvernoteWriteError(f"ノート作成エラー: {e}", permanent=False) from e
     
     def update_note(
         self, 
         note_guid: str,
         title: str, 
         content: str,
-        is_html: bool = False
+        is_html: bool = False,
+        attachments: Optional[List[Dict]] = None,
+        conversation_id: Optional[str] = None,
+        content_digest: Optional[str] = None
     ) -> bool:
         """
         既存のEvernoteノートを更新
@@ -256,42 +428,69 @@ class EvernoteSync:
             title: ノートタイトル
             content: ノート本文（ENMLまたはテキスト）
             is_html: contentがHTMLの場合True（ENMLの場合はFalse）
+            attachments: 添付（md5, mime, name, path）。Noneの場合は既存のリソースを変更しない
+            conversation_id: 正規化した会話ID（ノート属性に記録し、対応表の再構築に使う）
+            content_digest: 本文ダイジェスト（同上）
         
         Returns:
             成功した場合True
+        
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+            NoteNotFoundError: ノートが削除されていた場合（対応を外して作成し直す）
+            EvernoteWriteError: 更新に失敗した場合（permanent で再試行の可否を判別）
         """
         try:
             # 既存ノートを取得
-            note = self.note_store.getNote(note_guid, True, False, False, False)
+            note = self._call('getNote', note_guid, True, False, False, False)
             
-            # ENML形式に変換（contentが既にENMLの場合はそのまま使用）
-            if is_html:
-                enml_content = self._html_to_enml(content, '')
-            elif content.startswith('<?xml'):
-                # 既にENML形式
-                enml_content = content
-            else:
-                enml_content = self._text_to_enml(content, '')
+            enml_content = self.to_enml(content, is_html)
             
             # ノート内容を更新
             note.title = title
             note.content = enml_content
             
+            if attachments is not None:
+                # 既にノートにあるリソースは本文を送らずにそのまま残す
+                existing = {
+                    resource.data.bodyHash: resource
+                    for resource in note.resources or []
+                    if resource.data and resource.data.bodyHash
+                }
+                note.resources = [
+                    existing.get(bytes.fromhex(a['md5'])) or self._build_resource(a)
+                    for a in attachments
+                ]
+            
+            if conversation_id:
+                note.attributes = note.attributes or NoteAttributes()
+                self._stamp_conversation(note.attributes, conversation_id, content_digest)
+            
             # 更新を送信
-            self.note_store.updateNote(note)
+            self._call('updateNote', note)
             
             logger.info(f"Evernoteノート更新成功: {title} (GUID: {note_guid})")
             return True
             
         except EDAMUserException as e:
             logger.error(f"Evernoteユーザーエラー: {e.errorCode} - {e.parameter}")
-            return False
+            raise EvernoteWriteError(
+                f"Evernoteユーザーエラー: {e.errorCode} - {e.parameter}", permanent=True
+            ) from e
+        except EDAMNotFoundException as e:
+            logger.warning(f"更新対象のノートが見つかりません: {note_guid}")
+            raise NoteNotFoundError(note_guid) from e
         except EDAMSystemException as e:
+            self._raise_if_rate_limited(e)
             logger.error(f"Evernoteシステムエラー: {e.errorCode} - {e.message}")
-            return False
+            raise EvernoteWriteError(
+                f"Evernoteシステムエラー: {e.errorCode} - {e.message}", permanent=False
+            ) from e
+        except CircuitOpenError as e:
+            raise EvernoteWriteError(str(e), permanent=False, retry_after=e.retry_after) from e
         except Exception as e:
             logger.error(f"ノート更新エラー: {e}")
-            return False
+            raise EvernoteWriteError(f"ノート更新エラー: {e}", permanent=False) from e
     
     def create_or_update_note(
         self,
@@ -312,16 +511,272 @@ class EvernoteSync:
             is_html: contentがHTMLの場合True
         
         Returns:
-            ノートGUID（新規作成時は新しいGUID、更新時は同じGUID）、失敗時はNone
+            ノートGUID（新規作成時は新しいGUID、更新時は同じGUID）
+        
+        Raises:
+            EvernoteWriteError: 作成・更新に失敗した場合
         """
         if note_guid:
             # 既存ノートを更新
-            success = self.update_note(note_guid, title, content, source_file, is_html)
-            return note_guid if success else None
+            self.update_note(note_guid, title, content, source_file, is_html)
+            return note_guid
         else:
             # 新規ノートを作成
             return self.create_note(title, content, source_file, is_html)
     
+    def content_hash(self, content: str, is_html: bool = False) -> str:
+        """
+        送信するENMLのMD5（Evernoteのノートの contentHash と同じ値）
+        
+        Args:
+            content: ノート本文（create_note / update_note に渡すもの）
+            is_html: contentがHTMLの場合True
+        
+        Returns:
+            MD5の16進文字列
+        """
+        return hashlib.md5(self.to_enml(content, is_html).encode('utf-8')).hexdigest()
+    
+    def iter_notes_metadata(
+        self,
+        offset: int = 0,
+        page_size: int = NOTES_METADATA_PAGE_SIZE,
+        include_attributes: bool = False
+    ) -> Iterator[Tuple[int, list]]:
+        """
+        ノートブック内のノートのメタデータ（本文なし）をページ単位で取得
+        
+        作成日時の古い順に取得するため、途中から再開しても新しく作成されたノートで
+        ページがずれない。
+        
+        Args:
+            offset: 取得を開始する位置
+            page_size: 1回に取得する件数（最大250）
+            include_attributes: ノート属性（sourceURL等）も取得する場合True
+        
+        Yields:
+            (次のページの開始位置, NoteMetadataのリスト)
+        
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+        """
+        note_filter = NoteFilter(
+            notebookGuid=self.notebook_guid,
+            order=NoteSortOrder.CREATED,
+            ascending=True
+        )
+        result_spec = NotesMetadataResultSpec(
+            includeContentHash=True,
+            includeUpdateSequenceNum=True,
+            includeAttributes=include_attributes
+        )
+        while True:
+            try:
+                result = self._call(
+                    'findNotesMetadata', note_filter, offset, page_size, result_spec
+                )
+            except EDAMSystemException as e:
+                self._raise_if_rate_limited(e)
+                raise
+            notes = result.notes or []
+            offset += len(notes)
+            yield offset, notes
+            if not notes or offset >= result.totalNotes:
+                return
+    
+    def get_update_count(self) -> int:
+        """
+        アカウントの更新カウント（最後に変更されたオブジェクトのUSN）を取得
+        
+        Returns:
+            getSyncState().updateCount
+        
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+        """
+        try:
+            return self._call('getSyncState').updateCount
+        except EDAMSystemException as e:
+            self._raise_if_rate_limited(e)
+            raise
+    
+    def iter_note_changes(
+        self,
+        after_usn: int,
+        max_entries: int = SYNC_CHUNK_MAX_ENTRIES
+    ) -> Iterator[Tuple[int, list, list]]:
+        """
+        指定したUSNより後に変更されたノート（本文なし）を同期チャンク単位で取得
+        
+        他のノートブックに移動したノートやゴミ箱内のノートも含むため、
+        notebookGuid と active で判別する。
+        
+        Args:
+            after_usn: このUSNより後の変更を取得
+            max_entries: 1回に取得する件数
+        
+        Yields:
+            (チャンクの最大USN, Noteのリスト, 完全に削除されたノートGUIDのリスト)
+        
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合
+        """
+        sync_filter = SyncChunkFilter(includeNotes=True, includeExpunged=True)
+        while True:
+            try:
+                chunk = self._call('getFilteredSyncChunk', after_usn, max_entries, sync_filter)
+            except EDAMSystemException as e:
+                self._raise_if_rate_limited(e)
+                raise
+            if chunk.chunkHighUSN is None:
+                return
+            after_usn = chunk.chunkHighUSN
+            yield after_usn, chunk.notes or [], chunk.expungedNotes or []
+            if after_usn >= chunk.updateCount:
+                return
+    
+    @staticmethod
+    def _stamp_conversation(
+        attributes: 'NoteAttributes',
+        conversation_id: str,
+        content_digest: Optional[str]
+    ) -> None:
+        """
+        ノート属性に会話IDと本文ダイジェストを記録
+        
+        sourceURL と sourceApplication だけを書き換え、他のアプリが
+        applicationData に記録したエントリはそのまま残す。
+        
+        Args:
+            attributes: 書き換えるノート属性
+            conversation_id: 正規化した会話ID
+            content_digest: 本文ダイジェスト
+        """
+        attributes.sourceURL = conversation_source_url(conversation_id, content_digest)
+        attributes.sourceApplication = SOURCE_APPLICATION
+    
+    @staticmethod
+    def _build_resource(attachment: Dict) -> 'Resource':
+        """
+        添付からEvernoteリソースを作成
+        
+        Args:
+            attachment: 添付（md5, mime, name, path）
+        
+        Returns:
+            Resource
+        """
+        with open(attachment['path'], 'rb') as f:
+            body = f.read()
+        
+        data = Data()
+        data.body = body
+        data.size = len(body)
+        data.bodyHash = bytes.fromhex(attachment['md5'])
+        
+        resource = Resource()
+        resource.mime = attachment['mime']
+        resource.data = data
+        resource.attributes = ResourceAttributes(fileName=attachment.get('name'))
+        return resource
+    
+    def to_enml(self, content: str, is_html: bool = False, source_file: str = '') -> str:
+        """
+        ノート本文をENML形式に変換（contentが既にENMLの場合はそのまま使用）
+        
+        Args:
+            content: ノート本文（ENML、HTMLまたはテキスト）
+            is_html: contentがHTMLの場合True
+            source_file: 元ファイルパス（メタ情報に表示）
+        
+        Returns:
+            ENML形式の文字列
+        """
+        if is_html:
+            return self._html_to_enml(content, source_file)
+        if content.startswith('<?xml'):
+            # 既にENML形式
+            return content
+        return self._text_to_enml(content, source_file)
+    
+    def _call(self, method: str, *args):
+        """
+        NoteStore のメソッドを回路遮断を通して呼び出す
+        
+        Evernoteが応答したエラー（ユーザーエラー・ノートが存在しない・レート制限）は
+        接続の失敗に数えず、タイムアウト・通信エラー・その他のシステムエラーを数える。
+        
+        Args:
+            method: NoteStore のメソッド名
+            *args: 引数（認証トークンを除く）
+        
+        Raises:
+            CircuitOpenError: 遮断中のため呼び出さなかった場合
+        """
+        self.breaker.before_call()
+        try:
+            result = getattr(self.note_store, method)(*args)
+        except (EDAMUserException, EDAMNotFoundException):
+            self.breaker.record_success()
+            raise
+        except EDAMSystemException as e:
+            if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+    
+    @property
+    def note_store(self):
+        """
+        呼び出し元スレッド専用の NoteStore
+        
+        Thriftのクライアント（THttpClient）はスレッドセーフでないため、
+        同時アップロードの各スレッドが自分の接続を使うようにする。
+        最初に使うときに生成し、以降は同じスレッドで使い回す。
+        """
+        note_store = getattr(self._local, 'note_store', None)
+        if note_store is None:
+            note_store = self.client.get_note_store()
+            self._set_transport_timeout(note_store, self.timeout)
+            self._local.note_store = note_store
+        return note_store
+    
+    def _set_transport_timeout(self, note_store, timeout: float) -> None:
+        """
+        NoteStore の通信（THttpClient）にタイムアウトを設定
+        
+        SDKの既定ではタイムアウトがなく、Evernoteが応答しないと保存リクエストの
+        スレッドが無期限に待ち続ける。
+        
+        Args:
+            note_store: 設定対象の NoteStore
+            timeout: 秒数
+        """
+        thrift_client = getattr(note_store, '_client', None)
+        transport = getattr(getattr(thrift_client, '_iprot', None), 'trans', None)
+        if transport is None or not hasattr(transport, 'setTimeout'):
+            logger.warning("NoteStore の通信タイムアウトを設定できません（SDKの構成が異なります）")
+            return
+        transport.setTimeout(timeout * 1000)
+    
+    def _raise_if_rate_limited(self, e: 'EDAMSystemException') -> None:
+        """
+        レート制限エラーの場合はRateLimitErrorとして送出
+        
+        Args:
+            e: Evernoteシステム例外
+        """
+        if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
+            duration = e.rateLimitDuration or 60
+            logger.warning(f"Evernoteレート制限: {duration}秒後に再試行可能")
+            raise RateLimitError(duration) from e
+    
     def _text_to_enml(self, text: str, source_file: str) -> str:
         """
         プレーンテキストをENML形式に変換
@@ -0,0 +1,310 @@
+"""
+エクスポートフォルダ監視モジュール
+ChatGPTExportParser.export_dir に置かれた新しいエクスポートZIPを検知し、
+書き込み完了を待ってからインポートキューに投入する
+
+使い方:
+    python export_watcher.py [--export-dir DIR]
+
+watchdog（Linuxではinotify、WindowsではReadDirectoryChangesW）が
+インストールされていればOSのファイル変更通知で待機するため、
+アイドル時のCPU消費はない。未インストールの場合は WATCH_INTERVAL 秒ごとの
+ポーリングで代替する。
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from chatgpt_export import ChatGPTExportParser
+
+try:
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+
+class _ExportEventHandler:
+    """watchdogイベントを ExportWatcher に中継するハンドラ"""
+
+    def __init__(self, watcher: 'ExportWatcher'):
+        self.watcher = watcher
+
+    def dispatch(self, event) -> None:
+        if event.is_directory:
+            return
+        # ダウンロード完了時は .crdownload 等からのリネーム（moved）で届く
+        path = getattr(event, 'dest_path', None) or event.src_path
+        self.watcher.notify(path)
+
+
+class ExportWatcher:
+    """エクスポートZIPの到着を検知してキューに積む監視サービス"""
+
+    def __init__(
+        self,
+        parser: ChatGPTExportParser,
+        settle_seconds: float = 0.5,
+        poll_interval: float = 5.0,
+        use_polling: Optional[bool] = None
+    ):
+        """
+        Args:
+            parser: エクスポート解析器（export_dir を監視対象にする）
+            settle_seconds: 最後の変更からこの秒数だけ変化がなければ書き込み完了とみなす
+            poll_interval: ポーリング時の監視間隔（秒）
+            use_polling: Trueでポーリングを強制（Noneの場合はwatchdogの有無で自動選択）
+        """
+        self.parser = parser
+        self.export_dir = parser.export_dir
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_polling = (not WATCHDOG_AVAILABLE) if use_polling is None else use_polling
+
+        # 書き込み完了を確認したZIPのキュー
+        self.ready_queue: queue.Queue = queue.Queue()
+
+        self._cond = threading.Condition()
+        self._pending: Dict[str, float] = {}
+        self._queued: Dict[str, Tuple[int, float]] = {}
+        # ZIPとして読めなかったファイルの前回のサイズと更新日時
+        self._unreadable: Dict[str, Tuple[int, float]] = {}
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+
+    def start(self) -> None:
+        """
+        監視を開始
+
+        停止中に置かれたZIPや、前回インポートが途中で終わったZIPを取り込むため、
+        既存のZIPもキューに積む（取り込み済みの会話はインポート側がスキップする）。
+        """
+        for path in self.parser.find_export_files():
+            self.notify(path)
+
+        settle = threading.Thread(target=self._settle_loop, name='export-settle', daemon=True)
+        settle.start()
+        self._threads.append(settle)
+
+        if self.use_polling:
+            poller = threading.Thread(target=self._poll_loop, name='export-poll', daemon=True)
+            poller.start()
+            self._threads.append(poller)
+            logger.info(f"エクスポート監視開始（ポーリング {self.poll_interval}秒）: {self.export_dir}")
+        else:
+            self._observer = Observer()
+            self._observer.schedule(_ExportEventHandler(self), self.export_dir, recursive=False)
+            self._observer.start()
+            logger.info(f"エクスポート監視開始（ファイル変更通知）: {self.export_dir}")
+
+    def stop(self) -> None:
+        """監視を停止"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        # run_forever の待機を解除する
+        self.ready_queue.put(None)
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        logger.info("エクスポート監視を停止しました")
+
+    def notify(self, path: str) -> None:
+        """
+        ファイル変更を通知（デバウンスのため期限を延長）
+
+        Args:
+            path: 変更されたファイルのパス
+        """
+        if not self.parser.is_export_file(path):
+            return
+        with self._cond:
+            self._pending[path] = time.monotonic() + self.settle_seconds
+            self._cond.notify()
+
+    def _settle_loop(self) -> None:
+        """期限が来たファイルの書き込み完了を確認してキューへ（保留がなければ待機のみ）"""
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                path, deadline = min(self._pending.items(), key=lambda item: item[1])
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+
+                del self._pending[path]
+            # ファイルの確認中も通知を受け付けられるよう、ロックの外で読む
+            self._check_ready(path)
+
+    def _check_ready(self, path: str) -> None:
+        """
+        ファイルが完成したZIPか確認し、未処理ならキューに投入
+
+        ZIPとして読めなければ書き込み途中とみなして再待機する。サイズと更新日時が
+        前回の確認から変わっていないのに読めない場合は、ZIPではないとみなして
+        警告を出し、次に変更されるまで確認しない。
+
+        Args:
+            path: ZIPファイルのパス
+        """
+        signature = self._signature(path)
+        if signature is None:
+            with self._cond:
+                self._unreadable.pop(path, None)
+            return
+        with self._cond:
+            if self._queued.get(path) == signature:
+                return
+
+        # 中央ディレクトリが読めるか（大きなファイルでも末尾を読むだけ）
+        readable = zipfile.is_zipfile(path)
+
+        with self._cond:
+            if readable:
+                self._unreadable.pop(path, None)
+                self._queued[path] = signature
+            elif self._unreadable.get(path) == signature:
+                del self._unreadable[path]
+                self._queued[path] = signature
+                logger.warning(f"⚠️ ZIPとして読めないため無視します: {os.path.basename(path)}")
+                return
+            else:
+                logger.debug(f"書き込み途中のZIP: {path}")
+                self._unreadable[path] = signature
+                self._pending[path] = time.monotonic() + self.settle_seconds
+                self._cond.notify()
+                return
+
+        logger.info(f"📦 新しいエクスポートを検出: {os.path.basename(path)}")
+        self.ready_queue.put(path)
+
+    def _poll_loop(self) -> None:
+        """watchdog未使用時のポーリング監視"""
+        snapshot: Dict[str, Tuple[int, float]] = {}
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with os.scandir(self.export_dir) as it:
+                    current = {
+                        entry.path: (entry.stat().st_size, entry.stat().st_mtime)
+                        for entry in it
+                        if entry.is_file() and self.parser.is_export_file(entry.name)
+                    }
+            except OSError as e:
+                logger.error(f"エクスポートフォルダ読み込みエラー: {e}")
+                continue
+
+            for path, signature in current.items():
+                if snapshot.get(path) != signature:
+                    self.notify(path)
+            snapshot = current
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, float]]:
+        """ファイルのサイズと更新日時（存在しなければNone）"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime)
+
+    def run_forever(self, handler: Callable[[str], None]) -> None:
+        """
+        キューに積まれたZIPを順に処理し続ける
+
+        Args:
+            handler: ZIPパスを受け取るインポート処理
+        """
+        while not self._stop.is_set():
+            path = self.ready_queue.get()
+            if path is None:
+                break
+            try:
+                handler(path)
+            except Exception as e:
+                logger.error(f"エクスポートのインポートエラー: {path}: {e}", exc_info=True)
+
+
+def main(argv=None) -> int:
+    """コマンドラインエントリポイント（監視デーモン）"""
+    arg_parser = argparse.ArgumentParser(
+        description='エクスポートフォルダを監視し、新しいZIPを自動でEvernoteにインポート'
+    )
+    arg_parser.add_argument(
+        '--export-dir',
+        default=os.path.join(str(Path.home() / "Downloads"), "ChatGPT_Exports"),
+        help='監視するディレクトリ'
+    )
+    arg_parser.add_argument('--polling', action='store_true',
+                            help='ファイル変更通知を使わずポーリングで監視する')
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Evernote SDK 等の読み込みは --help 等の後に遅らせる
+    from config import Config
+    from attachments import ResourceCache
+    from bulk_import import BulkImporter, default_cache_dir, default_db_path
+    from duplicate_manager import DuplicateManager
+    from evernote_sync import EvernoteSync
+
+    config = Config()
+    parser = ChatGPTExportParser(args.export_dir)
+    importer = BulkImporter(
+        parser,
+        EvernoteSync.from_config(config),
+        DuplicateManager(db_path=default_db_path()),
+        resource_cache=ResourceCache(default_cache_dir())
+    )
+
+    def import_export(path: str) -> None:
+        stats = importer.run(path)
+        if stats['rate_limit_duration'] is not None:
+            # レート制限解除後に同じZIPを再投入（チェックポイントから再開）
+            retry = threading.Timer(
+                stats['rate_limit_duration'], watcher.ready_queue.put, args=(path,)
+            )
+            retry.daemon = True
+            retry.start()
+            return
+        logger.info(
+            f"✅ インポート完了: {os.path.basename(path)} "
+            f"(作成 {stats['created']} / 更新 {stats['updated']} / スキップ {stats['skipped']})"
+        )
+
+    watcher = ExportWatcher(
+        parser,
+        poll_interval=config.watch_interval,
+        use_polling=True if args.polling else None
+    )
+    watcher.start()
+    try:
+        watcher.run_forever(import_export)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+メッセージ本文の正規化モジュール
+拡張機能（レンダリング済みHTML）とエクスポート（Markdownソース）のメッセージを
+同じ表示テキストに揃え、経路によらず同じ内容が同じダイジェストになるようにする
+
+- HTML: ブロック要素の境界を改行にしてタグを除き、エンティティを戻す
+- Markdown: 見出し・引用・リスト・表・強調・リンク・コードの記法を除く
+  （コード内と、空白に挟まれた * ・単語中の _ 等の記法でない記号は残す）
+
+空白の違い（改行・インデント）は呼び出し側でまとめる。
+"""
+import html
+import re
+
+# 拡張機能の innerHTML とみなすタグ（Markdownソース中の「a < b」等と区別する）
+_HTML_ELEMENT_RE = re.compile(
+    r'</?(?:p|div|span|br|hr|h[1-6]|ul|ol|li|pre|code|strong|b|em|i|a|blockquote|'
+    r'table|thead|tbody|tr|td|th|del|s|img|sup|sub)(?:\s+[^<>=]+=[^<>]*)?\s*/?>',
+    re.IGNORECASE
+)
+_HTML_BLOCK_TAG_RE = re.compile(
+    r'</?(?:p|div|br|hr|h[1-6]|ul|ol|li|pre|blockquote|table|thead|tbody|tr|td|th)\b[^>]*>',
+    re.IGNORECASE
+)
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Markdownのコード（フェンス・インライン）。中身は記法として扱わない
+_MD_CODE_RE = re.compile(
+    r'^[ \t]*(?P<fence>`{3,}|~{3,})[^\n]*\n(?P<fenced>.*?)(?:^[ \t]*(?P=fence)[ \t]*$|\Z)'
+    r'|(?P<ticks>`+)(?P<inline>.+?)(?P=ticks)',
+    re.MULTILINE | re.DOTALL
+)
+# バックスラッシュでエスケープされた記号（記法の処理が終わるまで退避する）
+_MD_ESCAPE_RE = re.compile(r'\\([!-/:-@\[-`{-~])')
+_ESCAPE_BASE = 0xE000
+
+_MD_LINE_RULES = [
+    # 水平線
+    (re.compile(r'^[ \t]{0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$', re.MULTILINE), ''),
+    # 表の区切り行
+    (re.compile(r'^[ \t]*\|?[ \t]*:?-{3,}:?[ \t]*(?:\|[ \t]*:?-{3,}:?[ \t]*)*\|?[ \t]*$',
+                re.MULTILINE), ''),
+    # 見出し
+    (re.compile(r'^[ \t]{0,3}#{1,6}[ \t]+', re.MULTILINE), ''),
+    # 引用
+    (re.compile(r'^[ \t]{0,3}(?:>[ \t]?)+', re.MULTILINE), ''),
+    # リスト（タスクリストのチェックボックスを含む）
+    (re.compile(r'^[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+(?:\[[ xX]\][ \t]+)?', re.MULTILINE), ''),
+]
+_MD_TABLE_ROW_RE = re.compile(r'^[ \t]*\|(.*?)\|?[ \t]*$', re.MULTILINE)
+_MD_INLINE_RULES = [
+    # 画像（HTMLでは本文にならない）・リンク・自動リンク
+    (re.compile(r'!\[[^\]]*\]\([^)]*\)'), ''),
+    (re.compile(r'\[([^\]]+)\]\([^)]*\)'), r'\1'),
+    (re.compile(r'<(https?://[^>\s]+)>'), r'\1'),
+    # 太字・取り消し線・斜体（空白に挟まれた * と、単語中の _ は記法ではない）
+    (re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1'), r'\2'),
+    (re.compile(r'~~(?=\S)(.+?)(?<=\S)~~'), r'\1'),
+    (re.compile(r'(?<!\*)\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?!\*)'), r'\1'),
+    (re.compile(r'(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)'), r'\1'),
+]
+
+
+def message_plain_text(content: str) -> str:
+    """
+    メッセージ本文を表示されるテキストに変換
+
+    Args:
+        content: 拡張機能のHTML、またはエクスポートのMarkdown
+
+    Returns:
+        記法・タグを除いたテキスト（空白はそのまま）
+    """
+    if _HTML_ELEMENT_RE.search(content):
+        return html.unescape(_HTML_TAG_RE.sub('', _HTML_BLOCK_TAG_RE.sub('\n', content)))
+    return _markdown_to_text(content)
+
+
+def _markdown_to_text(content: str) -> str:
+    """Markdownソースから記法を除く（コードの中身はそのまま残す）"""
+    parts = []
+    pos = 0
+    for match in _MD_CODE_RE.finditer(content):
+        parts.append(_strip_markdown(content[pos:match.start()]))
+        code = match.group('fenced')
+        parts.append('\n' + code + '\n' if code is not None else match.group('inline'))
+        pos = match.end()
+    parts.append(_strip_markdown(content[pos:]))
+    return ''.join(parts)
+
+
+def _strip_markdown(text: str) -> str:
+    """コード以外の部分から記法を除く"""
+    text = _MD_ESCAPE_RE.sub(lambda m: chr(_ESCAPE_BASE + ord(m.group(1))), text)
+    for pattern, replacement in _MD_LINE_RULES:
+        text = pattern.sub(replacement, text)
+    text = _MD_TABLE_ROW_RE.sub(lambda m: m.group(1).replace('|', ' '), text)
+    for pattern, replacement in _MD_INLINE_RULES:
+        text = pattern.sub(replacement, text)
+    text = re.sub(
+        '[\uE021-\uE07E]', lambda m: chr(ord(m.group(0)) - _ESCAPE_BASE), text
+    )
+    return html.unescape(text)
@@ -0,0 +1,166 @@
+"""
+送信待ち（アウトボックス）再試行モジュール
+Evernoteへの書き込みに失敗した操作を重複管理データベースに保存し、
+バックグラウンドで再試行する
+
+再試行の間隔は指数バックオフ（ジッター付き）で広げ、ネットワークの一時的な
+切断なら次のアラームを待たずに数秒〜数分で保存される。ENMLの検証エラー等、
+再試行しても成功しない操作と、試行回数の上限に達した操作はデッドレターに移す。
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from duplicate_manager import DuplicateManager
+from evernote_sync import EvernoteWriteError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRetrier:
+    """送信待ちの操作をバックグラウンドで再試行する"""
+
+    def __init__(
+        self,
+        duplicate_manager: DuplicateManager,
+        handlers: Dict[str, Callable[[Dict], None]],
+        base_delay: float = 5.0,
+        max_delay: float = 1800.0,
+        max_attempts: int = 10,
+        poll_interval: float = 5.0
+    ):
+        """
+        Args:
+            duplicate_manager: 送信待ち・デッドレターを保存する重複管理
+            handlers: 操作の種類 → 再試行する処理（失敗時は EvernoteWriteError 等を送出）
+            base_delay: 最初の再試行までの基準秒数
+            max_delay: 再試行間隔の上限（秒）
+            max_attempts: この回数失敗したらデッドレターに移す
+            poll_interval: 送信待ちを確認する間隔（秒）
+        """
+        self.duplicate_manager = duplicate_manager
+        self.handlers = handlers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def backoff(self, attempts: int) -> float:
+        """
+        次の再試行までの秒数（指数バックオフ、ジッター付き）
+
+        多数の操作が同時に失敗しても再試行が一斉に集中しないよう、
+        基準秒数から上限（基準 × 2^試行回数）までの一様乱数にする。
+
+        Args:
+            attempts: これまでの試行回数
+
+        Returns:
+            秒数
+        """
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return random.uniform(self.base_delay, max(self.base_delay, ceiling))
+
+    def enqueue(self, kind: str, key: str, payload: Dict, error: str) -> bool:
+        """
+        失敗した操作を送信待ちに登録
+
+        Args:
+            kind: 操作の種類（handlers のキー）
+            key: 操作の対象（同じ対象の操作は最新の内容にまとめる）
+            payload: 再試行に渡す内容
+            error: 失敗したときのエラー
+
+        Returns:
+            登録できた場合True
+        """
+        return self.duplicate_manager.enqueue_outbox(
+            kind, key, payload, time.time() + self.backoff(0), error
+        )
+
+    def start(self) -> None:
+        """再試行スレッドを開始"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='outbox-retry', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """再試行スレッドを停止"""
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        """送信待ちを定期的に確認して再試行"""
+        while not self._stop.is_set():
+            try:
+                self.retry_due()
+            except Exception as e:
+                logger.error(f"送信待ちの再試行エラー: {e}", exc_info=True)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def retry_due(self) -> int:
+        """
+        試行時刻を過ぎた操作を再試行
+
+        Returns:
+            保存できた件数
+        """
+        succeeded = 0
+        for entry in self.duplicate_manager.get_due_outbox(time.time()):
+            if self._stop.is_set():
+                break
+            kind, key, attempts = entry['kind'], entry['key'], entry['attempts'] + 1
+            handler = self.handlers.get(kind)
+            if handler is None:
+                self.duplicate_manager.add_dead_letter(
+                    kind, key, entry['payload'], attempts, f"未対応の操作: {kind}"
+                )
+                continue
+
+            try:
+                handler(entry['payload'])
+            except RateLimitError as e:
+                # 試行回数には数えず、制限が解除されるまで残りの操作も待たせる
+                self.duplicate_manager.reschedule_outbox(
+                    entry['id'], entry['attempts'], time.time() + e.duration, str(e)
+                )
+                logger.warning(f"⏳ 再試行をレート制限で延期: {e.duration}秒後")
+                break
+            except EvernoteWriteError as e:
+                if e.retry_after is None:
+                    self._record_failure(entry, attempts, e)
+                    continue
+                # 回路遮断中は呼び出していないため試行回数に数えず、遮断が解けるまで待つ
+                self.duplicate_manager.reschedule_outbox(
+                    entry['id'], entry['attempts'], time.time() + e.retry_after, str(e)
+                )
+                break
+            except Exception as e:
+                self._record_failure(entry, attempts, e)
+                continue
+
+            # 再試行中に新しい内容で登録し直されていれば、そちらは次の回で再試行する
+            self.duplicate_manager.remove_outbox(kind, key, payload=entry['payload'])
+            succeeded += 1
+            logger.info(f"✅ 再試行で保存しました（{attempts}回目）: {kind} {key}")
+        return succeeded
+
+    def _record_failure(self, entry: Dict, attempts: int, error: Exception) -> None:
+        """失敗した操作を再試行に回すか、デッドレターに移す"""
+        kind, key = entry['kind'], entry['key']
+        permanent = isinstance(error, EvernoteWriteError) and error.permanent
+        if permanent or attempts >= self.max_attempts:
+            self.duplicate_manager.add_dead_letter(kind, key, entry['payload'], attempts, str(error))
+            return
+        delay = self.backoff(attempts)
+        self.duplicate_manager.reschedule_outbox(
+            entry['id'], attempts, time.time() + delay, str(error)
+        )
+        logger.info(f"🔁 再試行失敗（{attempts}回目）: {kind} {key}、{delay:.0f}秒後に再試行")
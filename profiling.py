@@ -0,0 +1,168 @@
+"""
+プロファイリングモジュール
+process_export_file や save_conversation をcProfileで計測し、
+実行ごとのプロファイルファイルと上位N件のホットスポット要約を出力する
+
+通常は無効。PROFILE_ENABLED=true（またはCLIの --profile）で有効化し、
+PROFILE_MAX_RUNS 回計測すると自動的に無効に戻るため、本番でも1回だけ安全に計測できる。
+"""
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Python 3.12以降はプロファイラをプロセス全体で1つしか有効にできないため、計測を1件ずつにする
+_profile_lock = threading.Lock()
+_local = threading.local()
+_state = {
+    'enabled': False,
+    'output_dir': './profiles',
+    'top_n': 20,
+    'remaining_runs': 1,
+}
+
+
+def configure(
+    enabled: bool,
+    output_dir: str = './profiles',
+    top_n: int = 20,
+    max_runs: int = 1
+) -> None:
+    """
+    プロファイリング設定を更新
+
+    Args:
+        enabled: 有効にする場合True
+        output_dir: プロファイルファイルの出力先ディレクトリ
+        top_n: 要約に出力するホットスポット数
+        max_runs: 計測する最大回数（0以下で無制限）
+    """
+    with _lock:
+        _state['enabled'] = enabled
+        _state['output_dir'] = output_dir
+        _state['top_n'] = top_n
+        _state['remaining_runs'] = max_runs if max_runs > 0 else -1
+    if enabled:
+        limit = '無制限' if max_runs <= 0 else f'{max_runs}回'
+        logger.info(f"プロファイリング有効: 出力先 {output_dir}（{limit}）")
+
+
+def _acquire_run() -> bool:
+    """計測枠を1つ確保する（確保できなければFalse）"""
+    with _lock:
+        if not _state['enabled'] or _state['remaining_runs'] == 0:
+            return False
+        if _state['remaining_runs'] > 0:
+            _state['remaining_runs'] -= 1
+            if _state['remaining_runs'] == 0:
+                _state['enabled'] = False
+        return True
+
+
+def _start_profiler() -> Optional[cProfile.Profile]:
+    """
+    計測を開始する
+
+    Returns:
+        開始したプロファイラ（計測中は _profile_lock を保持する）。
+        無効・別スレッドで計測中・他のプロファイラが有効な場合はNone
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    if not _acquire_run():
+        _profile_lock.release()
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # 別のプロファイラ（python -m cProfile 等）が有効な場合
+        _profile_lock.release()
+        logger.warning(f"プロファイリングを開始できません: {e}")
+        return None
+    return profiler
+
+
+def _dump(profiler: cProfile.Profile, name: str, elapsed: float) -> Optional[str]:
+    """
+    プロファイル結果をファイルに保存し、要約をログ出力
+
+    Args:
+        profiler: 計測済みのプロファイラ
+        name: 計測対象の名前
+        elapsed: 実経過時間（秒）
+
+    Returns:
+        保存した .prof ファイルのパス（失敗時はNone）
+    """
+    output_dir = _state['output_dir']
+    top_n = _state['top_n']
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        base = os.path.join(
+            output_dir, f"{name}_{stamp}_{os.getpid()}_{threading.get_ident()}"
+        )
+        profiler.dump_stats(f"{base}.prof")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+        summary = stream.getvalue()
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"{name}: {elapsed:.3f}s\n\n{summary}")
+
+        logger.info(
+            f"📊 プロファイル保存: {base}.prof ({elapsed:.3f}s, 上位{top_n}件: {base}.txt)"
+        )
+        return f"{base}.prof"
+    except Exception as e:
+        logger.error(f"プロファイル保存エラー: {e}")
+        return None
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    関数呼び出しをcProfileで計測するデコレータ
+
+    無効時は判定1回分のオーバーヘッドのみ。同一スレッドでの
+    入れ子呼び出しは外側の計測に含まれるため、二重計測しない。
+    別スレッドで計測中の場合や、他のプロファイラが有効な場合は計測せずに実行する。
+
+    Args:
+        name: プロファイル名（省略時は関数名）
+    """
+    def decorator(func: Callable) -> Callable:
+        profile_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'active', False) or not _state['enabled']:
+                return func(*args, **kwargs)
+            profiler = _start_profiler()
+            if profiler is None:
+                return func(*args, **kwargs)
+
+            _local.active = True
+            start = time.perf_counter()
+            try:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+            finally:
+                _local.active = False
+                _profile_lock.release()
+                _dump(profiler, profile_name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
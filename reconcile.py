@@ -0,0 +1,301 @@
+"""
+Evernote照合ツール
+重複管理データベースの会話→ノート対応を、Evernote上のノートと照合して修復する
+
+使い方:
+    python reconcile.py [--full] [--dry-run]
+    python reconcile.py --rebuild [--restart]
+
+ノート本文はダウンロードしない。初回（または --full）は findNotesMetadata で
+contentHash と updateSequenceNum だけを250件ずつ取得して、記録済みのハッシュと
+まとめて比較する（2万件のノートブックでも80回程度の呼び出しで済む）。
+
+照合が完了したときのアカウントの updateCount をデータベースに記録し、
+次回からは getSyncState で updateCount を確認する。変わっていなければ1回の
+呼び出しで終了し、変わっていれば getFilteredSyncChunk でその後に変更された
+ノートだけを取得して照合する（費用はノートブックの大きさではなく変更量に比例）。
+
+- ノートブックにないノート（削除・移動）: 対応を外し、次回の保存で新規作成する
+- contentHash が記録と異なるノート（Evernote上で編集）: 対応を外し、編集内容を上書きしない
+- ハッシュの記録がないノート（照合機能の導入前に保存）: 現在の contentHash を基準として採用
+
+--rebuild は sync_history.db を失った場合に、ノート属性（sourceURL）に記録した
+会話IDと本文ダイジェストから対応表を再構築する。250件ごとに再開位置と合わせて
+記録するため、中断しても再実行すれば続きから再開でき、ノートは再アップロードしない。
+"""
+import argparse
+import logging
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from bulk_import import default_db_path
+from config import Config
+from duplicate_manager import DuplicateManager
+from evernote_sync import EvernoteSync, RateLimitError, parse_conversation_source_url
+
+logger = logging.getLogger(__name__)
+
+
+class Reconciler:
+    """会話→ノート対応とEvernote上のノートを照合する"""
+
+    def __init__(self, evernote: EvernoteSync, duplicate_manager: DuplicateManager):
+        """
+        Args:
+            evernote: 接続済みのEvernoteSync
+            duplicate_manager: 重複管理
+        """
+        self.evernote = evernote
+        self.duplicate_manager = duplicate_manager
+
+    def run(self, dry_run: bool = False, full: bool = False) -> Dict:
+        """
+        前回の照合以降に変更されたノートを照合し、対応を修復
+
+        Args:
+            dry_run: Trueの場合は判定結果だけを返し、データベースを変更しない
+            full: Trueの場合は照合位置に関わらずノートブック全体を照合
+
+        Returns:
+            統計情報（mode: 'unchanged' / 'incremental' / 'full', checked, missing,
+            edited, adopted, calls）
+
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合（何も反映しない）
+        """
+        cursor = None if full else self.duplicate_manager.get_sync_cursor()
+        # 全体照合中の変更は次回の差分照合で拾うよう、照合前の値を記録する
+        update_count = self.evernote.get_update_count()
+        calls = 1
+
+        if cursor is not None and cursor == update_count:
+            logger.info(f"Evernoteに変更はありません（updateCount {update_count}）")
+            return {'mode': 'unchanged', 'checked': 0, 'missing': 0, 'edited': 0,
+                    'adopted': 0, 'calls': calls}
+
+        mapping = self.duplicate_manager.get_note_mapping()
+        if cursor is None or cursor > update_count:
+            mode = 'full'
+            remote_hashes, scan_calls = self._scan_notebook(mapping)
+            new_cursor = update_count
+        else:
+            mode = 'incremental'
+            remote_hashes, scan_calls, new_cursor = self._scan_changes(mapping, cursor)
+        calls += scan_calls
+
+        missing: List[str] = []
+        edited: List[str] = []
+        adopted: Dict[str, str] = {}
+        for note_guid, remote_hash in remote_hashes.items():
+            stored_hash = mapping[note_guid]['note_content_hash']
+            if remote_hash is None:
+                missing.append(note_guid)
+            elif stored_hash is None:
+                adopted[note_guid] = remote_hash
+            elif stored_hash != remote_hash:
+                edited.append(note_guid)
+
+        for note_guid in missing:
+            logger.info(f"🗑️ ノートが見つかりません: {mapping[note_guid]['canonical_id']} ({note_guid})")
+        for note_guid in edited:
+            logger.info(f"✏️ Evernote上で編集されています: {mapping[note_guid]['canonical_id']} ({note_guid})")
+
+        if not dry_run:
+            unlink = {
+                note_guid: mapping[note_guid]['note_content_hash']
+                for note_guid in missing + edited
+            }
+            if (not (unlink or adopted)
+                    or self.duplicate_manager.apply_reconciliation(unlink, adopted)):
+                self.duplicate_manager.set_sync_cursor(new_cursor)
+
+        return {
+            'mode': mode,
+            'checked': len(remote_hashes),
+            'missing': len(missing),
+            'edited': len(edited),
+            'adopted': len(adopted),
+            'calls': calls,
+        }
+
+    def rebuild(self, restart: bool = False) -> Dict:
+        """
+        ノート属性から会話IDインデックスを再構築（中断した位置から再開）
+
+        Args:
+            restart: Trueの場合は記録された再開位置を無視して最初から取得
+
+        Returns:
+            統計情報（restored, unstamped, resumed_from, calls）
+
+        Raises:
+            RateLimitError: Evernoteのレート制限に達した場合（再実行で続きから再開）
+        """
+        offset = None if restart else self.duplicate_manager.get_sync_state('rebuild_offset')
+        if offset is None:
+            offset = 0
+            # 再構築中の変更は完了後の差分照合で拾うよう、開始時の値を完了時に記録する
+            self.duplicate_manager.set_sync_state(
+                'rebuild_update_count', self.evernote.get_update_count()
+            )
+        else:
+            logger.info(f"前回の続き（{offset}件目）から再構築します")
+
+        stats = {'restored': 0, 'unstamped': 0, 'resumed_from': offset, 'calls': 0}
+        for next_offset, notes in self.evernote.iter_notes_metadata(
+                offset=offset, include_attributes=True):
+            stats['calls'] += 1
+            rows = []
+            for note in notes:
+                stamp = parse_conversation_source_url(
+                    note.attributes.sourceURL if note.attributes else None
+                )
+                if stamp is None:
+                    # 属性の記録を始める前に作成したノート
+                    stats['unstamped'] += 1
+                    continue
+                conversation_id, content_digest = stamp
+                rows.append((
+                    self.duplicate_manager.canonical_conversation_id(conversation_id),
+                    note.guid,
+                    content_digest,
+                    note.contentHash.hex() if note.contentHash else None
+                ))
+            if not self.duplicate_manager.restore_conversations(rows, rebuild_offset=next_offset):
+                raise RuntimeError("会話インデックスを保存できません。再構築を中止します")
+            stats['restored'] += len(rows)
+            logger.info(f"再構築: {next_offset}件目まで取得（復元 {stats['restored']}件）")
+
+        update_count = self.duplicate_manager.get_sync_state('rebuild_update_count')
+        if update_count is not None:
+            self.duplicate_manager.set_sync_cursor(update_count)
+        self.duplicate_manager.set_sync_state('rebuild_offset', None)
+        self.duplicate_manager.set_sync_state('rebuild_update_count', None)
+        return stats
+
+    def _scan_notebook(
+        self,
+        mapping: Dict[str, Dict]
+    ) -> Tuple[Dict[str, Optional[str]], int]:
+        """
+        ノートブック全体のメタデータを取得
+
+        Returns:
+            (対応のあるノートGUID → contentHash（見つからなければNone）, API呼び出し回数)
+        """
+        found: Dict[str, str] = {}
+        calls = 0
+        for _offset, notes in self.evernote.iter_notes_metadata():
+            calls += 1
+            for note in notes:
+                if note.contentHash:
+                    found[note.guid] = note.contentHash.hex()
+
+        if mapping and not found:
+            # 別のノートブックを参照している可能性が高いため、対応をすべて外すことはしない
+            raise RuntimeError(
+                f"ノートブック '{self.evernote.notebook_name}' にノートが見つかりません。"
+                f"照合を中止します"
+            )
+        return {note_guid: found.get(note_guid) for note_guid in mapping}, calls
+
+    def _scan_changes(
+        self,
+        mapping: Dict[str, Dict],
+        after_usn: int
+    ) -> Tuple[Dict[str, Optional[str]], int, int]:
+        """
+        指定したUSNより後に変更されたノートのうち、対応のあるものを取得
+
+        Returns:
+            (ノートGUID → contentHash（削除・移動済みならNone）, API呼び出し回数, 照合済みのUSN)
+        """
+        changed: Dict[str, Optional[str]] = {}
+        calls = 0
+        for high_usn, notes, expunged in self.evernote.iter_note_changes(after_usn):
+            calls += 1
+            after_usn = high_usn
+            for note in notes:
+                if note.guid not in mapping:
+                    continue
+                if not note.active or note.notebookGuid != self.evernote.notebook_guid:
+                    changed[note.guid] = None
+                else:
+                    changed[note.guid] = note.contentHash.hex() if note.contentHash else None
+            for note_guid in expunged:
+                if note_guid in mapping:
+                    changed[note_guid] = None
+        return changed, calls, after_usn
+
+
+def main(argv=None) -> int:
+    """
+    コマンドラインエントリポイント
+
+    Returns:
+        終了コード（0: 完了、1: エラー、2: レート制限で中断）
+    """
+    arg_parser = argparse.ArgumentParser(
+        description='会話→ノート対応をEvernote上のノートと照合して修復'
+    )
+    arg_parser.add_argument('--db', default=default_db_path(),
+                            help='重複管理データベースのパス（サーバーと共有）')
+    arg_parser.add_argument('--full', action='store_true',
+                            help='前回の照合位置に関わらずノートブック全体を照合する')
+    arg_parser.add_argument('--dry-run', action='store_true',
+                            help='判定結果を表示するだけで、データベースを変更しない')
+    arg_parser.add_argument('--rebuild', action='store_true',
+                            help='ノート属性から会話→ノート対応を再構築する（データベース消失時）')
+    arg_parser.add_argument('--restart', action='store_true',
+                            help='--rebuild を中断した位置からではなく最初からやり直す')
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    try:
+        reconciler = Reconciler(
+            EvernoteSync.from_config(Config()),
+            DuplicateManager(db_path=args.db)
+        )
+        if args.rebuild:
+            stats = reconciler.rebuild(restart=args.restart)
+        else:
+            stats = reconciler.run(dry_run=args.dry_run, full=args.full)
+    except RateLimitError as e:
+        if args.rebuild:
+            print(f"⏳ レート制限で中断しました。{e.duration}秒後に再実行すると続きから再開します")
+        else:
+            print(f"⏳ レート制限で中断しました。{e.duration}秒後に再実行してください")
+        return 2
+    except KeyboardInterrupt:
+        print("\n⏸️ 中断しました")
+        return 1
+    except Exception as e:
+        logger.error(f"照合エラー: {e}", exc_info=True)
+        print(f"❌ 照合エラー: {e}")
+        return 1
+
+    if args.rebuild:
+        print(
+            f"✅ 再構築完了（API呼び出し {stats['calls']}回）: 復元 {stats['restored']}件 / "
+            f"会話IDの記録がないノート {stats['unstamped']}件"
+        )
+        return 0
+    if stats['mode'] == 'unchanged':
+        print("✅ 前回の照合以降、Evernoteに変更はありません")
+        return 0
+    mode_label = '全体' if stats['mode'] == 'full' else '差分'
+    print(
+        f"✅ {mode_label}照合 {stats['checked']}件（API呼び出し {stats['calls']}回）: "
+        f"削除・移動 {stats['missing']}件 / 編集 {stats['edited']}件 / "
+        f"ハッシュ採用 {stats['adopted']}件"
+        + ("（--dry-run のため未反映）" if args.dry_run else "")
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+リクエスト本文デコードモジュール
+Chrome拡張から送られる圧縮済み（gzip / deflate）リクエスト本文を展開する
+"""
+import zlib
+from typing import Optional
+
+# 展開後の本文サイズ上限（圧縮爆弾対策）
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+
+# Content-Encoding → zlibのwbits
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+class UnsupportedEncodingError(ValueError):
+    """対応していないContent-Encoding"""
+
+
+def decode_body(
+    raw_body: bytes,
+    content_encoding: Optional[str],
+    max_bytes: int = MAX_DECODED_BYTES
+) -> bytes:
+    """
+    Content-Encodingに従ってリクエスト本文を展開
+
+    Args:
+        raw_body: 受信した本文
+        content_encoding: Content-Encodingヘッダーの値（Noneまたは'identity'で無圧縮）
+        max_bytes: 展開後サイズの上限
+
+    Returns:
+        展開後の本文
+
+    Raises:
+        UnsupportedEncodingError: 未対応のエンコーディング
+        ValueError: 展開に失敗、または上限を超えた場合
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return raw_body
+    if encoding not in _WBITS:
+        raise UnsupportedEncodingError(f"未対応のContent-Encoding: {encoding}")
+
+    decompressor = zlib.decompressobj(_WBITS[encoding])
+    try:
+        body = decompressor.decompress(raw_body, max_bytes)
+        # 上限で止めた残り（unconsumed_tail）と、flush で出てくる未出力分の両方を数える
+        if not decompressor.unconsumed_tail:
+            body += decompressor.flush()
+        if decompressor.unconsumed_tail or len(body) > max_bytes:
+            raise ValueError(f"展開後の本文が上限（{max_bytes}バイト）を超えています")
+    except zlib.error as e:
+        raise ValueError(f"リクエスト本文の展開に失敗しました: {e}") from e
+    return body
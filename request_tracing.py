@@ -0,0 +1,192 @@
+"""
+リクエストトレーシングモジュール
+/api/save などのリクエスト単位でトレースIDとステージ別の所要時間を記録し、
+JSON Lines形式で非同期にログ出力する
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# トレース出力専用ロガー（JSON Linesのみを書き出す）
+TRACE_LOGGER_NAME = 'trace'
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """ログレコードを1行1JSONに整形するフォーマッタ"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = getattr(record, 'trace', None)
+        if payload is None:
+            payload = {
+                'ts': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+        return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def setup_logging(
+    log_file: str,
+    trace_log_file: str,
+    level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """
+    ログ出力をQueueHandler/QueueListener経由の非同期出力に設定
+
+    リクエストスレッドはキューに積むだけで、ファイルI/Oは
+    リスナースレッドが行う。
+
+    Args:
+        log_file: 通常ログの出力先ファイル
+        trace_log_file: トレース（JSON Lines）の出力先ファイル
+        level: ルートロガーのログレベル
+
+    Returns:
+        開始済みのQueueListener（終了時に stop() を呼ぶこと）
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    text_formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(text_formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(text_formatter)
+
+    # トレースレコードは専用ファイルにのみ書き出す
+    trace_handler = logging.FileHandler(trace_log_file, encoding='utf-8')
+    trace_handler.setFormatter(JsonLinesFormatter())
+    trace_handler.addFilter(lambda r: r.name == TRACE_LOGGER_NAME)
+    file_handler.addFilter(lambda r: r.name != TRACE_LOGGER_NAME)
+    stream_handler.addFilter(lambda r: r.name != TRACE_LOGGER_NAME)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        file_handler,
+        stream_handler,
+        trace_handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    return listener
+
+
+class RequestTrace:
+    """1リクエスト分のトレース（トレースIDとスパン計測）"""
+
+    def __init__(
+        self,
+        name: str,
+        slow_threshold_ms: float = 3000.0,
+        trace_id: Optional[str] = None
+    ):
+        """
+        Args:
+            name: トレース名（例: 'api.save'）
+            slow_threshold_ms: この時間を超えたら低速リクエストとして記録
+            trace_id: 既存のトレースID（Noneの場合は自動生成）
+        """
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.slow_threshold_ms = slow_threshold_ms
+        self.attributes: Dict[str, object] = {}
+        self.spans: List[Dict[str, object]] = []
+        self._started = time.perf_counter()
+        self._started_wall = time.time()
+        self._lock = threading.Lock()
+        self._finished = False
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        ステージの所要時間を計測するコンテキストマネージャ
+
+        Args:
+            name: ステージ名（例: 'render', 'evernote.update'）
+        """
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            entry = {
+                'name': name,
+                'start_ms': round((start - self._started) * 1000, 2),
+                'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+            }
+            if error:
+                entry['error'] = error
+            with self._lock:
+                self.spans.append(entry)
+
+    def set(self, **attributes) -> None:
+        """トレースに属性を追加"""
+        self.attributes.update(attributes)
+
+    @property
+    def elapsed_ms(self) -> float:
+        """トレース開始からの経過時間（ミリ秒）"""
+        return (time.perf_counter() - self._started) * 1000
+
+    def finish(self, status: str = 'ok') -> Dict[str, object]:
+        """
+        トレースを終了してJSON Linesとして出力
+
+        閾値を超えた場合はステージ内訳付きで警告ログも出す。
+
+        Args:
+            status: 結果ステータス（'ok' / 'error' など）
+
+        Returns:
+            出力したトレースレコード
+        """
+        total_ms = round(self.elapsed_ms, 2)
+        slow = total_ms >= self.slow_threshold_ms
+        record = {
+            'ts': self._started_wall,
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'status': status,
+            'duration_ms': total_ms,
+            'slow': slow,
+            'attributes': self.attributes,
+        }
+        # 通常はスパン名と時間のみ、低速時は開始オフセットを含む完全な内訳
+        if slow:
+            record['spans'] = self.spans
+        else:
+            record['spans'] = {s['name']: s['duration_ms'] for s in self.spans}
+
+        if not self._finished:
+            self._finished = True
+            logging.getLogger(TRACE_LOGGER_NAME).info(
+                self.name, extra={'trace': record}
+            )
+            if slow:
+                breakdown = ', '.join(
+                    f"{s['name']}={s['duration_ms']}ms" for s in self.spans
+                )
+                logger.warning(
+                    f"🐢 低速リクエスト [{self.trace_id}] {self.name}: "
+                    f"{total_ms}ms ({breakdown})"
+                )
+        return record
@@ -0,0 +1,134 @@
+"""
+同一キーの処理をまとめるモジュール（シングルフライト）
+同じ会話の保存が同時・連続に届いた場合に、Evernoteへのアップロードを1回にまとめる
+
+- 最初のリクエストが実行役になり、すぐに実行する
+- 実行中に届いたリクエストは待機し、内容は最新のもので置き換える（最新の内容が勝つ）
+- 実行中に新しい内容が届いていれば、実行役が短い待機時間（デバウンス）の間に届く内容を
+  集めてから、最新の内容でもう一度だけ実行する（処理関数も最新のリクエストのものを使う）
+- 実行が終わった直後に届いたリクエストも、終了からデバウンス分待ってから実行する
+- 待機していたリクエストは、自分の内容以降を反映した実行の結果を受け取る
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    """1キー分の実行状態（SingleFlight のロック内で操作する）"""
+
+    def __init__(self, lock: threading.Lock):
+        self.condition = threading.Condition(lock)
+        self.latest: Any = None
+        self.generation = 0
+        self.completed_generation = 0
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """キーごとに処理を1つずつ実行し、実行中・待機中のリクエストをまとめる"""
+
+    def __init__(self, debounce: float = 0.3):
+        """
+        Args:
+            debounce: 続けて届いたリクエストを実行する前に、後続を待つ秒数（0で待たない）
+        """
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        # 直近に実行を終えたキーと終了時刻（デバウンス分だけ保持する）
+        self._finished_at: Dict[Hashable, float] = {}
+
+    def run(
+        self,
+        key: Hashable,
+        payload: Any,
+        fn: Callable[[Any], Any],
+        replace: bool = True
+    ) -> Tuple[Any, bool]:
+        """
+        キーの処理を実行（実行中であれば合流して結果を待つ）
+
+        Args:
+            key: まとめる単位（正規化した会話ID）
+            payload: 処理する内容
+            fn: 内容を受け取って処理する関数（最新の内容を渡したリクエストの関数が呼ばれる）
+            replace: Falseの場合、実行中の処理には内容を渡さずに合流だけする
+                （送信待ちの再試行など、より新しい内容を上書きしてはいけない場合）
+
+        Returns:
+            (処理結果, 他のリクエストの実行に合流した場合True)
+
+        Raises:
+            処理が送出した例外（合流したリクエストにも同じ例外を送出）
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                if replace:
+                    flight.latest = (payload, fn)
+                    flight.generation += 1
+                generation = flight.generation
+                while flight.completed_generation < generation:
+                    flight.condition.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+
+            flight = _Flight(self._lock)
+            flight.latest = (payload, fn)
+            flight.generation = 1
+            self._flights[key] = flight
+            delay = self._debounce_after_finish(key)
+
+        try:
+            while True:
+                if delay > 0:
+                    time.sleep(delay)
+                delay = self.debounce
+                with self._lock:
+                    generation = flight.generation
+                    latest, latest_fn = flight.latest
+
+                result, error = None, None
+                try:
+                    result = latest_fn(latest)
+                except BaseException as e:
+                    error = e
+
+                with self._lock:
+                    flight.result, flight.error = result, error
+                    flight.completed_generation = generation
+                    flight.condition.notify_all()
+                    if flight.generation == generation:
+                        del self._flights[key]
+                        self._finished_at[key] = time.monotonic()
+                        break
+        except BaseException as e:
+            # 予期しない中断でも待機中のリクエストを解放する
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.error = e
+                flight.completed_generation = flight.generation
+                flight.condition.notify_all()
+            raise
+
+        if error is not None:
+            raise error
+        return result, False
+
+    def _debounce_after_finish(self, key: Hashable) -> float:
+        """
+        直前に実行を終えたキーであれば、終了からデバウンス分までの残り秒数を返す
+        （ロック内で呼び出す）
+        """
+        now = time.monotonic()
+        for finished_key, finished_at in list(self._finished_at.items()):
+            if now - finished_at >= self.debounce:
+                del self._finished_at[finished_key]
+        finished_at = self._finished_at.get(key)
+        if finished_at is None:
+            return 0.0
+        return self.debounce - (now - finished_at)
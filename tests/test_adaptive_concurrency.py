@@ -0,0 +1,82 @@
+"""同時アップロード数の自動調整（AIMD）とスレッドごとの NoteStore"""
+import threading
+
+from adaptive_concurrency import AIMDLimiter
+from evernote_sync import EvernoteSync
+
+
+def test_saturated_success_adds_about_one_per_round_trip():
+    limiter = AIMDLimiter(initial=2, max_limit=8, latency_target=5.0)
+    limiter.on_success(0.1, saturated=True)
+    assert limiter.limit == 2
+    limiter.on_success(0.1, saturated=True)
+    limiter.on_success(0.1, saturated=True)
+    assert limiter.limit == 3
+
+
+def test_unsaturated_success_keeps_limit():
+    limiter = AIMDLimiter(initial=2)
+    for _ in range(10):
+        limiter.on_success(0.1, saturated=False)
+    assert limiter.limit == 2
+
+
+def test_limit_stops_at_max():
+    limiter = AIMDLimiter(initial=2, max_limit=4)
+    for _ in range(100):
+        limiter.on_success(0.1, saturated=True)
+    assert limiter.limit == 4
+
+
+def test_congestion_halves_once_per_latency_target(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('adaptive_concurrency.time.monotonic', lambda: now[0])
+    limiter = AIMDLimiter(initial=8, max_limit=8, latency_target=5.0)
+    assert limiter.on_congestion('timeout') == 4
+    # 同じ混雑で続けて失敗しても、目標時間内は1回しか減らさない
+    assert limiter.on_congestion('timeout') == 4
+    now[0] += 5.0
+    assert limiter.on_congestion('timeout') == 2
+    now[0] += 5.0
+    assert limiter.on_congestion('timeout') == 1
+    now[0] += 5.0
+    assert limiter.on_congestion('timeout') == 1
+
+
+def test_slow_success_counts_as_congestion():
+    limiter = AIMDLimiter(initial=4, latency_target=5.0)
+    assert limiter.on_success(6.0, saturated=True) == 2
+
+
+def test_set_bounds_clamps_current_limit():
+    limiter = AIMDLimiter(initial=6, max_limit=8)
+    assert limiter.set_bounds(1, 3) == 3
+    assert limiter.set_bounds(5, 10) == 5
+
+
+class FakeClient:
+    def __init__(self):
+        self.created = []
+
+    def get_note_store(self):
+        note_store = object()
+        self.created.append(note_store)
+        return note_store
+
+
+def test_each_thread_gets_its_own_note_store():
+    sync = EvernoteSync.__new__(EvernoteSync)
+    sync.client = FakeClient()
+    sync.timeout = 1.0
+    sync._local = threading.local()
+
+    main_store = sync.note_store
+    assert sync.note_store is main_store
+
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(sync.note_store))
+    worker.start()
+    worker.join()
+
+    assert seen[0] is not main_store
+    assert len(sync.client.created) == 2
@@ -0,0 +1,64 @@
+"""一括インポートのアップロード（ノートの作成・更新とチェックポイント）"""
+from contextlib import contextmanager
+
+import pytest
+
+from bulk_import import BulkImporter
+from conversation_model import Conversation, Message
+from duplicate_manager import DuplicateManager
+from evernote_sync import NoteNotFoundError
+
+
+class FakeEvernote:
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.created = []
+        self.updated = []
+
+    def create_note(self, **kwargs):
+        self.created.append(kwargs)
+        return f'guid-{len(self.created)}'
+
+    def update_note(self, note_guid, **kwargs):
+        if note_guid in self.missing:
+            raise NoteNotFoundError(note_guid)
+        self.updated.append(note_guid)
+        return True
+
+    def content_hash(self, content):
+        return 'hash'
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return DuplicateManager(db_path=str(tmp_path / 'sync_history.db'))
+
+
+def conversation(text='本文'):
+    return Conversation('conv-1', 'タイトル', [Message('user', text)], 1.0, 2.0)
+
+
+def test_deleted_note_is_unlinked_and_recreated(manager):
+    manager.record_conversation('conv-1', 'deleted-guid', 'old', source='export')
+    evernote = FakeEvernote(missing={'deleted-guid'})
+    importer = BulkImporter(None, evernote, manager)
+
+    action = importer.upload_conversation(conversation(), '<en-note/>', 'new')
+
+    assert action == 'created'
+    assert manager.lookup_conversation('conv-1')['note_guid'] == 'guid-1'
+
+
+def test_slot_is_held_only_for_evernote_writes(manager):
+    entered = []
+
+    @contextmanager
+    def slot():
+        entered.append(True)
+        yield
+
+    importer = BulkImporter(None, FakeEvernote(), manager, upload_slot=slot)
+    assert importer.upload_conversation(conversation(), '<en-note/>', 'd1') == 'created'
+    assert importer.upload_conversation(conversation(), '<en-note/>', 'd1') == 'unchanged'
+    assert importer.upload_conversation(conversation('変更'), '<en-note/>', 'd2') == 'updated'
+    assert len(entered) == 2
@@ -0,0 +1,80 @@
+"""Evernote呼び出しの回路遮断"""
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('circuit_breaker.time.monotonic', lambda: now[0])
+    return now
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.snapshot()['state'] == 'closed'
+    breaker.before_call()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+    assert breaker.snapshot() == {'state': 'open', 'consecutive_failures': 3, 'retry_after': 30.0}
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.before_call()
+    assert breaker.snapshot()['state'] == 'closed'
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    trip(breaker)
+    clock[0] += 30.0
+    assert breaker.snapshot()['state'] == 'half_open'
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.snapshot()['state'] == 'closed'
+    breaker.before_call()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    trip(breaker)
+    clock[0] += 30.0
+    breaker.before_call()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+
+
+def test_stuck_probe_is_replaced_after_reset_timeout(clock):
+    # 試行した呼び出しが結果を返さないまま終わっても、遮断し続けない
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    trip(breaker)
+    clock[0] += 30.0
+    breaker.before_call()
+    clock[0] += 30.0
+    breaker.before_call()
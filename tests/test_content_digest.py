@@ -0,0 +1,66 @@
+"""本文ダイジェスト: 拡張機能のHTMLとエクスポートのMarkdownが同じ値になるか"""
+import pytest
+
+from conversation_model import Message
+from duplicate_manager import DuplicateManager
+from message_text import message_plain_text
+
+
+def digest(*contents, role='assistant', attachments=()):
+    return DuplicateManager.compute_content_digest(
+        [Message(role, content, attachments=attachments) for content in contents]
+    )
+
+
+@pytest.mark.parametrize('rendered, source', [
+    ('<p>これは<strong>太字</strong>と<em>斜体</em>です</p>', 'これは**太字**と*斜体*です'),
+    ('<h2>手順</h2><ol><li><p>インストール</p></li><li><p>設定</p></li></ol>',
+     '## 手順\n\n1. インストール\n2. 設定'),
+    ('<ul><li>項目A</li><li>項目B</li></ul>', '- 項目A\n- 項目B'),
+    ('<p>詳細は<a href="https://example.com">こちら</a></p>', '詳細は[こちら](https://example.com)'),
+    ('<blockquote><p>引用文</p></blockquote>', '> 引用文'),
+    ('<p>変数 <code>snake_case</code> を使う</p>', '変数 `snake_case` を使う'),
+    ('<pre><code class="language-python">x = a * b\nprint(x_1)\n</code></pre>',
+     '```python\nx = a * b\nprint(x_1)\n```'),
+    ('<table><thead><tr><th>名前</th><th>値</th></tr></thead>'
+     '<tbody><tr><td>a</td><td>1</td></tr></tbody></table>',
+     '| 名前 | 値 |\n|---|---|\n| a | 1 |'),
+    ('<p>a &lt; b &amp;&amp; c</p>', 'a < b && c'),
+    ('<p>1 * 2 = 2、file_name.txt</p>', '1 * 2 = 2、file_name.txt'),
+    ('<p>*そのまま*</p>', r'\*そのまま\*'),
+    ('<hr><p>後半</p>', '---\n\n後半'),
+])
+def test_extension_html_matches_export_markdown(rendered, source):
+    assert digest(rendered) == digest(source)
+
+
+def test_user_message_text_matches():
+    # ユーザーのメッセージはレンダリングされず、エスケープされたテキストで届く
+    assert digest('if a &lt; b:\n    pass', role='user') == digest('if a < b:\n    pass', role='user')
+
+
+@pytest.mark.parametrize('before, after', [
+    ('x = a - b', 'x = a + b'),
+    ('`a*b`', '`a**b`'),
+    ('値は -1 です', '値は 1 です'),
+    ('| a | 1 |', '| a | 2 |'),
+])
+def test_meaningful_symbol_changes_change_digest(before, after):
+    assert digest(before) != digest(after)
+
+
+def test_whitespace_differences_are_ignored():
+    assert digest('<p>a</p>\n\n<p>b</p>') == digest('<p>a</p><p>b</p>') == digest('a\n\nb')
+
+
+def test_attachments_do_not_affect_digest():
+    image = {'md5': '0' * 32, 'mime': 'image/png'}
+    assert digest('図の説明', attachments=(image,)) == digest('図の説明')
+
+
+def test_role_is_part_of_digest():
+    assert digest('同じ本文', role='user') != digest('同じ本文', role='assistant')
+
+
+def test_html_detection_ignores_comparison_operators():
+    assert message_plain_text('a <b and c> d') == 'a <b and c> d'
@@ -0,0 +1,40 @@
+"""エクスポートフォルダの監視"""
+import threading
+import zipfile
+
+from chatgpt_export import ChatGPTExportParser
+from export_watcher import ExportWatcher
+
+
+def write_zip(path):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('conversations.json', '[]')
+
+
+def test_existing_zips_are_queued_on_start(tmp_path):
+    existing = tmp_path / 'chatgpt-export.zip'
+    write_zip(existing)
+    (tmp_path / 'other.zip').write_bytes(b'')
+    watcher = ExportWatcher(
+        ChatGPTExportParser(str(tmp_path)), settle_seconds=0.01, poll_interval=60, use_polling=True
+    )
+    watcher.start()
+    try:
+        assert watcher.ready_queue.get(timeout=5) == str(existing)
+    finally:
+        watcher.stop()
+
+
+def test_run_forever_returns_when_stopped(tmp_path):
+    watcher = ExportWatcher(
+        ChatGPTExportParser(str(tmp_path)), settle_seconds=0.01, poll_interval=60, use_polling=True
+    )
+    watcher.start()
+    handled = threading.Event()
+    runner = threading.Thread(target=watcher.run_forever, args=(lambda path: handled.set(),))
+    runner.start()
+    watcher.ready_queue.put('chatgpt-a.zip')
+    assert handled.wait(5)
+    watcher.stop()
+    runner.join(5)
+    assert not runner.is_alive()
@@ -0,0 +1,71 @@
+"""エクスポートのJSON配列を少しずつ読む処理（_iter_json_array）"""
+import io
+import json
+import random
+
+import pytest
+
+from chatgpt_export import _iter_json_array
+
+
+class ShortReader:
+    """read(n) が n 文字未満を返すこともあるファイル（圧縮ファイル等の読み込みを模す）"""
+
+    def __init__(self, text, seed):
+        self.text = text
+        self.pos = 0
+        self.rng = random.Random(seed)
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.text) - self.pos
+        size = self.rng.randint(1, max(1, size))
+        chunk = self.text[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+SAMPLES = [
+    [],
+    [1234, 5678, -9.5e3, 0],
+    [True, False, None, 'truth'],
+    ['a, b', '] ,', '\\"quoted\\"', '日本語'],
+    [{'id': 'c1', 'mapping': {'m': {'text': 'x' * 50}}}, [1, [2, [3]]], {}],
+]
+
+
+@pytest.mark.parametrize('values', SAMPLES)
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 8, 64])
+def test_reads_all_elements_at_any_chunk_size(values, chunk_size):
+    text = json.dumps(values, ensure_ascii=False)
+    assert list(_iter_json_array(io.StringIO(text), chunk_size)) == values
+
+
+@pytest.mark.parametrize('values', SAMPLES)
+@pytest.mark.parametrize('seed', range(20))
+def test_reads_all_elements_with_short_reads(values, seed):
+    text = json.dumps(values, ensure_ascii=False, indent=random.Random(seed).choice([None, 1]))
+    assert list(_iter_json_array(ShortReader(text, seed), 4)) == values
+
+
+def test_number_split_at_chunk_boundary_is_not_truncated():
+    # 「[12」「34, 5]」のように数値の途中で読み込みが途切れても、続きを読んでから確定する
+    reader = ShortReader('[1234, 5]', 0)
+    reader.rng.randint = lambda a, b: 3
+    assert list(_iter_json_array(reader, 3)) == [1234, 5]
+
+
+def test_leading_whitespace_is_skipped():
+    assert list(_iter_json_array(io.StringIO('\n  [1, 2]'), 2)) == [1, 2]
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 1}',
+    '[1 2]',
+    '[1, 2',
+    '[1, {"a": ',
+    '[1, tru',
+])
+def test_rejects_invalid_json(text):
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO(text), 3))
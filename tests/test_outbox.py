@@ -0,0 +1,100 @@
+"""送信待ち（アウトボックス）の登録・再試行・デッドレター"""
+import sqlite3
+import time
+
+import pytest
+
+from duplicate_manager import DuplicateManager
+from evernote_sync import EvernoteWriteError, RateLimitError
+from outbox import OutboxRetrier
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return DuplicateManager(db_path=str(tmp_path / 'sync_history.db'))
+
+
+def only_entry(manager):
+    entries = manager.get_due_outbox(time.time() + 10 ** 6)
+    assert len(entries) == 1
+    conn = sqlite3.connect(manager.db_path)
+    (next_attempt_at,) = conn.execute(
+        'SELECT next_attempt_at FROM outbox WHERE id = ?', (entries[0]['id'],)
+    ).fetchone()
+    conn.close()
+    return dict(entries[0], next_attempt_at=next_attempt_at)
+
+
+def test_reenqueue_before_first_retry_keeps_earliest_attempt(manager):
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 100.0, 'e')
+    manager.enqueue_outbox('save', 'c1', {'v': 2}, 50.0, 'e')
+    entry = only_entry(manager)
+    assert entry['next_attempt_at'] == 50.0
+    assert entry['payload'] == {'v': 2}
+
+
+def test_reenqueue_after_retries_keeps_backoff(manager):
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 100.0, 'e')
+    manager.reschedule_outbox(only_entry(manager)['id'], 3, 5000.0, 'e')
+
+    manager.enqueue_outbox('save', 'c1', {'v': 2}, 60.0, 'e')
+
+    entry = only_entry(manager)
+    assert entry['next_attempt_at'] == 5000.0
+    assert entry['attempts'] == 3
+    assert entry['payload'] == {'v': 2}
+
+
+def test_backoff_grows_and_is_capped():
+    retrier = OutboxRetrier(None, {}, base_delay=5.0, max_delay=60.0)
+    for attempts in range(10):
+        delay = retrier.backoff(attempts)
+        assert 5.0 <= delay <= min(60.0, 5.0 * 2 ** attempts)
+
+
+def test_transient_failure_is_rescheduled_then_dead_lettered(manager):
+    def fail(payload):
+        raise EvernoteWriteError('timeout', permanent=False)
+
+    retrier = OutboxRetrier(manager, {'save': fail}, base_delay=0.0, max_delay=0.0, max_attempts=2)
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 0.0, 'e')
+
+    assert retrier.retry_due() == 0
+    assert only_entry(manager)['attempts'] == 1
+    retrier.retry_due()
+    assert manager.get_outbox_count() == 0
+    assert [d['key'] for d in manager.list_dead_letters()] == ['c1']
+
+
+def test_permanent_failure_is_dead_lettered_immediately(manager):
+    def fail(payload):
+        raise EvernoteWriteError('ENML', permanent=True)
+
+    retrier = OutboxRetrier(manager, {'save': fail})
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 0.0, 'e')
+    retrier.retry_due()
+    assert manager.get_outbox_count() == 0
+    assert len(manager.list_dead_letters()) == 1
+
+
+def test_rate_limit_defers_without_counting_an_attempt(manager):
+    def limited(payload):
+        raise RateLimitError(120)
+
+    retrier = OutboxRetrier(manager, {'save': limited})
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 0.0, 'e')
+    retrier.retry_due()
+    entry = only_entry(manager)
+    assert entry['attempts'] == 0
+    assert entry['next_attempt_at'] >= time.time() + 100
+
+
+def test_success_keeps_payload_replaced_during_retry(manager):
+    def replay(payload):
+        # 再試行中に新しい内容で登録し直された
+        manager.enqueue_outbox('save', 'c1', {'v': 2}, 0.0, None)
+
+    retrier = OutboxRetrier(manager, {'save': replay})
+    manager.enqueue_outbox('save', 'c1', {'v': 1}, 0.0, 'e')
+    assert retrier.retry_due() == 1
+    assert only_entry(manager)['payload'] == {'v': 2}
@@ -0,0 +1,136 @@
+"""会話→ノート対応とEvernote上のノートの照合"""
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from duplicate_manager import DuplicateManager
+from reconcile import Reconciler
+
+NOTEBOOK = 'nb-1'
+
+
+def md5(text):
+    return hashlib.md5(text.encode()).digest()
+
+
+def note(guid, content='本文', active=True, notebook=NOTEBOOK):
+    return SimpleNamespace(
+        guid=guid, contentHash=md5(content), active=active, notebookGuid=notebook
+    )
+
+
+class FakeEvernote:
+    notebook_guid = NOTEBOOK
+    notebook_name = 'ChatGPT'
+
+    def __init__(self, update_count, notes=(), changes=()):
+        self.update_count = update_count
+        self.notes = list(notes)
+        self.changes = list(changes)
+
+    def get_update_count(self):
+        return self.update_count
+
+    def iter_notes_metadata(self, offset=0, include_attributes=False):
+        yield len(self.notes), self.notes
+
+    def iter_note_changes(self, after_usn):
+        for change in self.changes:
+            yield change
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return DuplicateManager(db_path=str(tmp_path / 'sync_history.db'))
+
+
+def record(manager, canonical_id, note_guid, content):
+    hash_hex = md5(content).hex() if content is not None else None
+    assert manager.record_conversation(canonical_id, note_guid, 'digest', 'export',
+                                       note_content_hash=hash_hex)
+
+
+@pytest.fixture
+def mapped(manager):
+    record(manager, 'same', 'g-same', '本文')
+    record(manager, 'edited', 'g-edited', '本文')
+    record(manager, 'missing', 'g-missing', '本文')
+    record(manager, 'unhashed', 'g-unhashed', None)
+    return manager
+
+
+FULL_NOTES = [
+    note('g-same'),
+    note('g-edited', 'Evernote上で編集'),
+    note('g-unhashed', '採用される本文'),
+    note('g-unmapped'),
+]
+
+
+def test_full_scan_decision_table(mapped):
+    stats = Reconciler(FakeEvernote(10, FULL_NOTES), mapped).run()
+
+    assert stats == {'mode': 'full', 'checked': 4, 'missing': 1, 'edited': 1,
+                     'adopted': 1, 'calls': 2}
+    mapping = mapped.get_note_mapping()
+    assert set(mapping) == {'g-same', 'g-unhashed'}
+    assert mapping['g-unhashed']['note_content_hash'] == md5('採用される本文').hex()
+    assert mapped.get_sync_cursor() == 10
+
+
+def test_dry_run_changes_nothing(mapped):
+    before = mapped.get_note_mapping()
+    stats = Reconciler(FakeEvernote(10, FULL_NOTES), mapped).run(dry_run=True)
+
+    assert (stats['missing'], stats['edited'], stats['adopted']) == (1, 1, 1)
+    assert mapped.get_note_mapping() == before
+    assert mapped.get_sync_cursor() is None
+
+
+def test_unchanged_update_count_makes_one_call(mapped):
+    mapped.set_sync_cursor(10)
+    evernote = FakeEvernote(10)
+    evernote.iter_notes_metadata = None
+    evernote.iter_note_changes = None
+
+    stats = Reconciler(evernote, mapped).run()
+    assert stats['mode'] == 'unchanged'
+    assert stats['calls'] == 1
+
+
+def test_incremental_scan_decision_table(mapped):
+    mapped.set_sync_cursor(10)
+    changes = [
+        (12, [note('g-same'), note('g-edited', '編集'), note('g-unmapped', '編集')], []),
+        (15, [note('g-unhashed', notebook='nb-other')], ['g-missing']),
+    ]
+    stats = Reconciler(FakeEvernote(15, changes=changes), mapped).run()
+
+    assert stats == {'mode': 'incremental', 'checked': 4, 'missing': 2, 'edited': 1,
+                     'adopted': 0, 'calls': 3}
+    assert set(mapped.get_note_mapping()) == {'g-same'}
+    assert mapped.get_sync_cursor() == 15
+
+
+def test_inactive_note_is_missing(mapped):
+    mapped.set_sync_cursor(10)
+    changes = [(11, [note('g-same', active=False)], [])]
+    stats = Reconciler(FakeEvernote(11, changes=changes), mapped).run()
+    assert stats['missing'] == 1
+    assert 'g-same' not in mapped.get_note_mapping()
+
+
+@pytest.mark.parametrize('cursor, full', [(20, False), (10, True)])
+def test_full_scan_when_cursor_is_ahead_or_forced(mapped, cursor, full):
+    mapped.set_sync_cursor(cursor)
+    stats = Reconciler(FakeEvernote(15, FULL_NOTES), mapped).run(full=full)
+    assert stats['mode'] == 'full'
+    assert mapped.get_sync_cursor() == 15
+
+
+def test_empty_notebook_aborts_instead_of_unlinking_everything(mapped):
+    with pytest.raises(RuntimeError):
+        Reconciler(FakeEvernote(10), mapped).run()
+    assert len(mapped.get_note_mapping()) == 4
+    assert mapped.get_sync_cursor() is None
@@ -0,0 +1,49 @@
+"""圧縮されたリクエスト本文の展開とサイズ上限"""
+import gzip
+import zlib
+
+import pytest
+
+from request_codec import UnsupportedEncodingError, decode_body
+
+BODY = b'{"title": "t", "messages": []}' * 100
+
+
+@pytest.mark.parametrize('encoding, raw', [
+    (None, BODY),
+    ('identity', BODY),
+    ('gzip', gzip.compress(BODY)),
+    (' GZIP ', gzip.compress(BODY)),
+    ('x-gzip', gzip.compress(BODY)),
+    ('deflate', zlib.compress(BODY)),
+])
+def test_decodes_supported_encodings(encoding, raw):
+    assert decode_body(raw, encoding) == BODY
+
+
+def test_rejects_unsupported_encoding():
+    with pytest.raises(UnsupportedEncodingError):
+        decode_body(BODY, 'br')
+
+
+def test_rejects_corrupt_body():
+    with pytest.raises(ValueError):
+        decode_body(b'not gzip', 'gzip')
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress),
+])
+@pytest.mark.parametrize('size', [1, 1000, 4096, 65536])
+def test_size_limit_is_exact(encoding, compress, size):
+    body = b'a' * size
+    assert decode_body(compress(body), encoding, max_bytes=size) == body
+    with pytest.raises(ValueError):
+        decode_body(compress(body + b'a'), encoding, max_bytes=size)
+
+
+def test_rejects_compression_bomb():
+    bomb = gzip.compress(b'\0' * (8 * 1024 * 1024))
+    with pytest.raises(ValueError):
+        decode_body(bomb, 'gzip', max_bytes=1024 * 1024)
@@ -0,0 +1,116 @@
+"""同一キーの処理をまとめるシングルフライト"""
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_first_call_runs_without_debounce():
+    flights = SingleFlight(debounce=1.0)
+    start = time.monotonic()
+    assert flights.run('c1', 'v1', lambda v: v.upper()) == ('V1', False)
+    assert time.monotonic() - start < 0.5
+
+
+def test_call_right_after_finish_waits_for_debounce():
+    flights = SingleFlight(debounce=0.2)
+    flights.run('c1', 'v1', lambda v: v)
+    start = time.monotonic()
+    flights.run('c1', 'v2', lambda v: v)
+    assert time.monotonic() - start >= 0.15
+    # 別のキーは待たない
+    start = time.monotonic()
+    flights.run('c2', 'v1', lambda v: v)
+    assert time.monotonic() - start < 0.15
+
+
+def run_during_flight(flights, calls, payloads, replace=True):
+    """実行役の処理中に payloads を順に合流させ、各リクエストの結果を返す"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_fn(v):
+        calls.append(v)
+        started.set()
+        release.wait(5)
+        return v
+
+    def follower_fn(v):
+        calls.append(v)
+        return v
+
+    results = {}
+
+    def request(name, payload, fn, replace=True):
+        results[name] = flights.run('c1', payload, fn, replace=replace)
+
+    leader = threading.Thread(target=request, args=('leader', 'v1', leader_fn))
+    leader.start()
+    assert started.wait(5)
+    followers = [
+        threading.Thread(target=request, args=(p, p, follower_fn, replace)) for p in payloads
+    ]
+    for follower in followers:
+        follower.start()
+    # 合流したリクエストが待機に入るまで待つ
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    return results
+
+
+def test_requests_during_flight_rerun_once_with_latest():
+    flights = SingleFlight(debounce=0.0)
+    calls = []
+    results = run_during_flight(flights, calls, ['v2'])
+    assert calls == ['v1', 'v2']
+    assert results['leader'] == ('v2', False)
+    assert results['v2'] == ('v2', True)
+
+
+def test_join_without_replace_does_not_rerun():
+    flights = SingleFlight(debounce=0.0)
+    calls = []
+    results = run_during_flight(flights, calls, ['retry'], replace=False)
+    assert calls == ['v1']
+    assert results['retry'] == ('v1', True)
+
+
+def test_error_is_raised_to_joined_requests():
+    flights = SingleFlight(debounce=0.0)
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing(v):
+        started.set()
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    def request():
+        try:
+            flights.run('c1', 'v', failing, replace=False)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request)]
+    threads[0].start()
+    assert started.wait(5)
+    threads.append(threading.Thread(target=request))
+    threads[1].start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 2
+    assert 'c1' not in flights._flights
+
+
+def test_key_is_released_after_error():
+    flights = SingleFlight(debounce=0.0)
+    with pytest.raises(ValueError):
+        flights.run('c1', 'v', lambda v: int(v))
+    assert flights.run('c1', '1', lambda v: int(v)) == (1, False)
@@ -0,0 +1,211 @@
+"""
+アップロード優先度モジュール
+Evernoteへのアップロードを優先度別の待ち行列（レーン）で順番に実行する
+
+- interactive: 拡張機能からの手動保存・応答完了時の保存
+- scheduled: 拡張機能の定期同期・送信待ちの再試行
+- bulk: 拡張機能からのバックフィル（/api/backfill）
+
+空きがあれば優先度の高いレーンから実行する。枠の1つは interactive 用に残し、
+バックフィルが続いていても手動保存が後ろで待たないようにする。低いレーンも
+一定時間以上待った要求は優先度に関わらず次に実行する（飢餓防止）。
+レート制限に達した場合は全レーンで共有し、解除まで scheduled / bulk を止める。
+bulk_import.py / export_watcher.py は別プロセスでEvernoteに書き込むため、ここでは制御しない。
+
+枠の数（同時アップロード数）は AIMDLimiter が応答時間とエラーから自動で調整する。
+"""
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+from adaptive_concurrency import AIMDLimiter
+from evernote_sync import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = 'interactive'
+LANE_SCHEDULED = 'scheduled'
+LANE_BULK = 'bulk'
+
+# 優先度の高い順
+LANES = (LANE_INTERACTIVE, LANE_SCHEDULED, LANE_BULK)
+
+
+class _Waiter:
+    """実行枠を待っている要求"""
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()
+        self.error = None
+
+
+class UploadScheduler:
+    """優先度別レーンで実行枠（同時アップロード数）を割り当てる"""
+
+    def __init__(
+        self,
+        limiter: Optional[AIMDLimiter] = None,
+        starvation_seconds: float = 30.0,
+        reserved_interactive: int = 1
+    ):
+        """
+        Args:
+            limiter: 同時アップロード数（全レーン共通の枠の数）を調整する
+            starvation_seconds: これ以上待った要求は優先度に関わらず次に実行する
+            reserved_interactive: interactive 以外が使えない枠の数（枠が1つの場合は確保しない）
+        """
+        self.limiter = limiter or AIMDLimiter()
+        self.slots = self.limiter.limit
+        self.starvation_seconds = starvation_seconds
+        self.reserved_interactive = reserved_interactive
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._paused_until = 0.0
+
+    def set_max_slots(self, max_slots: int) -> None:
+        """
+        自動調整する同時アップロード数の最大値を変更
+
+        Args:
+            max_slots: 新しい最大値
+        """
+        self._resize(self.limiter.set_bounds(self.limiter.min_limit, max_slots))
+
+    def _resize(self, slots: int) -> None:
+        """枠の数を変更（実行中のアップロードは中断しない）"""
+        with self._lock:
+            if slots == self.slots:
+                return
+            self.slots = slots
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane: str) -> Iterator[None]:
+        """
+        実行枠を確保してアップロードする
+
+        with scheduler.slot(LANE_BULK):
+            evernote.create_note(...)
+
+        ブロック内でレート制限に達した場合は、解除まで scheduled / bulk を止める。
+        ブロックの所要時間・タイムアウト・レート制限から同時アップロード数を調整する。
+
+        Args:
+            lane: レーン（LANES のいずれか）
+
+        Raises:
+            RateLimitError: レート制限で停止中（interactive 以外）の場合
+        """
+        self._acquire(lane)
+        started = time.monotonic()
+        try:
+            yield
+        except RateLimitError as e:
+            self.pause(e.duration)
+            self._resize(self.limiter.on_congestion('レート制限'))
+            raise
+        except Exception as e:
+            if _is_timeout(e):
+                self._resize(self.limiter.on_congestion('タイムアウト'))
+            raise
+        else:
+            with self._lock:
+                saturated = (sum(self._running.values()) >= self.slots
+                             or any(self._queues.values()))
+            self._resize(self.limiter.on_success(time.monotonic() - started, saturated))
+        finally:
+            with self._lock:
+                self._running[lane] -= 1
+                self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        """
+        レート制限の解除まで scheduled / bulk の実行を止める
+
+        Args:
+            seconds: 停止する秒数
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # 待っている scheduled / bulk の要求も解除まで待たせずに返す
+            for lane in (LANE_SCHEDULED, LANE_BULK):
+                queue = self._queues[lane]
+                while queue:
+                    waiter = queue.popleft()
+                    waiter.error = RateLimitError(int(seconds) + 1)
+                    waiter.granted.set()
+
+    def snapshot(self) -> Dict:
+        """ヘルスチェック用の状態"""
+        with self._lock:
+            paused = max(0.0, self._paused_until - time.monotonic())
+            return {
+                'slots': self.slots,
+                'max_slots': self.limiter.max_limit,
+                'running': dict(self._running),
+                'waiting': {lane: len(queue) for lane, queue in self._queues.items()},
+                'paused_for': round(paused, 1),
+            }
+
+    def _acquire(self, lane: str) -> None:
+        """実行枠が割り当てられるまで待つ"""
+        waiter = _Waiter(lane)
+        with self._lock:
+            if lane != LANE_INTERACTIVE:
+                remaining = self._paused_until - time.monotonic()
+                if remaining > 0:
+                    # 待たせずに返し、呼び出し元（拡張機能・再試行）に待機時間を伝える
+                    raise RateLimitError(int(remaining) + 1)
+            self._queues[lane].append(waiter)
+            self._dispatch()
+        waiter.granted.wait()
+        if waiter.error is not None:
+            raise waiter.error
+
+    def _dispatch(self) -> None:
+        """空いている枠を待っている要求に割り当てる（ロック内で呼ぶ）"""
+        while True:
+            running = sum(self._running.values())
+            if running >= self.slots:
+                return
+            # interactive 以外は予約枠を残して実行する
+            shared = self.slots - min(self.reserved_interactive, self.slots - 1)
+            waiter = self._next_waiter(allow_lower=running < shared)
+            if waiter is None:
+                return
+            self._queues[waiter.lane].popleft()
+            self._running[waiter.lane] += 1
+            waiter.granted.set()
+
+    def _next_waiter(self, allow_lower: bool):
+        """次に実行する要求（ロック内で呼ぶ）"""
+        candidates = [
+            queue[0] for lane, queue in self._queues.items()
+            if queue and (lane == LANE_INTERACTIVE or allow_lower)
+        ]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        starving = [
+            waiter for waiter in candidates
+            if now - waiter.enqueued_at >= self.starvation_seconds
+        ]
+        if starving:
+            return min(starving, key=lambda waiter: waiter.enqueued_at)
+        return min(candidates, key=lambda waiter: LANES.index(waiter.lane))
+
+
+def _is_timeout(error: Optional[BaseException]) -> bool:
+    """例外（またはその原因）が通信タイムアウトかどうか"""
+    while error is not None:
+        if isinstance(error, (socket.timeout, TimeoutError)):
+            return True
+        error = error.__cause__
+    return False